@@ -36,7 +36,7 @@ apt install -y python3 python3-pip python3-dev git
 # Install Python packages
 echo ""
 echo "Step 3: Installing Python packages..."
-pip3 install flask evdev --break-system-packages
+pip3 install flask flask-sock gunicorn evdev --break-system-packages
 
 # Copy files if not already in home directory
 if [ "$PWD" != "$INSTALL_DIR" ]; then
@@ -86,6 +86,7 @@ echo "Step 8: Installing systemd services..."
 # Update service file paths
 sed -i "s|/home/pi/joystick_converter|$INSTALL_DIR|g" "$INSTALL_DIR/systemd/joystick-converter.service"
 sed -i "s|/home/pi/joystick_converter|$INSTALL_DIR|g" "$INSTALL_DIR/systemd/joystick-web.service"
+sed -i "s|/home/pi/joystick_converter|$INSTALL_DIR|g" "$INSTALL_DIR/systemd/joystick-supervisor.service"
 
 # Update user in web service
 sed -i "s|User=pi|User=$ACTUAL_USER|g" "$INSTALL_DIR/systemd/joystick-web.service"
@@ -93,6 +94,7 @@ sed -i "s|User=pi|User=$ACTUAL_USER|g" "$INSTALL_DIR/systemd/joystick-web.servic
 # Copy service files
 cp "$INSTALL_DIR/systemd/joystick-converter.service" /etc/systemd/system/
 cp "$INSTALL_DIR/systemd/joystick-web.service" /etc/systemd/system/
+cp "$INSTALL_DIR/systemd/joystick-supervisor.service" /etc/systemd/system/
 
 # Reload systemd
 systemctl daemon-reload
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Axis Filter - Smoothing of noisy analog axis values
+"""
+
+import math
+from typing import Any, Dict, Optional
+
+# Smallest time step used by the One Euro filter, for events with the same timestamp
+MIN_TIME_STEP = 0.0005
+
+
+class EmaFilter:
+    """
+    Exponential moving average
+
+    Each new value moves the output the fraction alpha of the way towards
+    it: 1 passes values through, smaller values smooth more and lag more.
+    """
+
+    __slots__ = ('alpha', 'state', 'time', 'interval', 'raw', 'output')
+
+    def __init__(self, alpha: float = 0.5):
+        """
+        Initialize the filter
+
+        Args:
+            alpha: Smoothing factor, 0 < alpha <= 1
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError(f"alpha must be in (0, 1], not {alpha}")
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        """Forget the history; the next value passes through unchanged"""
+        self.state = 0.0
+        self.time = 0.0
+        self.interval = MIN_TIME_STEP
+        self.raw: Optional[int] = None
+        self.output: Optional[int] = None
+
+    def update(self, value: int, now: float) -> Optional[int]:
+        """
+        Filter one axis value
+
+        Args:
+            value: Raw axis value
+            now: Time of the value in seconds
+
+        Returns:
+            Filtered value, or None if it rounds to the previous output
+        """
+        if self.raw is None:
+            self.state = float(value)
+        else:
+            self.state += self.alpha * (value - self.state)
+            self.interval = max(now - self.time, MIN_TIME_STEP)
+        self.time = now
+        self.raw = value
+        return self._output()
+
+    def settle(self, now: float) -> Optional[int]:
+        """
+        Move on towards the last value as if the device had kept reporting it
+
+        The value is repeated once per interval between the last two real
+        values, however often this is called.
+
+        Args:
+            now: Current time in seconds
+
+        Returns:
+            Filtered value, or None if it rounds to the previous output
+        """
+        if self.raw is None or now <= self.time:
+            return None
+        alpha = 1.0 - (1.0 - self.alpha) ** ((now - self.time) / self.interval)
+        self.state += alpha * (self.raw - self.state)
+        self.time = now
+        return self._output()
+
+    def _output(self) -> Optional[int]:
+        output = round(self.state)
+        if output == self.output:
+            return None
+        self.output = output
+        return output
+
+
+class OneEuroFilter:
+    """
+    One Euro filter: a low-pass filter whose cutoff rises with the speed of the axis
+
+    A stick held still is smoothed at min_cutoff, removing jitter, while a
+    fast movement raises the cutoff by beta per unit/s of speed so it
+    follows with little lag. The speed is itself low-passed at d_cutoff.
+    (Casiez, Roussel and Vogel, "1€ Filter", CHI 2012.)
+    """
+
+    __slots__ = ('min_cutoff', 'beta', 'd_cutoff', 'state', 'speed', 'time', 'raw', 'output')
+
+    def __init__(self, min_cutoff: float = 1.0, beta: float = 0.001, d_cutoff: float = 1.0):
+        """
+        Initialize the filter
+
+        Args:
+            min_cutoff: Cutoff frequency in Hz while the axis is still
+            beta: Cutoff increase in Hz per axis unit per second of speed
+            d_cutoff: Cutoff frequency in Hz for the speed estimate
+        """
+        if min_cutoff <= 0 or d_cutoff <= 0 or beta < 0:
+            raise ValueError("min_cutoff and d_cutoff must be positive and beta must not be negative")
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        """Forget the history; the next value passes through unchanged"""
+        self.state = 0.0
+        self.speed = 0.0
+        self.time = 0.0
+        self.raw: Optional[int] = None
+        self.output: Optional[int] = None
+
+    def update(self, value: int, now: float) -> Optional[int]:
+        """
+        Filter one axis value
+
+        Args:
+            value: Raw axis value
+            now: Time of the value in seconds
+
+        Returns:
+            Filtered value, or None if it rounds to the previous output
+        """
+        if self.raw is None:
+            self.state = float(value)
+            self.speed = 0.0
+        else:
+            dt = max(now - self.time, MIN_TIME_STEP)
+            # Smoothing factor of a first order low-pass at a cutoff: 1 / (1 + tau / dt)
+            speed = (value - self.state) / dt
+            self.speed += (speed - self.speed) / (1.0 + 1.0 / (2 * math.pi * self.d_cutoff * dt))
+            cutoff = self.min_cutoff + self.beta * abs(self.speed)
+            self.state += (value - self.state) / (1.0 + 1.0 / (2 * math.pi * cutoff * dt))
+        self.time = now
+        self.raw = value
+        output = round(self.state)
+        if output == self.output:
+            return None
+        self.output = output
+        return output
+
+    def settle(self, now: float) -> Optional[int]:
+        """
+        Move on towards the last value over the time elapsed since it
+
+        Args:
+            now: Current time in seconds
+
+        Returns:
+            Filtered value, or None if it rounds to the previous output
+        """
+        if self.raw is None or now <= self.time:
+            return None
+        return self.update(self.raw, now)
+
+
+FILTER_TYPES = {
+    'ema': EmaFilter,
+    'one_euro': OneEuroFilter,
+}
+
+
+def build_filter(spec: Dict[str, Any]):
+    """
+    Create a filter from its configuration
+
+    Args:
+        spec: {"type": "ema", "alpha": 0.3} or
+              {"type": "one_euro", "min_cutoff": 1.0, "beta": 0.001, "d_cutoff": 1.0}
+
+    Returns:
+        EmaFilter or OneEuroFilter
+
+    Raises:
+        ValueError: If the type or a parameter is invalid
+    """
+    filter_type = FILTER_TYPES.get(spec.get('type'))
+    if filter_type is None:
+        raise ValueError(f"unknown filter type: {spec.get('type')}")
+    params = {name: value for name, value in spec.items() if name != 'type'}
+    try:
+        return filter_type(**params)
+    except TypeError as e:
+        raise ValueError(str(e))
@@ -0,0 +1,891 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Timing measurements for the converter's startup, event loop, mappings and web interface
+"""
+
+import gc
+import os
+import re
+import sys
+import json
+import shlex
+import shutil
+import random
+import struct
+import argparse
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from event_loop import EventLoop
+from macro_engine import MacroPlayer
+from mapping_engine import MappingEngine
+from output_handler import USBGadgetOutputHandler
+from profile_store import ProfileStore, DEFAULT_PROFILE_DB
+from turbo import TurboController
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarize timing samples
+
+    Args:
+        samples: Samples in seconds
+
+    Returns:
+        Dictionary of statistics in milliseconds
+    """
+    if not samples:
+        return {'count': 0}
+
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        'count': count,
+        'min': ordered[0] * 1000,
+        'mean': sum(ordered) / count * 1000,
+        'p50': ordered[count // 2] * 1000,
+        'p99': ordered[min(count - 1, int(count * 0.99))] * 1000,
+        'max': ordered[-1] * 1000,
+    }
+
+
+def print_summary(title: str, stats: Dict[str, float]):
+    """Print a one-line summary of timing statistics"""
+    if not stats.get('count'):
+        print(f"{title:<24} no samples")
+        return
+    print(f"{title:<24} n={stats['count']:<7} min={stats['min']:.3f}ms "
+          f"mean={stats['mean']:.3f}ms p50={stats['p50']:.3f}ms "
+          f"p99={stats['p99']:.3f}ms max={stats['max']:.3f}ms")
+
+
+class InputProbe:
+    """
+    Simulated input device feeding timestamps through a pipe
+
+    A writer sends the send time at a fixed rate; the loop reader records
+    how long each one waited before being handled. This measures how much
+    timed work delays ordinary button handling. The writer is a thread,
+    or a separate process when the measured process runs other Python
+    threads (a writer thread would wait for the same GIL as the reader).
+    """
+
+    RECORD = struct.Struct('d')
+
+    WRITER_SCRIPT = (
+        "import os, struct, sys, time\n"
+        "fd, interval = int(sys.argv[1]), float(sys.argv[2])\n"
+        "next_send = time.monotonic()\n"
+        "while True:\n"
+        "    next_send += interval\n"
+        "    time.sleep(max(0.0, next_send - time.monotonic()))\n"
+        "    os.write(fd, struct.pack('d', time.monotonic()))\n"
+    )
+
+    def __init__(self, loop: EventLoop, rate_hz: float, separate_process: bool = False,
+                 on_event: Optional[Callable[[], None]] = None):
+        self.loop = loop
+        self.interval = 1.0 / rate_hz
+        self.delays: List[float] = []
+        self.on_event = on_event
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        self._running = False
+        self._thread = None if separate_process else threading.Thread(target=self._writer, daemon=True)
+        self._process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        self.loop.add_reader(self._read_fd, self._on_readable)
+        self._running = True
+        if self._thread:
+            self._thread.start()
+        else:
+            # CLOCK_MONOTONIC is system-wide, so the timestamps compare across processes
+            self._process = subprocess.Popen(
+                [sys.executable, '-c', self.WRITER_SCRIPT, str(self._write_fd), str(self.interval)],
+                pass_fds=(self._write_fd,))
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+        else:
+            self._process.terminate()
+            self._process.wait()
+        self.loop.remove_reader(self._read_fd)
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+    def _writer(self):
+        next_send = time.monotonic()
+        while self._running:
+            next_send += self.interval
+            time.sleep(max(0.0, next_send - time.monotonic()))
+            os.write(self._write_fd, self.RECORD.pack(time.monotonic()))
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._read_fd, self.RECORD.size * 256)
+        except BlockingIOError:
+            return
+        now = time.monotonic()
+        for (sent,) in self.RECORD.iter_unpack(data[:len(data) - len(data) % self.RECORD.size]):
+            self.delays.append(now - sent)
+            if self.on_event:
+                self.on_event()
+
+
+def bench_macro_jitter(args) -> int:
+    """Measure macro step lateness with many macros playing at once"""
+    engine = MappingEngine()
+    loop = EventLoop()
+    emitted = [0]
+
+    def sink(event):
+        emitted[0] += 1
+
+    player = MacroPlayer(loop, sink)
+    lateness: List[float] = []
+    player.lateness_hook = lateness.append
+
+    macros = []
+    for i in range(args.macros):
+        mapping = {
+            'type': 'macro',
+            'tap_ms': args.tap_ms,
+            'gap_ms': args.gap_ms,
+            'steps': [{'text': 'abcdefghij'[:args.steps]}],
+        }
+        entry = engine.compile_entry(f"MACRO_{i}", mapping)
+        macros.append(entry[1])
+
+    probe = InputProbe(loop, args.input_rate) if args.input_rate > 0 else None
+    if probe:
+        probe.start()
+
+    # Stagger starts across one tap so steps of different macros interleave
+    stagger = args.tap_ms / 1000.0 / max(1, args.macros)
+    for i, macro in enumerate(macros):
+        loop.call_later(i * stagger, player.play, macro)
+    last_start = loop.time() + len(macros) * stagger
+
+    deadline = time.monotonic() + args.timeout
+    while (loop.time() <= last_start or player.active_count()) and time.monotonic() < deadline:
+        loop.run_once(timeout=10)
+
+    if probe:
+        probe.stop()
+    loop.close()
+
+    print(f"Macros: {args.macros} x {args.steps} taps "
+          f"(tap {args.tap_ms}ms, gap {args.gap_ms}ms), events emitted: {emitted[0]}")
+    print_summary("macro step lateness", summarize(lateness))
+    if probe:
+        print_summary("input handling delay", summarize(probe.delays))
+    return 0
+
+
+def bench_turbo_jitter(args) -> int:
+    """Measure turbo toggle cadence with several keys auto-firing"""
+    loop = EventLoop()
+    toggles: Dict[int, List[float]] = {}
+
+    def record(keycode, when):
+        toggles.setdefault(keycode, []).append(when)
+
+    turbo = TurboController(loop, lambda event: None)
+    turbo.toggle_hook = record
+
+    probe = InputProbe(loop, args.input_rate) if args.input_rate > 0 else None
+    if probe:
+        probe.start()
+
+    for i in range(args.buttons):
+        keycode = 0x04 + i
+        turbo.start({'type': 'keyboard', 'keycode': keycode, 'pressed': True,
+                     'modifier': 0, 'turbo': args.rate})
+
+    end = loop.time() + args.duration
+    while loop.time() < end:
+        loop.run_once(timeout=10)
+    turbo.stop_all()
+
+    if probe:
+        probe.stop()
+    loop.close()
+
+    half_period = 0.5 / min(args.rate, TurboController.MAX_RATE_HZ)
+    errors = []
+    for times in toggles.values():
+        errors.extend(abs((b - a) - half_period) for a, b in zip(times, times[1:]))
+
+    print(f"Turbo: {args.buttons} keys at {args.rate} Hz for {args.duration}s, "
+          f"toggles: {sum(len(t) for t in toggles.values())}")
+    print_summary("toggle interval error", summarize(errors))
+    if probe:
+        print_summary("input handling delay", summarize(probe.delays))
+    return 0
+
+
+def bench_combo_scaling(args) -> int:
+    """Measure per-event translation cost as chords and sequences grow"""
+    buttons = [f"BTN_{i}" for i in range(args.buttons)]
+    directions = list(MappingEngine.DIRECTION_TOKENS.values())
+    rng = random.Random(args.seed)
+
+    # Fixed event stream: button presses/releases and D-pad moves
+    stream = []
+    for _ in range(args.events):
+        if rng.random() < 0.3:
+            axis = rng.choice(list(MappingEngine.HAT_AXES))
+            stream.append((axis, rng.choice((-1, 0, 1))))
+        else:
+            button = rng.choice(buttons)
+            stream.append((button, 1))
+            stream.append((button, 0))
+
+    print(f"{'combos':>8} {'ns/event':>10}")
+    for count in args.counts:
+        engine = MappingEngine()
+        chords = []
+        sequences = []
+        for _ in range(count):
+            chords.append({'buttons': rng.sample(buttons, rng.randint(2, 3)),
+                           'type': 'keyboard', 'key': 'F1'})
+            steps = [rng.choice(directions + buttons) for _ in range(rng.randint(1, 4))]
+            sequences.append({'steps': steps + [rng.choice(buttons)],
+                              'type': 'keyboard', 'key': 'F2'})
+        engine.apply_config({
+            'mappings': {b: {'type': 'keyboard', 'key': 'A'} for b in buttons},
+            'chords': chords,
+            'sequences': sequences,
+        })
+
+        translate = engine.translate_event
+        start = time.perf_counter()
+        for event_name, value in stream:
+            translate(event_name, value)
+        elapsed = time.perf_counter() - start
+        print(f"{count:>8} {elapsed / len(stream) * 1e9:>10.0f}")
+    return 0
+
+
+# Synthetic input for mapping-throughput. A scenario builds a list of
+# batches, each a list of (event_name, value) ending in one SYN_REPORT.
+Batch = List[Tuple[str, int]]
+
+STICK_AXES = ('ABS_X', 'ABS_Y', 'ABS_RX', 'ABS_RY')
+STICK_MIN, STICK_MAX = -32768, 32767
+DEFAULT_BUTTONS = ['BTN_SOUTH', 'BTN_EAST', 'BTN_NORTH', 'BTN_WEST',
+                   'BTN_TL', 'BTN_TR', 'BTN_SELECT', 'BTN_START']
+
+
+def scenario_mash(rng: random.Random, buttons: List[str], chords: List[List[str]], count: int) -> List[Batch]:
+    """Button mashing: one or two buttons change state per report"""
+    held = set()
+    batches = []
+    for _ in range(count):
+        batch = []
+        for button in rng.sample(buttons, min(len(buttons), rng.choice((1, 1, 1, 2)))):
+            pressed = button not in held
+            (held.add if pressed else held.discard)(button)
+            batch.append((button, int(pressed)))
+        batches.append(batch)
+    return batches
+
+
+def scenario_sweep(rng: random.Random, buttons: List[str], chords: List[List[str]], count: int) -> List[Batch]:
+    """Stick sweeps: both sticks travel end to end, the D-pad turns a circle"""
+    span = STICK_MAX - STICK_MIN
+    step = span // 64
+    hat = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, 0)]
+    batches = []
+    for i in range(count):
+        # Triangle wave, the right stick a quarter period behind the left
+        batch = []
+        for axis_index, axis in enumerate(STICK_AXES):
+            phase = (i * step + axis_index * span // 2) % (2 * span)
+            batch.append((axis, STICK_MIN + (phase if phase <= span else 2 * span - phase)))
+        if i % 16 == 0:
+            x, y = hat[i // 16 % len(hat)]
+            batch += [('ABS_HAT0X', x), ('ABS_HAT0Y', y)]
+        batches.append(batch)
+    return batches
+
+
+def scenario_chords(rng: random.Random, buttons: List[str], chords: List[List[str]], count: int) -> List[Batch]:
+    """Chord storm: whole chords pressed in one report and released in the next"""
+    if not chords:
+        chords = [rng.sample(buttons, min(len(buttons), rng.randint(2, 4))) for _ in range(8)]
+    batches = []
+    for _ in range(count // 2):
+        chord = rng.choice(chords)
+        batches.append([(button, 1) for button in chord])
+        batches.append([(button, 0) for button in chord])
+    return batches
+
+
+def scenario_noise(rng: random.Random, buttons: List[str], chords: List[List[str]], count: int) -> List[Batch]:
+    """1000 Hz axis noise: every stick axis jitters around center in every report"""
+    return [[(axis, rng.randint(-64, 64)) for axis in STICK_AXES] for _ in range(count)]
+
+
+SCENARIOS = {
+    'mash': scenario_mash,
+    'sweep': scenario_sweep,
+    'chords': scenario_chords,
+    'noise': scenario_noise,
+}
+
+
+def _throughput_profiles(args) -> List[Tuple[str, Dict[str, Any]]]:
+    """Collect the configurations mapping-throughput runs against"""
+    paths = args.configs
+    if not paths:
+        paths = sorted(Path('config/examples').glob('*.json'))
+        if Path('config/mappings.json').exists():
+            paths.append(Path('config/mappings.json'))
+    profiles = []
+    for path in paths:
+        with open(path) as f:
+            profiles.append((Path(path).stem, json.load(f)))
+
+    db = Path(args.profile_db) if args.profile_db else Path('config') / DEFAULT_PROFILE_DB
+    if db.exists():
+        store = ProfileStore(str(db))
+        try:
+            for profile in store.search(limit=10000):
+                profiles.append((f"db:{profile['name']}", store.get(profile['name'])['config']))
+        finally:
+            store.close()
+    return profiles
+
+
+def _allocations(run_batch: Callable[[Batch], None], batches: List[Batch]) -> Tuple[float, float]:
+    """
+    Measure the memory a batch handler allocates, with tracemalloc
+
+    Returns:
+        (bytes allocated per batch while it runs, bytes still held afterwards per batch)
+    """
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        transient = 0
+        for batch in batches:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            run_batch(batch)
+            transient += tracemalloc.get_traced_memory()[1] - before
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return transient / len(batches), retained / len(batches)
+
+
+def bench_mapping_throughput(args) -> int:
+    """Measure translation and report building throughput on synthetic input"""
+    profiles = _throughput_profiles(args)
+    if not profiles:
+        print("No profiles found")
+        return 1
+
+    print(f"{'profile':<24} {'maps':>5} {'scenario':<8} {'events':>8} {'events/s':>10} {'ns/event':>9} "
+          f"{'alloc B/ev':>10} {'kept B/ev':>9}" + (f" {'cpu %':>6}" if args.rate else ''))
+    for label, config in profiles:
+        engine = MappingEngine(compiled_cache=False)
+        engine.apply_config(config)
+        size = (len(config.get('mappings', {})) + len(config.get('chords', [])) + len(config.get('sequences', []))
+                + sum(len(layer.get('mappings', {})) for layer in config.get('layers', {}).values()))
+        buttons = [name for name in engine.get_input_events() if name.startswith('BTN_')] or DEFAULT_BUTTONS
+        chords = [chord['buttons'] for chord in config.get('chords', []) if chord.get('buttons')]
+
+        # Reports go to /dev/null, so the write system call is included
+        output = USBGadgetOutputHandler('/dev/null')
+        if not output.connect():
+            return 1
+        translate = engine.translate_event
+        process = output.process_output_event
+
+        def run_batch(batch: Batch):
+            output.begin_frame()
+            for event_name, value in batch:
+                event = translate(event_name, value)
+                # Macros play out over time on the event loop, not measured here
+                if event is not None and event['type'] != 'macro':
+                    process(event)
+            output.end_frame()
+
+        for name in args.scenarios:
+            rng = random.Random(args.seed)
+            batches = SCENARIOS[name](rng, buttons, chords, args.batches)
+            events = sum(len(batch) for batch in batches)
+
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            if args.rate:
+                interval = 1.0 / args.rate
+                for i, batch in enumerate(batches):
+                    delay = start + i * interval - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    run_batch(batch)
+            else:
+                for batch in batches:
+                    run_batch(batch)
+            elapsed = time.perf_counter() - start
+            cpu = time.thread_time() - cpu_start
+            engine.release_all_held()
+            output.release_all()
+
+            allocated, retained = _allocations(run_batch, batches[:args.alloc_batches])
+            engine.release_all_held()
+            output.release_all()
+            per_event = events / len(batches)
+
+            line = (f"{label[:24]:<24} {size:>5} {name:<8} {events:>8} {events / elapsed:>10.0f} "
+                    f"{cpu / events * 1e9:>9.0f} {allocated / per_event:>10.1f} {retained / per_event:>9.2f}")
+            if args.rate:
+                line += f" {cpu / elapsed * 100:>6.1f}"
+            print(line)
+        output.disconnect()
+    return 0
+
+
+# Steady-state resident memory the converter must stay within (memory-budget)
+RSS_BUDGET_MB = 48
+RSS_GROWTH_MB = 2
+
+
+def synthetic_profile(rng: random.Random, buttons: int = 16, layers: int = 8,
+                      chords: int = 200, sequences: int = 500) -> Dict[str, Any]:
+    """Build a large random configuration: every button mapped on every layer, many chords and sequences"""
+    keys = list(MappingEngine.KEY_MAP)
+    names = [f"BTN_{i}" for i in range(buttons)]
+    return {
+        'device_name': 'Synthetic Gamepad',
+        'mappings': {name: {'type': 'keyboard', 'key': rng.choice(keys), 'description': f"Action {name}"}
+                     for name in names},
+        'layers': {f"layer{i}": {'mappings': {name: {'type': 'keyboard', 'key': rng.choice(keys)} for name in names}}
+                   for i in range(layers)},
+        'chords': [{'buttons': rng.sample(names, 2), 'type': 'keyboard', 'key': rng.choice(keys)}
+                   for _ in range(chords)],
+        'sequences': [{'steps': [rng.choice(names) for _ in range(4)], 'type': 'keyboard', 'key': rng.choice(keys)}
+                      for _ in range(sequences)],
+    }
+
+
+def bench_memory_budget(args) -> int:
+    """Check the converter's steady-state resident memory against a budget"""
+    # Imported here: only this benchmark needs the converter
+    from main import JoystickConverter
+    from memory_report import deep_size, process_memory
+    from replay import setup_replay
+
+    workdir = Path(tempfile.mkdtemp(prefix='memory-budget-'))
+    config = workdir / 'mappings.json'
+    shutil.copy(args.config, config)
+    converter = JoystickConverter(str(config), watch_config=False, control_socket=None, state_file=None,
+                                  profile_db=str(workdir / DEFAULT_PROFILE_DB), stall_threshold=0,
+                                  notify_systemd=False)
+    try:
+        if not setup_replay(converter, '/dev/null', False):
+            return 1
+
+        rng = random.Random(args.seed)
+        names = []
+        for i in range(args.profiles):
+            names.append(f"synthetic-{i}")
+            converter.profile_store.save(names[-1], synthetic_profile(rng))
+        buttons = [f"BTN_{i}" for i in range(16)]
+        streams = [SCENARIOS[name](rng, buttons, [], args.batches) for name in SCENARIOS]
+
+        def run_round(index: int):
+            # Switch profile, then play one scenario through it as device reads would
+            converter.control_server.execute({'cmd': 'activate_profile', 'name': names[index % len(names)]})
+            for batch in streams[index % len(streams)]:
+                converter.begin_frame()
+                for event_name, value in batch:
+                    converter.on_input_event(event_name, value)
+                converter.end_frame()
+                converter.loop.run_once(0)
+
+        for index in range(args.warmup):
+            run_round(index)
+        gc.collect()
+        baseline = process_memory()['rss']
+        for index in range(args.warmup, args.warmup + args.rounds):
+            run_round(index)
+        gc.collect()
+        memory = process_memory()
+    finally:
+        converter.macro_player.cancel_all()
+        converter.turbo.stop_all()
+        if converter.output_handler:
+            converter.output_handler.disconnect()
+        converter.profile_store.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    mb = 1024 * 1024
+    cache = converter.profile_cache.stats()
+    print(f"{args.profiles} profiles, {args.rounds} profile switches after {args.warmup} warmup rounds, "
+          f"{args.batches} reports each")
+    print(f"  profile cache: {cache['profiles']} profiles, {cache['bytes'] / mb:.2f} of {cache['max_bytes'] / mb:.2f} MB")
+    for name, structure in converter.mapping_engine.memory_structures().items():
+        print(f"  {name}: {deep_size(structure)[0] / 1024:.0f} KB")
+    growth = memory['rss'] - baseline
+    print(f"  RSS {memory['rss'] / mb:.1f} MB (peak {memory['rss_peak'] / mb:.1f} MB), "
+          f"{growth / mb:+.2f} MB since warmup")
+
+    failed = False
+    if args.budget_mb and memory['rss'] > args.budget_mb * mb:
+        print(f"FAIL: steady-state RSS {memory['rss'] / mb:.1f} MB exceeds budget of {args.budget_mb:.1f} MB")
+        failed = True
+    if args.max_growth_mb and growth > args.max_growth_mb * mb:
+        print(f"FAIL: RSS grew {growth / mb:.2f} MB after warmup, more than {args.max_growth_mb:.2f} MB")
+        failed = True
+    return 1 if failed else 0
+
+
+def _stream_client(url: str, stop: threading.Event, received: List[int]):
+    """Keep an event stream open, counting messages until stopped"""
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            while not stop.is_set():
+                line = response.readline()
+                if not line:
+                    break
+                if line.startswith(b'data:'):
+                    received[0] += 1
+    except OSError:
+        pass
+
+
+def _api_client(base: str, stop: threading.Event, latencies: Dict[str, List[float]], writes: bool):
+    """Issue API requests back to back, recording their latency"""
+    requests = [('GET', '/api/mappings', None), ('GET', '/api/device', None)]
+    if writes:
+        body = json.dumps({'type': 'keyboard', 'key': 'F12', 'description': 'load test'}).encode()
+        requests += [('PUT', '/api/mappings/BENCH_LOAD', body),
+                     ('DELETE', '/api/mappings/BENCH_LOAD', None)]
+
+    while not stop.is_set():
+        for method, path, body in requests:
+            request = urllib.request.Request(base + path, data=body, method=method,
+                                             headers={'Content-Type': 'application/json'})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+            except OSError:
+                continue
+            latencies.setdefault(f"{method} {path}", []).append(time.perf_counter() - start)
+
+
+def bench_web_load(args) -> int:
+    """Measure web API latency with and without open event streams"""
+    base = args.url.rstrip('/')
+    stream_url = f"{base}/api/input/events?{args.stream_query}"
+
+    for streams in (0, args.streams):
+        stop = threading.Event()
+        received = [0]
+        latencies: Dict[str, List[float]] = {}
+        threads = [threading.Thread(target=_stream_client, args=(stream_url, stop, received), daemon=True)
+                   for _ in range(streams)]
+        threads += [threading.Thread(target=_api_client, args=(base, stop, latencies, args.writes), daemon=True)
+                    for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+
+        print(f"{streams} event streams, {args.clients} API clients, {args.duration}s "
+              f"(stream messages received: {received[0]})")
+        for name in sorted(latencies):
+            print_summary(f"  {name}", summarize(latencies[name]))
+    return 0
+
+
+def bench_unified_latency(args) -> int:
+    """Measure input handling delay with the web interface served from the converter process"""
+    # Imported here: only this benchmark needs the converter and Flask
+    from main import JoystickConverter
+    import web_server
+
+    workdir = Path(tempfile.mkdtemp(prefix='unified-latency-'))
+    config = workdir / 'mappings.json'
+    shutil.copy(args.config, config)
+    converter = JoystickConverter(str(config), enable_output=False, watch_config=False,
+                                  control_socket=None, state_file=None,
+                                  web_address=('127.0.0.1', args.port))
+    if not converter.mapping_engine.load_config():
+        print(f"Could not load {args.config}")
+        return 1
+    converter.start_web()
+    # Feed the web interface's event streams like a connected controller
+    converter.control_server.subscribe_local(['input'], web_server.queue_daemon_event)
+
+    axis_value = [0]
+
+    def handle_event():
+        # Same per-event work as a real axis event: translate, then stream
+        axis_value[0] = (axis_value[0] + 1) % 256
+        converter.on_input_event('ABS_X', axis_value[0])
+        if converter.input_handler.monitor_callback:
+            converter.input_handler.monitor_callback('ABS_X', axis_value[0])
+
+    probe = InputProbe(converter.loop, args.input_rate, separate_process=True, on_event=handle_event)
+    probe.start()
+
+    def run_for(seconds: float):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            converter.loop.run_once(timeout=10)
+
+    load_command = [sys.executable, str(Path(__file__)), 'web-load',
+                    '--url', f"http://127.0.0.1:{args.port}", '--streams', str(args.streams),
+                    '--clients', str(args.clients), '--duration', str(args.duration / 2)]
+    print(f"Input at {args.input_rate:.0f} Hz, web load: {args.streams} event streams, "
+          f"{args.clients} API clients")
+    try:
+        run_for(0.5)  # Let the server thread settle
+        for interval in args.switch_intervals:
+            sys.setswitchinterval(interval / 1000)
+            probe.delays.clear()
+            run_for(args.duration)
+            print_summary(f"switch interval {interval} ms, web idle", summarize(probe.delays))
+
+            probe.delays.clear()
+            load = subprocess.Popen(load_command, stdout=subprocess.PIPE, text=True)
+            while load.poll() is None:
+                run_for(0.1)
+            print_summary(f"switch interval {interval} ms, web loaded", summarize(probe.delays))
+            if args.verbose:
+                print(load.stdout.read(), end='')
+    finally:
+        probe.stop()
+        converter.web_server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+# Modules the converter daemon must not load at startup (see bench_import_time)
+DAEMON_LAZY_IMPORTS = ['asyncio', 'sqlite3', 'tempfile', 'ctypes.util', 'flask', 'urllib.request']
+
+
+def import_profile(module: str) -> Dict[str, float]:
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Args:
+        module: Module to import from the src directory
+
+    Returns:
+        Cumulative import time in seconds of every module that was loaded
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=str(Path(__file__).parent), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def bench_import_time(args) -> int:
+    """Measure a module's import time and check it against a budget"""
+    import_profile(args.module)  # Compile bytecode first
+    totals = []
+    for _ in range(args.runs):
+        times = import_profile(args.module)
+        totals.append(times[args.module])
+
+    stats = summarize(totals)
+    print_summary(f"import {args.module}", stats)
+    print("Slowest imports (last run):")
+    for name, seconds in sorted(times.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    failed = False
+    forbidden = args.forbid if args.forbid is not None else (DAEMON_LAZY_IMPORTS if args.module == 'main' else [])
+    loaded = [name for name in forbidden if name in times]
+    if loaded:
+        print(f"FAIL: imported at startup but should be lazy: {', '.join(loaded)}")
+        failed = True
+    if args.budget_ms and stats['p50'] > args.budget_ms:
+        print(f"FAIL: median import time {stats['p50']:.1f} ms exceeds budget of {args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+def bench_cold_start(args) -> int:
+    """Measure the time from launching the converter until it is ready for input"""
+    config = Path(args.config)
+    cache = config.with_name(f".{config.name}.compiled")
+    command = [sys.executable, str(Path(__file__).parent / 'main.py'), str(config)]
+    command += shlex.split(args.daemon_args)
+    ready_pattern = re.compile(r'\bReady\b')
+    load_pattern = re.compile(r'Loaded configuration .*\((?:compiled cache|compiled), ([0-9.]+) ms\)')
+
+    # First without the compiled config cache, then with the cache the first phase left behind
+    for phase, use_cache in (('compile', False), ('compiled cache', True)):
+        ready: List[float] = []
+        loads: List[float] = []
+        for _ in range(args.runs):
+            if not use_cache and cache.exists():
+                cache.unlink()
+            start = time.perf_counter()
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE, text=True)
+            output = []
+            try:
+                for line in process.stderr:
+                    output.append(line)
+                    match = load_pattern.search(line)
+                    if match:
+                        loads.append(float(match.group(1)) / 1000)
+                    if ready_pattern.search(line):
+                        ready.append(time.perf_counter() - start)
+                        break
+                else:
+                    print("Converter exited before it was ready:")
+                    print(''.join(output[-10:]), end='')
+                    return 1
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+        print_summary(f"{phase}: ready", summarize(ready))
+        print_summary("  config load", summarize(loads))
+    return 0
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Joystick Converter benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    macro = subparsers.add_parser('macro-jitter', help='Macro scheduler timing jitter')
+    macro.add_argument('--macros', type=int, default=32, help='Concurrent macros')
+    macro.add_argument('--steps', type=int, default=10, help='Taps per macro (max 10)')
+    macro.add_argument('--tap-ms', type=int, default=20, help='Key hold time per tap')
+    macro.add_argument('--gap-ms', type=int, default=20, help='Gap between taps')
+    macro.add_argument('--input-rate', type=float, default=1000,
+                       help='Simulated input events per second (0 = none)')
+    macro.add_argument('--timeout', type=float, default=30, help='Give up after N seconds')
+    macro.set_defaults(func=bench_macro_jitter)
+
+    turbo = subparsers.add_parser('turbo-jitter', help='Turbo autofire cadence jitter')
+    turbo.add_argument('--buttons', type=int, default=4, help='Keys auto-firing at once')
+    turbo.add_argument('--rate', type=float, default=30, help='Autofire rate in Hz')
+    turbo.add_argument('--duration', type=float, default=5, help='Seconds to run')
+    turbo.add_argument('--input-rate', type=float, default=1000,
+                       help='Simulated input events per second (0 = none)')
+    turbo.set_defaults(func=bench_turbo_jitter)
+
+    combo = subparsers.add_parser('combo-scaling', help='Chord/sequence cost vs. count')
+    combo.add_argument('--counts', type=int, nargs='+', default=[0, 10, 100, 1000],
+                       help='Numbers of chords and sequences to configure')
+    combo.add_argument('--buttons', type=int, default=12, help='Distinct buttons')
+    combo.add_argument('--events', type=int, default=100000, help='Input events per run')
+    combo.add_argument('--seed', type=int, default=1, help='Random seed')
+    combo.set_defaults(func=bench_combo_scaling)
+
+    throughput = subparsers.add_parser('mapping-throughput',
+                                       help='Translation and report building cost per profile on synthetic input')
+    throughput.add_argument('configs', nargs='*',
+                            help='Configuration files (default: config/examples/*.json and config/mappings.json)')
+    throughput.add_argument('--profile-db', default=None,
+                            help=f'Also run every profile in this library (default: config/{DEFAULT_PROFILE_DB} if present)')
+    throughput.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                            help='Synthetic input to generate (default: all)')
+    throughput.add_argument('--batches', type=int, default=20000, help='Input reports per scenario')
+    throughput.add_argument('--rate', type=float, default=0,
+                            help='Reports per second, e.g. 1000 for 1 kHz polling (0 = as fast as possible)')
+    throughput.add_argument('--alloc-batches', type=int, default=2000,
+                            help='Reports replayed under tracemalloc to measure allocations')
+    throughput.add_argument('--seed', type=int, default=1, help='Random seed')
+    throughput.set_defaults(func=bench_mapping_throughput)
+
+    memory = subparsers.add_parser('memory-budget',
+                                   help='Steady-state RSS with a large profile library, with a budget')
+    memory.add_argument('--config', default='config/mappings.json', help='Configuration to start with')
+    memory.add_argument('--profiles', type=int, default=32, help='Synthetic profiles in the library')
+    memory.add_argument('--warmup', type=int, default=64, help='Profile switches before the baseline')
+    memory.add_argument('--rounds', type=int, default=256, help='Profile switches measured')
+    memory.add_argument('--batches', type=int, default=200, help='Input reports after each switch')
+    memory.add_argument('--budget-mb', type=float, default=RSS_BUDGET_MB,
+                        help='Fail if the RSS exceeds this (0 = no budget, default: %(default)s)')
+    memory.add_argument('--max-growth-mb', type=float, default=RSS_GROWTH_MB,
+                        help='Fail if the RSS grows more than this after warmup (0 = no limit, default: %(default)s)')
+    memory.add_argument('--seed', type=int, default=1, help='Random seed')
+    memory.set_defaults(func=bench_memory_budget)
+
+    web = subparsers.add_parser('web-load', help='Web API latency under concurrent event streams')
+    web.add_argument('--url', default='http://127.0.0.1:8080', help='Web interface base URL')
+    web.add_argument('--streams', type=int, default=20, help='Concurrent SSE clients')
+    web.add_argument('--clients', type=int, default=4, help='Concurrent API clients')
+    web.add_argument('--duration', type=float, default=10, help='Seconds per phase')
+    web.add_argument('--stream-query', default='', help='Query string for the event streams')
+    web.add_argument('--writes', action='store_true',
+                     help='Also PUT/DELETE a scratch mapping (changes the config file)')
+    web.set_defaults(func=bench_web_load)
+
+    unified = subparsers.add_parser('unified-latency',
+                                    help='Input delay with the web interface in the converter process')
+    unified.add_argument('--config', default='config/mappings.json', help='Configuration to load')
+    unified.add_argument('--port', type=int, default=18080, help='Port for the in-process web interface')
+    unified.add_argument('--input-rate', type=float, default=1000, help='Simulated input events per second')
+    unified.add_argument('--streams', type=int, default=20, help='Concurrent SSE clients')
+    unified.add_argument('--clients', type=int, default=4, help='Concurrent API clients')
+    unified.add_argument('--duration', type=float, default=10, help='Seconds per phase')
+    unified.add_argument('--switch-intervals', type=float, nargs='+',
+                         default=[1.0, 5.0],
+                         help='GIL switch intervals to compare, in ms (default: the unified '
+                              'mode setting and Python\'s default)')
+    unified.add_argument('--verbose', action='store_true', help='Print the web-load results too')
+    unified.set_defaults(func=bench_unified_latency)
+
+    cold = subparsers.add_parser('cold-start', help='Time from launching the converter until ready')
+    cold.add_argument('--config', default='config/mappings.json', help='Configuration file to start with')
+    cold.add_argument('--runs', type=int, default=5, help='Launches per phase')
+    cold.add_argument('--daemon-args', default='--no-control --no-state-file',
+                      help='Extra converter arguments (default: %(default)s)')
+    cold.set_defaults(func=bench_cold_start)
+
+    imports = subparsers.add_parser('import-time', help='Module import time (-X importtime) with a budget')
+    imports.add_argument('--module', default='main', help='Module to import (default: the converter daemon)')
+    imports.add_argument('--runs', type=int, default=10, help='Fresh interpreters to time')
+    imports.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    imports.add_argument('--budget-ms', type=float, default=0,
+                         help='Fail if the median import time exceeds this (0 = no budget)')
+    imports.add_argument('--forbid', nargs='*', default=None,
+                         help='Fail if any of these modules is imported '
+                              f'(default for main: {" ".join(DAEMON_LAZY_IMPORTS)})')
+    imports.set_defaults(func=bench_import_time)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Calibration - Per-device axis center, deadzone and range measured from recorded samples
+"""
+
+import os
+import sys
+import json
+import math
+import heapq
+import time
+import select
+import logging
+import argparse
+from array import array
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CALIBRATION_FILE = 'calibration.json'
+
+# Calibrated axes report -AXIS_RANGE..AXIS_RANGE, 0 at rest
+AXIS_RANGE = 32767
+
+# Deadzone relative to the noise measured at rest, and the smallest deadzone
+# as a fraction of the axis half range (the rest position varies a little
+# from one release of the stick to the next)
+DEADZONE_MARGIN = 1.5
+MIN_DEADZONE = 0.03
+
+# Fraction of samples at each end ignored as glitches when measuring the
+# noise at rest and the range in motion
+NOISE_TRIM = 0.005
+RANGE_TRIM = 0.001
+
+# Digital axes are not calibrated
+SKIPPED_AXES = ('ABS_HAT',)
+
+
+def device_key(uniq: Optional[str], phys: Optional[str]) -> Optional[str]:
+    """
+    Get the key a device's calibration is stored under
+
+    Args:
+        uniq: Device serial or Bluetooth address (often empty for USB pads)
+        phys: Physical path, i.e. the port the device is plugged into
+
+    Returns:
+        'uniq:<uniq>', or 'phys:<phys>' for devices without one, or None
+    """
+    if uniq:
+        return f"uniq:{uniq}"
+    if phys:
+        return f"phys:{phys}"
+    return None
+
+
+class AxisCalibration:
+    """
+    Maps an axis's raw values to the calibrated range
+
+    Values within the deadzone around the center become 0; the rest of
+    each side is stretched linearly to AXIS_RANGE, clamping values beyond
+    the measured range. A side the axis cannot reach (a trigger resting at
+    one end) stays 0.
+    """
+
+    __slots__ = ('center', 'deadzone', 'minimum', 'maximum', '_positive', '_negative')
+
+    def __init__(self, center: int, deadzone: int, minimum: int, maximum: int):
+        """
+        Initialize the calibration
+
+        Args:
+            center: Raw value at rest
+            deadzone: Distance from the center reported as 0
+            minimum: Lowest raw value reached
+            maximum: Highest raw value reached
+        """
+        self.center = center
+        self.deadzone = deadzone
+        self.minimum = minimum
+        self.maximum = maximum
+        span = maximum - center - deadzone
+        self._positive = AXIS_RANGE / span if span > 0 else 0.0
+        span = center - deadzone - minimum
+        self._negative = AXIS_RANGE / span if span > 0 else 0.0
+
+    @classmethod
+    def from_dict(cls, settings: Dict[str, Any]) -> 'AxisCalibration':
+        """Create a calibration from its stored form"""
+        return cls(int(settings['center']), int(settings['deadzone']),
+                   int(settings['min']), int(settings['max']))
+
+    def apply(self, value: int) -> int:
+        """
+        Calibrate one raw value
+
+        Args:
+            value: Raw axis value
+
+        Returns:
+            Value in -AXIS_RANGE..AXIS_RANGE
+        """
+        offset = value - self.center
+        if offset > self.deadzone:
+            return min(AXIS_RANGE, round((offset - self.deadzone) * self._positive))
+        if offset < -self.deadzone:
+            return max(-AXIS_RANGE, round((offset + self.deadzone) * self._negative))
+        return 0
+
+
+def _nth_value(first: List[int], second: List[int], n: int, largest: bool = False) -> int:
+    """Get the n-th (from 0) smallest or largest value of two sorted lists taken together"""
+    if largest:
+        return next(islice(heapq.merge(reversed(first), reversed(second), reverse=True), n, None))
+    return next(islice(heapq.merge(first, second), n, None))
+
+
+def compute_calibration(rest: Dict[str, array], motion: Dict[str, array]) -> Tuple[Dict[str, Dict[str, int]], List[str]]:
+    """
+    Compute each axis's center, noise, deadzone and range
+
+    The samples of each phase are sorted once: the median and the noise
+    are read off the sorted rest samples, and the trimmed ends of the
+    range off both sorted phases together, without sorting them again.
+
+    Args:
+        rest: Samples by axis name while the controller lay untouched
+        motion: Samples by axis name while every axis was moved to its limits
+
+    Returns:
+        (settings by axis name: {'center', 'noise', 'deadzone', 'min', 'max'},
+         names of the axes that were not moved and are left uncalibrated)
+    """
+    axes = {}
+    unmoved = []
+    for name, samples in rest.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        count = len(ordered)
+        center = ordered[count // 2]
+        trim = int(count * NOISE_TRIM)
+        noise = max(center - ordered[trim], ordered[count - 1 - trim] - center)
+
+        moved = sorted(motion.get(name, ()))
+        trim = int((count + len(moved)) * RANGE_TRIM)
+        minimum = _nth_value(ordered, moved, trim)
+        maximum = _nth_value(ordered, moved, trim, largest=True)
+
+        reach = max(maximum - center, center - minimum)
+        deadzone = max(math.ceil(noise * DEADZONE_MARGIN), math.ceil(reach * MIN_DEADZONE))
+        if reach <= deadzone:
+            unmoved.append(name)
+            continue
+        axes[name] = {'center': center, 'noise': noise, 'deadzone': deadzone, 'min': minimum, 'max': maximum}
+    return axes, unmoved
+
+
+def record_samples(device, codes: Dict[int, str], seconds: float) -> Dict[str, array]:
+    """
+    Collect the values an input device reports for its axes
+
+    Each axis starts with its current value, so an axis that does not
+    move at all still has one sample.
+
+    Args:
+        device: Open evdev InputDevice
+        codes: Axis names by code
+        seconds: How long to record
+
+    Returns:
+        Samples by axis name
+    """
+    from evdev import ecodes
+
+    samples = {name: array('i', [device.absinfo(code).value]) for code, name in codes.items()}
+    deadline = time.monotonic() + seconds
+    while True:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        if not select.select([device.fd], [], [], timeout)[0]:
+            continue
+        try:
+            for event in device.read():
+                if event.type == ecodes.EV_ABS and event.code in codes:
+                    samples[codes[event.code]].append(event.value)
+        except BlockingIOError:
+            continue
+    return samples
+
+
+def calibrate_device(device_path: str, rest_seconds: float, motion_seconds: float,
+                     announce: Callable[[str], None] = lambda message: None) -> Dict[str, Any]:
+    """
+    Calibrate an input device's axes
+
+    Args:
+        device_path: Input device to calibrate
+        rest_seconds: Seconds to record with the controller untouched
+        motion_seconds: Seconds to record while every axis is moved to its limits
+        announce: Called with an instruction when each phase starts
+
+    Returns:
+        {'key', 'name', 'axes', 'unmoved', 'samples'}
+
+    Raises:
+        OSError: If the device cannot be read
+        ValueError: If the device has no axes or no way to identify it
+    """
+    import evdev
+    from evdev import ecodes
+    from input_handler import code_name
+
+    device = evdev.InputDevice(device_path)
+    try:
+        key = device_key(device.uniq, device.phys)
+        if key is None:
+            raise ValueError(f"{device.name} reports neither a serial nor a physical path")
+        codes = {}
+        for code in device.capabilities(absinfo=False).get(ecodes.EV_ABS, []):
+            name = code_name(ecodes.EV_ABS, code)
+            if not name.startswith(SKIPPED_AXES):
+                codes[code] = name
+        if not codes:
+            raise ValueError(f"{device.name} has no analog axes")
+
+        announce(f"Leave every stick and trigger of {device.name} untouched for {rest_seconds:g} s")
+        rest = record_samples(device, codes, rest_seconds)
+        announce(f"Move every stick around its full range and press every trigger fully for {motion_seconds:g} s")
+        motion = record_samples(device, codes, motion_seconds)
+        name = device.name
+    finally:
+        device.close()
+
+    axes, unmoved = compute_calibration(rest, motion)
+    return {'key': key, 'name': name, 'axes': axes, 'unmoved': unmoved,
+            'samples': sum(len(values) for values in rest.values()) + sum(len(values) for values in motion.values())}
+
+
+class CalibrationStore:
+    """
+    Axis calibrations by device, kept in a JSON file
+
+    Devices are identified by their serial (uniq) where they report one,
+    otherwise by the port they are plugged into (phys), so every unit of
+    a controller model gets its own calibration.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the store
+
+        Args:
+            path: Calibration file (created on the first save)
+        """
+        self.path = Path(path)
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Get every stored calibration by device key"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def lookup(self, uniq: Optional[str], phys: Optional[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Find the calibration of a device
+
+        Args:
+            uniq: The device's serial
+            phys: The device's physical path
+
+        Returns:
+            (device key, calibration), or None if the device was never calibrated
+        """
+        calibrations = self.load()
+        for key in (uniq and f"uniq:{uniq}", phys and f"phys:{phys}"):
+            if key and key in calibrations:
+                return key, calibrations[key]
+        return None
+
+    def save(self, key: str, name: str, axes: Dict[str, Dict[str, int]]):
+        """
+        Store a device's calibration, replacing an earlier one
+
+        Args:
+            key: device_key() of the device
+            name: Device name, for people reading the file
+            axes: Settings by axis name from compute_calibration()
+        """
+        calibrations = self.load()
+        calibrations[key] = {'name': name, 'created': time.time(), 'axes': axes}
+        self._write(calibrations)
+
+    def delete(self, key: str) -> bool:
+        """Remove a device's calibration; returns whether there was one"""
+        calibrations = self.load()
+        if calibrations.pop(key, None) is None:
+            return False
+        self._write(calibrations)
+        return True
+
+    def _write(self, calibrations: Dict[str, Dict[str, Any]]):
+        """Replace the file atomically"""
+        import tempfile  # Only needed when writing
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{self.path.name}.", suffix='.tmp', dir=self.path.parent)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(calibrations, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def format_calibration(axes: Dict[str, Dict[str, int]]) -> List[str]:
+    """Format axis calibrations as a table"""
+    lines = [f"{'Axis':<12}{'Center':>8}{'Noise':>7}{'Deadzone':>10}{'Min':>8}{'Max':>8}"]
+    for name, axis in axes.items():
+        lines.append(f"{name:<12}{axis['center']:>8}{axis['noise']:>7}{axis['deadzone']:>10}"
+                     f"{axis['min']:>8}{axis['max']:>8}")
+    return lines
+
+
+def main():
+    """Calibrate a gamepad's axes and store the result for the converter"""
+    parser = argparse.ArgumentParser(description='Measure and store gamepad axis calibration')
+    parser.add_argument('--file', default=str(Path('config') / DEFAULT_CALIBRATION_FILE),
+                        help=f'Calibration file (default: config/{DEFAULT_CALIBRATION_FILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='Record samples and store the calibration')
+    run.add_argument('--input-device', default=None, help='Input device (default: first gamepad)')
+    run.add_argument('--rest', type=float, default=2.0, help='Seconds to record at rest')
+    run.add_argument('--move', type=float, default=5.0, help='Seconds to record while moving the axes')
+    run.add_argument('--dry-run', action='store_true', help='Print the result without storing it')
+    run.add_argument('--socket', default=None, help='Converter control socket to notify (default: the standard one)')
+
+    subparsers.add_parser('list', help='List stored calibrations')
+    delete = subparsers.add_parser('delete', help='Remove a stored calibration')
+    delete.add_argument('key', help="Device key as shown by 'list'")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store = CalibrationStore(args.file)
+
+    if args.command == 'list':
+        for key, calibration in store.load().items():
+            print(f"{key}  ({calibration['name']}, {time.strftime('%Y-%m-%d %H:%M', time.localtime(calibration['created']))})")
+            print('\n'.join('  ' + line for line in format_calibration(calibration['axes'])))
+        return
+    if args.command == 'delete':
+        if not store.delete(args.key):
+            print(f"No calibration for {args.key}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    sys.path.insert(0, str(Path(__file__).parent))
+    from input_handler import JoystickInputHandler
+    device_path = args.input_device or JoystickInputHandler().find_gamepad()
+    if not device_path:
+        sys.exit(1)
+
+    def announce(message: str):
+        print(message)
+        input("Press Enter to start...")
+
+    try:
+        result = calibrate_device(device_path, args.rest, args.move, announce)
+    except (OSError, ValueError) as e:
+        print(f"Calibration failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{result['name']} ({result['key']}), {result['samples']} samples")
+    print('\n'.join(format_calibration(result['axes'])))
+    if result['unmoved']:
+        print(f"Not moved, left uncalibrated: {', '.join(result['unmoved'])}")
+    if args.dry_run or not result['axes']:
+        return
+    store.save(result['key'], result['name'], result['axes'])
+    print(f"Saved to {args.file}")
+
+    # A running converter applies it right away
+    from control_client import ControlClient, ControlError, ControlTimeout, ControlUnavailable, DEFAULT_SOCKET_PATH
+    try:
+        ControlClient(args.socket or DEFAULT_SOCKET_PATH).request('reload_calibration')
+    except (ControlUnavailable, ControlTimeout, ControlError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Config Watcher - Detects configuration file changes on the event loop
+"""
+
+import os
+import struct
+import ctypes
+import logging
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+_libc = None
+
+
+def _load_libc():
+    """Load the libc inotify functions"""
+    global _libc
+    if _libc is None:
+        # libc is already loaded into the interpreter; searching for it
+        # with ctypes.util.find_library would run ldconfig
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_init1.restype = ctypes.c_int
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_add_watch.restype = ctypes.c_int
+        _libc = libc
+    return _libc
+
+
+def _inotify_init() -> Optional[int]:
+    """
+    Create a non-blocking inotify instance
+
+    Returns:
+        inotify file descriptor, or None if inotify is unavailable
+    """
+    try:
+        fd = _load_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+    return fd if fd >= 0 else None
+
+
+def _inotify_add_watch(fd: int, path: str, mask: int) -> int:
+    """Watch a path on an inotify instance; returns the watch descriptor"""
+    wd = _load_libc().inotify_add_watch(fd, os.fsencode(path), mask)
+    if wd < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), path)
+    return wd
+
+
+class ConfigWatcher:
+    """
+    Calls a function when the configuration file changes
+
+    The file's directory is watched with inotify so edits in place,
+    atomic rename-over saves and re-creation are all seen. Bursts of
+    events are collapsed with a short settle delay. Without inotify the
+    file's modification time is polled on a loop timer instead.
+    """
+
+    SETTLE_DELAY = 0.05
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, loop, path: str, on_change: Callable[[], None]):
+        """
+        Initialize the watcher
+
+        Args:
+            loop: EventLoop to watch on
+            path: Configuration file path
+            on_change: Called on the loop thread after the file changed
+        """
+        self.loop = loop
+        self.path = Path(path)
+        self.on_change = on_change
+        self._fd: Optional[int] = None
+        self._settle_handle = None
+        self._poll_handle = None
+        self._mtime: Optional[float] = None
+
+    def start(self):
+        """Start watching"""
+        fd = _inotify_init()
+        if fd is not None:
+            try:
+                directory = str(self.path.parent.resolve())
+                _inotify_add_watch(fd, directory,
+                                   IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY)
+                self._fd = fd
+                self.loop.add_reader(fd, self._on_inotify)
+                logger.info(f"Watching {self.path} for changes (inotify)")
+                return
+            except OSError as e:
+                logger.warning(f"inotify watch failed: {e}")
+                os.close(fd)
+
+        self._mtime = self._current_mtime()
+        self._poll_handle = self.loop.call_later(self.POLL_INTERVAL, self._poll)
+        logger.info(f"Watching {self.path} for changes (polling)")
+
+    def stop(self):
+        """Stop watching"""
+        if self._fd is not None:
+            self.loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+        if self._settle_handle is not None:
+            self._settle_handle.cancel()
+            self._settle_handle = None
+
+    def _on_inotify(self):
+        """Read inotify events and schedule a change notification"""
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+
+        name = self.path.name
+        offset = 0
+        changed = False
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            event_name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            if event_name == name:
+                changed = True
+
+        if changed:
+            self._schedule_change()
+
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _poll(self):
+        """Compare the file's modification time on a timer"""
+        mtime = self._current_mtime()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._schedule_change()
+        self._poll_handle = self.loop.call_later(self.POLL_INTERVAL, self._poll)
+
+    def _schedule_change(self):
+        """Notify once the file has been quiet for the settle delay"""
+        if self._settle_handle is not None:
+            self._settle_handle.cancel()
+        self._settle_handle = self.loop.call_later(self.SETTLE_DELAY, self._notify)
+
+    def _notify(self):
+        self._settle_handle = None
+        self.on_change()
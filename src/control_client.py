@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Control Client - Talks to the converter daemon over its Unix socket
+"""
+
+import json
+import socket
+import logging
+import threading
+import itertools
+from typing import Any, Callable, Dict, List, Optional
+
+from control_server import DEFAULT_SOCKET_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class ControlUnavailable(Exception):
+    """The converter daemon is not running or not reachable"""
+
+
+class ControlError(Exception):
+    """The converter daemon rejected a command"""
+
+
+class ControlTimeout(Exception):
+    """
+    The converter daemon did not answer a command in time
+
+    Unlike ControlUnavailable the daemon is running and may still carry
+    the command out, so it must not be applied another way or retried.
+    """
+
+
+class ControlSubscription:
+    """Background reader delivering published daemon events to a callback"""
+
+    def __init__(self, sock: socket.socket, callback: Callable[[Dict[str, Any]], None]):
+        self._sock = sock
+        self._callback = callback
+        self._closed = False
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        try:
+            with self._sock.makefile('rb') as stream:
+                for line in stream:
+                    message = json.loads(line)
+                    if 'topic' in message:
+                        self._callback(message)
+        except (OSError, ValueError) as e:
+            if not self._closed:
+                logger.warning(f"Control subscription ended: {e}")
+
+    def is_alive(self) -> bool:
+        """Check whether the stream is still open"""
+        return self._thread.is_alive()
+
+    def close(self):
+        """Stop the stream"""
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._thread.join(timeout=1.0)
+
+
+class ControlClient:
+    """
+    Synchronous client for the daemon's control socket
+
+    One connection is kept open for requests and shared between threads
+    under a lock; it is re-established transparently when the daemon
+    restarts. Subscriptions use a connection of their own.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, timeout: float = 2.0):
+        """
+        Initialize the client
+
+        Args:
+            path: Filesystem path of the daemon's Unix socket
+            timeout: Seconds to wait for a reply
+        """
+        self.path = path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._stream = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise ControlUnavailable(f"Converter daemon not reachable at {self.path}: {e}")
+        return sock
+
+    def _closed_by_daemon(self) -> bool:
+        """Check whether the daemon has closed the kept connection, without blocking"""
+        try:
+            return self._sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def _disconnect(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def request(self, cmd: str, **args) -> Any:
+        """
+        Run a command on the daemon
+
+        Args:
+            cmd: Command name
+            **args: Command arguments
+
+        Returns:
+            The command's result
+
+        Raises:
+            ControlUnavailable: The daemon could not be reached
+            ControlTimeout: The daemon did not answer in time; the command may still run
+            ControlError: The daemon reported an error
+        """
+        request_id = next(self._ids)
+        data = json.dumps(dict(args, id=request_id, cmd=cmd)).encode() + b'\n'
+
+        with self._lock:
+            # A connection kept from before may have been closed by a daemon
+            # restart. It is replaced, and the request sent again, only while
+            # the request cannot have reached a daemon: once it is sent the
+            # command may run, so it is never sent twice.
+            for attempt in range(2):
+                reused = self._sock is not None
+                if reused and self._closed_by_daemon():
+                    self._disconnect()
+                    reused = False
+                if self._sock is None:
+                    self._sock = self._connect()
+                    self._stream = self._sock.makefile('rb')
+                try:
+                    self._sock.sendall(data)
+                    break
+                except socket.timeout:
+                    self._disconnect()
+                    raise ControlTimeout(f"Converter daemon did not accept the request within {self.timeout} s")
+                except OSError as e:
+                    self._disconnect()
+                    if attempt or not reused:
+                        raise ControlUnavailable(f"Control request failed: {e}")
+
+            try:
+                while True:
+                    line = self._stream.readline()
+                    if not line:
+                        raise ConnectionError("Connection closed by daemon")
+                    reply = json.loads(line)
+                    if reply.get('id') == request_id:
+                        break
+            except socket.timeout:
+                self._disconnect()
+                raise ControlTimeout(f"Converter daemon did not answer within {self.timeout} s")
+            except (OSError, ValueError) as e:
+                self._disconnect()
+                raise ControlUnavailable(f"Control request failed: {e}")
+
+        if not reply.get('ok'):
+            raise ControlError(reply.get('error', 'Unknown error'))
+        return reply.get('result')
+
+    def is_available(self) -> bool:
+        """Check whether the daemon answers"""
+        try:
+            self.request('ping')
+            return True
+        except (ControlUnavailable, ControlTimeout, ControlError):
+            return False
+
+    def subscribe(self, topics: List[str],
+                  callback: Callable[[Dict[str, Any]], None]) -> ControlSubscription:
+        """
+        Stream published daemon events to a callback on a background thread
+
+        Args:
+            topics: Topics to subscribe to (e.g. ['input', 'output'])
+            callback: Called with each message dictionary
+
+        Returns:
+            Subscription; close() it to stop the stream
+
+        Raises:
+            ControlUnavailable: The daemon could not be reached
+            ControlError: The daemon rejected the subscription
+        """
+        sock = self._connect()
+        try:
+            sock.sendall(json.dumps({'id': 0, 'cmd': 'subscribe', 'topics': topics}).encode() + b'\n')
+            line = b''
+            while not line.endswith(b'\n'):
+                chunk = sock.recv(1)
+                if not chunk:
+                    raise ConnectionError("Connection closed by daemon")
+                line += chunk
+            reply = json.loads(line)
+        except (OSError, ValueError) as e:
+            sock.close()
+            raise ControlUnavailable(f"Subscription failed: {e}")
+        if not reply.get('ok'):
+            sock.close()
+            raise ControlError(reply.get('error', 'Unknown error'))
+
+        # Events arrive whenever they happen, so the stream never times out
+        sock.settimeout(None)
+        return ControlSubscription(sock, callback)
+
+    def close(self):
+        """Close the request connection"""
+        with self._lock:
+            self._disconnect()
+
+
+class LocalSubscription:
+    """In-process subscription to a ControlServer's published events"""
+
+    def __init__(self, server, callback: Callable[[Dict[str, Any]], None]):
+        self._server = server
+        self._callback = callback
+        self._closed = False
+
+    def is_alive(self) -> bool:
+        """Check whether the subscription is still active"""
+        return not self._closed
+
+    def close(self):
+        """Stop the subscription"""
+        if not self._closed:
+            self._closed = True
+            self._server.loop.call_soon_threadsafe(self._server.unsubscribe_local, self._callback)
+
+
+class LocalControlClient:
+    """
+    ControlClient for code running inside the converter process
+
+    Commands run on the converter's event loop thread between input
+    batches, exactly like requests on the control socket, but without
+    a socket round trip or JSON encoding. Results are the daemon's own
+    objects: the daemon replaces its configuration rather than modifying
+    it, so they stay valid, but callers must treat them as read-only.
+    """
+
+    def __init__(self, server, timeout: float = 2.0):
+        """
+        Initialize the client
+
+        Args:
+            server: The daemon's ControlServer
+            timeout: Seconds to wait for the event loop to run a command
+        """
+        self.server = server
+        self.timeout = timeout
+
+    def _call(self, function: Callable, *args) -> Any:
+        """Run a function on the event loop thread and wait for its result"""
+        done = threading.Event()
+        outcome: List[Any] = [None, None]
+
+        def run():
+            try:
+                outcome[0] = function(*args)
+            except Exception as e:
+                outcome[1] = e
+            done.set()
+
+        self.server.loop.call_soon_threadsafe(run)
+        if not done.wait(self.timeout):
+            raise ControlTimeout(f"Converter event loop did not respond within {self.timeout} s")
+        if outcome[1] is not None:
+            raise outcome[1]
+        return outcome[0]
+
+    def request(self, cmd: str, **args) -> Any:
+        """
+        Run a command on the daemon
+
+        Args:
+            cmd: Command name
+            **args: Command arguments
+
+        Returns:
+            The command's result
+
+        Raises:
+            ControlTimeout: The event loop did not run the command in time
+            ControlError: The command failed
+        """
+        try:
+            return self._call(self.server.execute, dict(args, cmd=cmd))
+        except ControlTimeout:
+            raise
+        except (ValueError, KeyError, TypeError) as e:
+            raise ControlError(str(e))
+        except Exception as e:
+            logger.exception("Error handling control request")
+            raise ControlError(str(e))
+
+    def is_available(self) -> bool:
+        """Check whether the event loop answers"""
+        try:
+            self.request('ping')
+            return True
+        except (ControlTimeout, ControlError):
+            return False
+
+    def subscribe(self, topics: List[str],
+                  callback: Callable[[Dict[str, Any]], None]) -> LocalSubscription:
+        """
+        Deliver published daemon events to a callback
+
+        The callback runs on the event loop thread and must only hand the
+        message over (e.g. to a queue) without blocking.
+
+        Args:
+            topics: Topics to subscribe to (e.g. ['input', 'output'])
+            callback: Called with each message dictionary
+
+        Returns:
+            Subscription; close() it to stop
+        """
+        self._call(self.server.subscribe_local, topics, callback)
+        return LocalSubscription(self.server, callback)
+
+    def close(self):
+        """Nothing to close; present for ControlClient compatibility"""
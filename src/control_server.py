@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Control Server - Local Unix-socket API of the converter daemon
+"""
+
+import os
+import json
+import socket
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = '/tmp/joystick-converter.sock'
+
+
+class _Connection:
+    """State of one connected control client"""
+
+    __slots__ = ('sock', 'fd', 'rbuf', 'wbuf', 'topics', 'dropped')
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.rbuf = b''
+        self.wbuf = bytearray()
+        self.topics: Set[str] = set()
+        self.dropped = 0
+
+
+class ControlServer:
+    """
+    Newline-delimited JSON API on a Unix stream socket
+
+    Each request is one JSON object with a 'cmd' field and an optional
+    'id' echoed back in the reply:
+
+        {"id": 1, "cmd": "get_config"}
+        {"id": 1, "ok": true, "result": {...}}
+        {"id": 2, "ok": false, "error": "Unknown command: foo"}
+
+    Commands are plain functions receiving the request dictionary. The
+    built-in 'subscribe' command turns a connection into an event stream;
+    published messages are then pushed as {"topic": ..., ...} lines.
+
+    Everything runs on the event loop without blocking: replies that do
+    not fit in the socket buffer are queued and flushed when the socket
+    becomes writable, and events for a client whose queue is already
+    full are dropped and counted instead of stalling input handling.
+
+    Code running inside the daemon process can use the same commands and
+    topics without the socket through execute() and subscribe_local().
+    """
+
+    MAX_REQUEST = 1024 * 1024
+    MAX_BACKLOG = 256 * 1024
+
+    def __init__(self, loop, path: Optional[str] = DEFAULT_SOCKET_PATH,
+                 commands: Optional[Dict[str, Callable[[Dict[str, Any]], Any]]] = None):
+        """
+        Initialize the control server
+
+        Args:
+            loop: EventLoop the sockets are served on
+            path: Filesystem path of the Unix socket (None = in-process use only)
+            commands: Command name -> handler(request) returning the result
+        """
+        self.loop = loop
+        self.path = path
+        self.commands = dict(commands or {})
+        self._sock: Optional[socket.socket] = None
+        self._connections: Dict[int, _Connection] = {}
+        self._subscribers: Dict[str, Set[_Connection]] = {}
+        self._local_subscribers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+
+        # Optional function called with (topic, subscriber count) on changes
+        self.subscription_hook: Optional[Callable[[str, int], None]] = None
+
+    def start(self, owner_of: Optional[str] = None) -> bool:
+        """
+        Start listening
+
+        Args:
+            owner_of: When running as root, give the socket the owner and
+                      group of this path (e.g. the config directory) so
+                      the unprivileged web interface can connect
+
+        Returns:
+            True if the socket is listening
+        """
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # Stale socket from a previous run
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(self.path)
+            os.chmod(self.path, 0o660)
+            if owner_of and os.geteuid() == 0:
+                st = os.stat(owner_of)
+                os.chown(self.path, st.st_uid, st.st_gid)
+            sock.listen(8)
+            sock.setblocking(False)
+        except OSError as e:
+            logger.error(f"Failed to open control socket {self.path}: {e}")
+            return False
+
+        self._sock = sock
+        self.loop.add_reader(sock.fileno(), self._on_accept)
+        logger.info(f"Control socket listening on {self.path}")
+        return True
+
+    def stop(self):
+        """Close every connection and remove the socket"""
+        for conn in list(self._connections.values()):
+            self._close(conn)
+        if self._sock is not None:
+            self.loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def has_subscribers(self, topic: str) -> bool:
+        """Check whether any client is subscribed to a topic"""
+        return bool(self._subscribers.get(topic) or self._local_subscribers.get(topic))
+
+    def publish(self, topic: str, message: Dict[str, Any]):
+        """
+        Push a message to every client subscribed to its topic
+
+        Args:
+            topic: Topic name
+            message: JSON-serializable message; 'topic' is added to it
+        """
+        subscribers = self._subscribers.get(topic)
+        local = self._local_subscribers.get(topic)
+        if not subscribers and not local:
+            return
+        message['topic'] = topic
+        if subscribers:
+            data = json.dumps(message).encode() + b'\n'
+            for conn in list(subscribers):
+                self._send(conn, data, droppable=True)
+        if local:
+            # Local subscribers get the message itself and may keep it
+            for callback in local:
+                callback(message)
+
+    def execute(self, request: Dict[str, Any]) -> Any:
+        """
+        Run a command (event loop thread only)
+
+        Args:
+            request: Request dictionary with the 'cmd' and its arguments
+
+        Returns:
+            The command's result
+
+        Raises:
+            ValueError: Unknown command, or the command rejected its arguments
+        """
+        cmd = request.get('cmd')
+        if cmd not in self.commands:
+            raise ValueError(f"Unknown command: {cmd}")
+        return self.commands[cmd](request)
+
+    def subscribe_local(self, topics: List[str], callback: Callable[[Dict[str, Any]], None]):
+        """
+        Deliver published messages to a function in this process (event loop thread only)
+
+        The callback runs on the event loop and must return quickly.
+
+        Args:
+            topics: Topics to subscribe to
+            callback: Called with each message dictionary
+        """
+        for topic in topics:
+            self._local_subscribers[topic] = self._local_subscribers.get(topic, []) + [callback]
+            self._notify_subscriptions(topic)
+
+    def unsubscribe_local(self, callback: Callable[[Dict[str, Any]], None]):
+        """Stop delivering messages to a function (event loop thread only)"""
+        for topic, callbacks in list(self._local_subscribers.items()):
+            if callback in callbacks:
+                self._local_subscribers[topic] = [c for c in callbacks if c is not callback]
+                self._notify_subscriptions(topic)
+
+    def _on_accept(self):
+        """Accept pending connections"""
+        while True:
+            try:
+                sock, _ = self._sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.warning(f"Control socket accept failed: {e}")
+                return
+            sock.setblocking(False)
+            conn = _Connection(sock)
+            self._connections[conn.fd] = conn
+            self.loop.add_reader(conn.fd, self._on_readable, conn)
+
+    def _on_readable(self, conn: _Connection):
+        """Read and handle complete request lines"""
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(conn)
+            return
+
+        conn.rbuf += data
+        *lines, conn.rbuf = conn.rbuf.split(b'\n')
+        if len(conn.rbuf) > self.MAX_REQUEST:
+            logger.warning("Control request too large, closing connection")
+            self._close(conn)
+            return
+
+        for line in lines:
+            if line.strip():
+                self._handle(conn, line)
+            if conn.fd not in self._connections:
+                return
+
+    def _handle(self, conn: _Connection, line: bytes):
+        """Run one request and queue its reply"""
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            request_id = request.get('id')
+            cmd = request.get('cmd')
+            if cmd == 'subscribe':
+                result = self._subscribe(conn, request)
+            elif cmd == 'unsubscribe':
+                result = self._unsubscribe(conn, request.get('topics'))
+            else:
+                result = self.execute(request)
+            reply = {'id': request_id, 'ok': True, 'result': result}
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {'id': request_id, 'ok': False, 'error': str(e)}
+        except Exception as e:
+            logger.exception("Error handling control request")
+            reply = {'id': request_id, 'ok': False, 'error': str(e)}
+
+        self._send(conn, json.dumps(reply).encode() + b'\n')
+
+    def _subscribe(self, conn: _Connection, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a connection to the subscribers of the requested topics"""
+        topics = request.get('topics')
+        if not isinstance(topics, list) or not topics:
+            raise ValueError("'topics' must be a non-empty list")
+        for topic in topics:
+            if topic in conn.topics:
+                continue
+            conn.topics.add(topic)
+            subscribers = self._subscribers.setdefault(topic, set())
+            subscribers.add(conn)
+            self._notify_subscriptions(topic)
+        return {'topics': sorted(conn.topics)}
+
+    def _unsubscribe(self, conn: _Connection, topics=None) -> Dict[str, Any]:
+        """Remove a connection from some (default: all) of its topics"""
+        for topic in list(conn.topics if topics is None else topics):
+            if topic not in conn.topics:
+                continue
+            conn.topics.discard(topic)
+            self._subscribers[topic].discard(conn)
+            self._notify_subscriptions(topic)
+        return {'topics': sorted(conn.topics)}
+
+    def _notify_subscriptions(self, topic: str):
+        if self.subscription_hook is not None:
+            count = len(self._subscribers.get(topic, ())) + len(self._local_subscribers.get(topic, ()))
+            self.subscription_hook(topic, count)
+
+    def _send(self, conn: _Connection, data: bytes, droppable: bool = False):
+        """Write to a connection, queueing what the socket does not take"""
+        if conn.wbuf:
+            if droppable and len(conn.wbuf) > self.MAX_BACKLOG:
+                conn.dropped += 1
+                return
+            conn.wbuf += data
+            return
+
+        try:
+            sent = conn.sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._close(conn)
+            return
+
+        if sent < len(data):
+            conn.wbuf += data[sent:]
+            self.loop.add_writer(conn.fd, self._on_writable, conn)
+
+    def _on_writable(self, conn: _Connection):
+        """Flush queued output"""
+        try:
+            sent = conn.sock.send(conn.wbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(conn)
+            return
+
+        del conn.wbuf[:sent]
+        if not conn.wbuf:
+            self.loop.remove_writer(conn.fd)
+            if conn.dropped:
+                logger.debug(f"Control client fell behind, {conn.dropped} events dropped")
+                conn.dropped = 0
+
+    def _close(self, conn: _Connection):
+        """Forget and close a connection"""
+        if self._connections.pop(conn.fd, None) is None:
+            return
+        self._unsubscribe(conn)
+        self.loop.remove_reader(conn.fd)
+        self.loop.remove_writer(conn.fd)
+        conn.sock.close()
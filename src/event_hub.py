@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Event Hub - Broadcasts events to any number of independent subscribers
+"""
+
+import re
+import time
+import fnmatch
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class EventFilter:
+    """
+    Per-subscriber selection and downsampling of input events
+
+    Button events that match are always delivered. Axis events (ABS_*)
+    are dropped while they stay within min_delta of the last delivered
+    value; with coalescing or a rate limit only the latest value of each
+    axis is kept and delivered at most max_rate times per second.
+    """
+
+    def __init__(self, patterns: Optional[List[str]] = None, max_rate: float = 0.0,
+                 min_delta: int = 0, coalesce: bool = False):
+        """
+        Initialize the filter
+
+        Args:
+            patterns: Shell-style event name patterns, e.g. ['BTN_*', 'ABS_X'] (None = all)
+            max_rate: Deliveries per second per axis (0 = unlimited)
+            min_delta: Smallest axis change worth delivering
+            coalesce: Keep only the latest value of each axis per delivery
+        """
+        self.pattern = re.compile('|'.join(fnmatch.translate(p) for p in patterns)) if patterns else None
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.min_delta = min_delta
+        self.coalesce = coalesce or self.min_interval > 0
+
+    def matches(self, event_name: str) -> bool:
+        """Check whether an event is selected"""
+        return self.pattern is None or self.pattern.match(event_name) is not None
+
+    def downsamples(self) -> bool:
+        """Check whether axis events need per-axis handling"""
+        return self.coalesce or self.min_delta > 0
+
+
+class HubSubscriber:
+    """
+    One subscriber's bounded ring buffer
+
+    When the subscriber falls behind, its oldest events are overwritten
+    and counted; other subscribers are not affected.
+    """
+
+    def __init__(self, buffer_size: int, event_filter: Optional[EventFilter] = None):
+        self._ring: deque = deque(maxlen=buffer_size)
+        self._cond = threading.Condition(threading.Lock())
+        self._closed = False
+        self.dropped = 0
+        self._reported_dropped = 0
+
+        self.filter = event_filter
+        # Downsampling state per axis
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._last_value: Dict[str, int] = {}
+        self._last_time: Dict[str, float] = {}
+
+    def push(self, event: Dict[str, Any]):
+        """Append an event, overwriting the oldest one if the buffer is full"""
+        event_filter = self.filter
+        if event_filter is not None:
+            name = event['event_name']
+            if not event_filter.matches(name):
+                return
+            if event_filter.downsamples() and name.startswith('ABS_'):
+                with self._cond:
+                    self._push_axis(name, event)
+                return
+
+        with self._cond:
+            if len(self._ring) == self._ring.maxlen:
+                self.dropped += 1
+            self._ring.append(event)
+            self._cond.notify()
+
+    def _push_axis(self, name: str, event: Dict[str, Any]):
+        """Apply min_delta and coalescing to an axis event (lock held)"""
+        event_filter = self.filter
+        last = self._last_value.get(name)
+        if last is not None and abs(event['value'] - last) < event_filter.min_delta:
+            # Back near the delivered value; nothing worth showing
+            self._pending.pop(name, None)
+            return
+
+        if event_filter.coalesce:
+            self._pending[name] = event
+        else:
+            if len(self._ring) == self._ring.maxlen:
+                self.dropped += 1
+            self._ring.append(event)
+            self._last_value[name] = event['value']
+        self._cond.notify()
+
+    def _next_pending(self, now: float) -> Optional[float]:
+        """Get seconds until a pending axis may be delivered (lock held)"""
+        if not self._pending:
+            return None
+        interval = self.filter.min_interval
+        return min(self._last_time.get(name, -interval) + interval for name in self._pending) - now
+
+    def _take_pending(self, events: List[Dict[str, Any]], now: float):
+        """Move pending axis values whose rate limit allows delivery (lock held)"""
+        interval = self.filter.min_interval
+        for name, event in list(self._pending.items()):
+            if now - self._last_time.get(name, -interval) < interval:
+                continue
+            events.append(event)
+            del self._pending[name]
+            self._last_time[name] = now
+            self._last_value[name] = event['value']
+
+    def drain(self, timeout: float) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Wait for events and take all that are buffered
+
+        Args:
+            timeout: Seconds to wait when the buffer is empty
+
+        Returns:
+            (events, number of events dropped since the last drain)
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._ring and not self._closed:
+                now = time.monotonic()
+                wait = deadline - now
+                pending = self._next_pending(now)
+                if pending is not None:
+                    wait = min(wait, pending)
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            events = list(self._ring)
+            self._ring.clear()
+            if self._pending:
+                self._take_pending(events, time.monotonic())
+            dropped = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        return events, dropped
+
+    def close(self):
+        """Wake a waiting drain() for good"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def buffered(self) -> int:
+        """Get the number of events waiting to be drained"""
+        return len(self._ring)
+
+
+class EventHub:
+    """
+    Fan-out of published events to per-subscriber ring buffers
+
+    Publishing walks an immutable tuple of subscribers, so it never
+    blocks on subscribe/unsubscribe and costs nothing without
+    subscribers. Subscribers that wait for events sleep on their own
+    condition variable until something is pushed to them.
+    """
+
+    def __init__(self, buffer_size: int = 256):
+        """
+        Initialize the hub
+
+        Args:
+            buffer_size: Events kept per subscriber before the oldest are dropped
+        """
+        self.buffer_size = buffer_size
+        self._subscribers: Tuple[HubSubscriber, ...] = ()
+        self._lock = threading.Lock()
+
+    def subscribe(self, event_filter: Optional[EventFilter] = None) -> HubSubscriber:
+        """
+        Add a subscriber
+
+        Args:
+            event_filter: Selection and downsampling applied before buffering
+
+        Returns:
+            Subscriber to drain() events from
+        """
+        subscriber = HubSubscriber(self.buffer_size, event_filter)
+        with self._lock:
+            self._subscribers += (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber: HubSubscriber):
+        """Remove a subscriber"""
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscriber)
+        subscriber.close()
+
+    def publish(self, event: Dict[str, Any]):
+        """Push an event to every subscriber"""
+        for subscriber in self._subscribers:
+            subscriber.push(event)
+
+    def subscriber_count(self) -> int:
+        """Get the number of subscribers"""
+        return len(self._subscribers)
+
+    def stats(self) -> List[Dict[str, int]]:
+        """Get buffered and dropped event counts per subscriber"""
+        return [{'buffered': s.buffered(), 'dropped': s.dropped} for s in self._subscribers]
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Event Loop - Single-threaded poll loop with a heap-based timer scheduler
+"""
+
+import os
+import math
+import heapq
+import select
+import logging
+import itertools
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """Handle for a scheduled callback"""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Cancel the callback; the heap entry is discarded lazily"""
+        self.cancelled = True
+
+
+class EventLoop:
+    """
+    Poll-based event loop shared by input reading and timed output
+
+    File descriptors are watched with select.poll and timers are kept in a
+    binary heap, so the poll timeout is always the time until the next due
+    timer. Nothing in the loop ever sleeps, so a timer can only be delayed
+    by callbacks that are already running.
+    """
+
+    def __init__(self):
+        """Initialize the event loop"""
+        self._poll = select.poll()
+        self._readers: Dict[int, Tuple[Callable, tuple]] = {}
+        self._writers: Dict[int, Tuple[Callable, tuple]] = {}
+        self._timers: List[Tuple[float, int, TimerHandle]] = []
+        self._sequence = itertools.count()
+        self._pending: deque = deque()
+        self._running = False
+
+        # Start time of the iteration running callbacks (0.0 while waiting)
+        self.busy_since = 0.0
+        # Optional function called with (start, duration) of every
+        # iteration whose callbacks ran longer than slow_iteration_threshold
+        self.slow_iteration_hook: Optional[Callable[[float, float], None]] = None
+        self.slow_iteration_threshold = 0.0
+
+        # Self-pipe used to wake the loop from other threads
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self.add_reader(self._wake_read, self._drain_wakeup)
+
+    @staticmethod
+    def time() -> float:
+        """Get the loop clock (monotonic seconds)"""
+        return time.monotonic()
+
+    def call_at(self, when: float, callback: Callable, *args) -> TimerHandle:
+        """
+        Schedule a callback at an absolute loop time
+
+        Args:
+            when: Loop time (see time()) at which to run the callback
+            callback: Function to call
+            *args: Arguments for the callback
+
+        Returns:
+            Handle that can cancel the callback
+        """
+        handle = TimerHandle(when, callback, args)
+        heapq.heappush(self._timers, (when, next(self._sequence), handle))
+        return handle
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """
+        Schedule a callback after a delay in seconds
+
+        Returns:
+            Handle that can cancel the callback
+        """
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def call_soon_threadsafe(self, callback: Callable, *args):
+        """
+        Run a callback on the loop thread; safe to call from any thread
+
+        Args:
+            callback: Function to call
+            *args: Arguments for the callback
+        """
+        self._pending.append((callback, args))
+        try:
+            os.write(self._wake_write, b'\0')
+        except BlockingIOError:
+            pass  # Pipe full, loop is already going to wake up
+
+    def add_reader(self, fd: int, callback: Callable, *args):
+        """
+        Call a callback whenever a file descriptor becomes readable
+
+        Args:
+            fd: File descriptor to watch
+            callback: Function to call
+            *args: Arguments for the callback
+        """
+        self._readers[fd] = (callback, args)
+        self._update_poll(fd)
+
+    def remove_reader(self, fd: int) -> bool:
+        """
+        Stop watching a file descriptor for reading
+
+        Returns:
+            True if the descriptor was being watched
+        """
+        if self._readers.pop(fd, None) is None:
+            return False
+        self._update_poll(fd)
+        return True
+
+    def add_writer(self, fd: int, callback: Callable, *args):
+        """
+        Call a callback whenever a file descriptor becomes writable
+
+        Args:
+            fd: File descriptor to watch
+            callback: Function to call
+            *args: Arguments for the callback
+        """
+        self._writers[fd] = (callback, args)
+        self._update_poll(fd)
+
+    def remove_writer(self, fd: int) -> bool:
+        """
+        Stop watching a file descriptor for writing
+
+        Returns:
+            True if the descriptor was being watched
+        """
+        if self._writers.pop(fd, None) is None:
+            return False
+        self._update_poll(fd)
+        return True
+
+    def _update_poll(self, fd: int):
+        """Register the poll events wanted for a descriptor"""
+        mask = 0
+        if fd in self._readers:
+            mask |= select.POLLIN | select.POLLPRI
+        if fd in self._writers:
+            mask |= select.POLLOUT
+        if mask:
+            self._poll.register(fd, mask)
+        else:
+            try:
+                self._poll.unregister(fd)
+            except KeyError:
+                pass
+
+    def _drain_wakeup(self):
+        """Empty the wakeup pipe and run callbacks queued from other threads"""
+        try:
+            while os.read(self._wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while self._pending:
+            callback, args = self._pending.popleft()
+            self._run_callback(callback, args)
+
+    def _run_callback(self, callback: Callable, args: tuple):
+        """Run a callback, logging instead of propagating ordinary errors"""
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception(f"Error in event loop callback {callback!r}")
+
+    def _next_timeout(self) -> Optional[int]:
+        """
+        Get the poll timeout in milliseconds until the next live timer
+
+        Returns:
+            Timeout in ms, or None to block until a descriptor is ready
+        """
+        timers = self._timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)
+        if not timers:
+            return None
+        delay = timers[0][0] - self.time()
+        if delay <= 0:
+            return 0
+        # Round up so we never wake before the timer is due
+        return math.ceil(delay * 1000)
+
+    def run_once(self, timeout: Optional[int] = None):
+        """
+        Wait for readiness or the next timer, then dispatch callbacks
+
+        Args:
+            timeout: Upper bound on the wait in milliseconds (None = no bound)
+        """
+        wait = self._next_timeout()
+        if timeout is not None and (wait is None or timeout < wait):
+            wait = timeout
+
+        try:
+            ready = self._poll.poll(wait)
+        except InterruptedError:
+            ready = []
+
+        start = self.busy_since = self.time()
+        for fd, events in ready:
+            if events & ~select.POLLOUT:
+                reader = self._readers.get(fd)
+                if reader is not None:
+                    self._run_callback(reader[0], reader[1])
+                    events &= select.POLLOUT
+            if events:
+                writer = self._writers.get(fd)
+                if writer is not None:
+                    self._run_callback(writer[0], writer[1])
+
+        timers = self._timers
+        now = self.time()
+        while timers and timers[0][0] <= now:
+            handle = heapq.heappop(timers)[2]
+            if not handle.cancelled:
+                self._run_callback(handle.callback, handle.args)
+
+        self.busy_since = 0.0
+        if self.slow_iteration_hook is not None:
+            duration = self.time() - start
+            if duration > self.slow_iteration_threshold:
+                self.slow_iteration_hook(start, duration)
+
+    def run(self):
+        """Run the loop until stop() is called"""
+        self._running = True
+        while self._running:
+            self.run_once()
+
+    def stop(self):
+        """Stop the loop after the current iteration; safe from any thread"""
+        self._running = False
+        self.call_soon_threadsafe(lambda: None)
+
+    def is_running(self) -> bool:
+        """Check whether the loop is running"""
+        return self._running
+
+    def close(self):
+        """Release the loop's own file descriptors"""
+        self.remove_reader(self._wake_read)
+        os.close(self._wake_read)
+        os.close(self._wake_write)
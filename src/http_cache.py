@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+HTTP Cache - Memoized, precompressed response bodies with validators
+"""
+
+import gzip
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    # Optional: gzip is used when brotli is not installed
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 256
+
+
+class CachedBody:
+    """
+    A response body with its validators and compressed variants
+
+    Compressed variants are built once, on first request, and reused
+    for every later response with the same content. Each encoding gets
+    its own strong ETag since the bytes on the wire differ.
+    """
+
+    __slots__ = ('body', 'etag', 'last_modified', '_variants', '_lock')
+
+    def __init__(self, body: bytes, etag: Optional[str] = None, last_modified: Optional[float] = None):
+        """
+        Initialize the body
+
+        Args:
+            body: Uncompressed response body
+            etag: Entity tag (default: hash of the body)
+            last_modified: Modification time (seconds since the epoch)
+        """
+        self.body = body
+        self.etag = etag or hashlib.sha1(body).hexdigest()[:16]
+        self.last_modified = last_modified
+        self._variants: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, accept_encoding: str) -> Tuple[Optional[str], bytes]:
+        """
+        Pick the best encoding the client accepts
+
+        Args:
+            accept_encoding: The request's Accept-Encoding header
+
+        Returns:
+            (Content-Encoding or None for identity, body bytes)
+        """
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            return None, self.body
+
+        accepted = {token.split(';')[0].strip() for token in accept_encoding.lower().split(',')}
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return None, self.body
+
+        variant = self._variants.get(encoding)
+        if variant is None:
+            with self._lock:
+                variant = self._variants.get(encoding)
+                if variant is None:
+                    if encoding == 'br':
+                        variant = brotli.compress(self.body)
+                    else:
+                        variant = gzip.compress(self.body, compresslevel=9, mtime=0)
+                    self._variants[encoding] = variant
+        return encoding, variant
+
+
+class FileCache:
+    """Cached bodies of files in a directory, reloaded when a file changes"""
+
+    def __init__(self, directory: str):
+        """
+        Initialize the cache
+
+        Args:
+            directory: Directory files are served from
+        """
+        self.directory = Path(directory).resolve()
+        self._entries: Dict[str, Tuple[Tuple[int, int], CachedBody]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> Optional[CachedBody]:
+        """
+        Get a file's cached body
+
+        Args:
+            filename: Path relative to the directory
+
+        Returns:
+            CachedBody, or None if the file does not exist or is outside the directory
+        """
+        path = (self.directory / filename).resolve()
+        if self.directory not in path.parents:
+            return None
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        if not path.is_file():
+            return None
+
+        key = (st.st_mtime_ns, st.st_size)
+        entry = self._entries.get(filename)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        cached = CachedBody(path.read_bytes(), last_modified=st.st_mtime)
+        with self._lock:
+            self._entries[filename] = (key, cached)
+        return cached
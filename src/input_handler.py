@@ -3,29 +3,119 @@
 Input Handler - Handles joystick input using evdev
 """
 
+import sys
+import time
+import logging
+from typing import Optional, Callable, Dict, Any, List, Set, Tuple
+
+if 'evdev' not in sys.modules and 'asyncio' not in sys.modules:
+    # evdev's async reading API pulls in asyncio, which takes longer to
+    # import than the rest of the converter. It is never used here, and
+    # evdev falls back to its synchronous implementation without it.
+    sys.modules['evdev.eventio_async'] = None
+    try:
+        import evdev
+    finally:
+        del sys.modules['evdev.eventio_async']
 import evdev
 from evdev import InputDevice, categorize, ecodes
-import logging
-from typing import Optional, Callable, Dict, Any
 
-logging.basicConfig(level=logging.INFO)
+from axis_filter import build_filter
+from calibration import AxisCalibration, CalibrationStore
+from event_loop import EventLoop
+
 logger = logging.getLogger(__name__)
 
+# Names evdev gives some codes besides the one mappings use: range markers
+# and the positional gamepad names (BTN_SOUTH is BTN_A, BTN_NORTH is BTN_X)
+ALIAS_NAMES = frozenset({
+    'BTN_MISC', 'BTN_MOUSE', 'BTN_JOYSTICK', 'BTN_GAMEPAD', 'BTN_DIGI', 'BTN_WHEEL',
+    'BTN_TRIGGER_HAPPY', 'KEY_MIN_INTERESTING',
+    'BTN_SOUTH', 'BTN_EAST', 'BTN_NORTH', 'BTN_WEST',
+})
+
+
+def _preferred_name(names) -> str:
+    """Pick the name to use for a code from evdev's name or list/tuple of names"""
+    if not isinstance(names, (list, tuple)):
+        return names
+    return next((name for name in names if name not in ALIAS_NAMES), names[0])
+
+
+# One name per code by event type, looked up for every event
+EVENT_NAMES: Dict[int, Dict[int, str]] = {
+    event_type: {code: _preferred_name(names) for code, names in codes.items()}
+    for event_type, codes in ecodes.bytype.items()
+}
+
+
+def code_name(event_type: int, code: int) -> str:
+    """
+    Get the name of an event code, as used by mappings, filters and calibrations
+    
+    Args:
+        event_type: Event type (EV_KEY, EV_ABS, ...)
+        code: Event code
+        
+    Returns:
+        Event name, e.g. BTN_A for the button evdev also calls BTN_SOUTH
+    """
+    try:
+        return EVENT_NAMES[event_type][code]
+    except KeyError:
+        return f"UNKNOWN_{event_type}_{code}"
+
+
+def axis_codes() -> Dict[str, int]:
+    """Get absolute axis codes by name, under every name evdev knows"""
+    codes = {}
+    for code, names in ecodes.bytype[ecodes.EV_ABS].items():
+        for name in names if isinstance(names, (list, tuple)) else [names]:
+            codes[name] = code
+    return codes
+
 
 class JoystickInputHandler:
     """Handles input from USB joystick/gamepad devices"""
     
-    def __init__(self, device_path: Optional[str] = None):
+    # While a smoothed axis has not caught up with its last raw value,
+    # the filter is fed that value again this often
+    SETTLE_INTERVAL = 0.002
+    
+    def __init__(self, device_path: Optional[str] = None, calibration_file: Optional[str] = None):
         """
         Initialize the input handler
         
         Args:
             device_path: Path to the input device (e.g., /dev/input/event0)
                         If None, will auto-detect the first gamepad
+            calibration_file: Axis calibrations by device (see calibration.py),
+                              applied on connect
         """
         self.device_path = device_path
+        self.calibration_file = calibration_file
         self.device: Optional[InputDevice] = None
         self.event_callbacks: Dict[str, Callable] = {}
+        self.loop: Optional[EventLoop] = None
+        self.batch_callbacks: Optional[Tuple[Callable, Callable]] = None
+        # Optional function called with every key/axis event, mapped or not
+        self.monitor_callback: Optional[Callable] = None
+        # Optional function called with (type, code, value) of the same events
+        self.raw_callback: Optional[Callable] = None
+        
+        # Recovery from kernel buffer overruns (SYN_DROPPED): keys held
+        # according to the events seen, and the axes to re-read
+        self.keys_down: Set[int] = set()
+        self.abs_codes: List[int] = []
+        self._dropping = False
+        self.resyncs = 0
+        
+        # Calibration, then smoothing filters, by axis code, applied
+        # before any callback
+        self.calibrations: Dict[int, AxisCalibration] = {}
+        self.axis_filters: Dict[int, Any] = {}
+        self._axis_filter_specs: Dict[str, Dict[str, Any]] = {}
+        self._settle_handle = None
         
     def find_gamepad(self) -> Optional[str]:
         """
@@ -34,19 +124,25 @@ class JoystickInputHandler:
         Returns:
             Device path if found, None otherwise
         """
-        devices = [evdev.InputDevice(path) for path in evdev.list_devices()]
-        
-        for device in devices:
-            # Check if device has gamepad capabilities
-            capabilities = device.capabilities()
-            
-            # Look for devices with both buttons and absolute axes (typical gamepad)
-            has_buttons = ecodes.EV_KEY in capabilities
-            has_axes = ecodes.EV_ABS in capabilities
-            
-            if has_buttons and has_axes:
-                logger.info(f"Found gamepad: {device.name} at {device.path}")
-                return device.path
+        # Devices are opened one at a time and closed again once checked
+        for path in evdev.list_devices():
+            try:
+                device = evdev.InputDevice(path)
+            except OSError:
+                continue
+            try:
+                # Check if device has gamepad capabilities
+                capabilities = device.capabilities()
+                
+                # Look for devices with both buttons and absolute axes (typical gamepad)
+                has_buttons = ecodes.EV_KEY in capabilities
+                has_axes = ecodes.EV_ABS in capabilities
+                
+                if has_buttons and has_axes:
+                    logger.info(f"Found gamepad: {device.name} at {device.path}")
+                    return device.path
+            finally:
+                device.close()
                 
         logger.warning("No gamepad device found")
         return None
@@ -69,8 +165,14 @@ class JoystickInputHandler:
             self.device = InputDevice(self.device_path)
             logger.info(f"Connected to {self.device.name} at {self.device.path}")
             
-            # Print device capabilities for debugging
-            logger.info(f"Device capabilities: {self.device.capabilities(verbose=True)}")
+            self.abs_codes = self.device.capabilities(absinfo=False).get(ecodes.EV_ABS, [])
+            self.keys_down = set(self.device.active_keys())
+            self._dropping = False
+            self.load_calibration()
+            
+            # The verbose capability listing is slow to build; only for debugging
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Device capabilities: {self.device.capabilities(verbose=True)}")
             
             return True
             
@@ -80,6 +182,9 @@ class JoystickInputHandler:
     
     def disconnect(self):
         """Disconnect from the input device"""
+        if self._settle_handle is not None:
+            self._settle_handle.cancel()
+            self._settle_handle = None
         if self.device:
             self.device.close()
             self.device = None
@@ -97,6 +202,61 @@ class JoystickInputHandler:
         self.event_callbacks[event_name] = callback
         logger.debug(f"Registered callback for {event_name}")
     
+    def set_axis_filters(self, specs: Dict[str, Dict[str, Any]]):
+        """
+        Replace the axis smoothing filters
+        
+        Filters keep their state if the settings did not change.
+        
+        Args:
+            specs: Filter configuration by axis name, e.g.
+                   {"ABS_X": {"type": "one_euro", "min_cutoff": 1.0, "beta": 0.001}}
+                   (see axis_filter.build_filter)
+        """
+        if specs == self._axis_filter_specs:
+            return
+        self._axis_filter_specs = specs
+        codes = axis_codes()
+        filters = {}
+        for axis_name, spec in specs.items():
+            code = codes.get(axis_name)
+            if code is None:
+                logger.warning(f"Axis filter for unknown axis {axis_name}")
+                continue
+            try:
+                filters[code] = build_filter(spec)
+            except ValueError as e:
+                logger.warning(f"{axis_name}: invalid axis filter: {e}")
+        self.axis_filters = filters
+    
+    def load_calibration(self):
+        """Apply the stored calibration of the connected device, if it has one"""
+        self.calibrations = {}
+        if not self.calibration_file or not self.device:
+            return
+        try:
+            found = CalibrationStore(self.calibration_file).lookup(self.device.uniq, self.device.phys)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read calibration file {self.calibration_file}: {e}")
+            return
+        if found is None:
+            logger.info(f"No axis calibration for {self.device.name}")
+            return
+        key, calibration = found
+        codes = axis_codes()
+        for axis_name, settings in calibration['axes'].items():
+            code = codes.get(axis_name)
+            if code is None:
+                continue
+            try:
+                self.calibrations[code] = AxisCalibration.from_dict(settings)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"{axis_name}: invalid calibration: {e}")
+        # Values delivered so far were uncalibrated
+        for axis_filter in self.axis_filters.values():
+            axis_filter.reset()
+        logger.info(f"Applied axis calibration of {key} to {len(self.calibrations)} axes")
+    
     def get_event_name(self, event) -> str:
         """
         Get the name of an event
@@ -107,10 +267,7 @@ class JoystickInputHandler:
         Returns:
             Event name string
         """
-        try:
-            return ecodes.bytype[event.type][event.code]
-        except KeyError:
-            return f"UNKNOWN_{event.type}_{event.code}"
+        return code_name(event.type, event.code)
     
     def process_event(self, event):
         """
@@ -119,24 +276,134 @@ class JoystickInputHandler:
         Args:
             event: evdev InputEvent
         """
-        print(f"event.type:{event.type}")
+        event_type = event.type
         # Only process key and absolute axis events
-        if event.type not in [ecodes.EV_KEY, ecodes.EV_ABS]:
-            return
+        if event_type == ecodes.EV_KEY or event_type == ecodes.EV_ABS:
+            if not self._dropping:
+                self.dispatch(event_type, event.code, event.value)
+        elif event_type == ecodes.EV_SYN:
+            if event.code == ecodes.SYN_DROPPED:
+                # The kernel buffer overflowed: events up to the next
+                # SYN_REPORT are incomplete, the device state is re-read then
+                self._dropping = True
+            elif self._dropping and event.code == ecodes.SYN_REPORT:
+                self._dropping = False
+                self.resync()
+    
+    def dispatch(self, event_type: int, code: int, value: int, filtered: bool = False):
+        """
+        Deliver a key or axis event to the callbacks
+        
+        Args:
+            event_type: EV_KEY or EV_ABS
+            code: Event code
+            value: Event value
+            filtered: The axis value is already calibrated and smoothed
+        """
+        if event_type == ecodes.EV_KEY:
+            if value:
+                self.keys_down.add(code)
+            else:
+                self.keys_down.discard(code)
+        elif (self.calibrations or self.axis_filters) and not filtered:
+            calibration = self.calibrations.get(code)
+            if calibration is not None:
+                value = calibration.apply(value)
+            axis_filter = self.axis_filters.get(code)
+            if axis_filter is not None:
+                value = axis_filter.update(value, time.monotonic())
+                if (axis_filter.output != axis_filter.raw and self._settle_handle is None
+                        and self.loop is not None):
+                    self._settle_handle = self.loop.call_later(self.SETTLE_INTERVAL, self._settle_axes)
+                if value is None:
+                    # Smoothed to the value already delivered
+                    return
+        
+        if self.raw_callback is not None:
+            self.raw_callback(event_type, code, value)
             
-        event_name = self.get_event_name(event)
-        print(f"Get event name :{event_name}")
+        try:
+            event_name = EVENT_NAMES[event_type][code]
+        except KeyError:
+            event_name = f"UNKNOWN_{event_type}_{code}"
+        if self.monitor_callback is not None:
+            self.monitor_callback(event_name, value)
         # Call registered callback if exists
         if event_name in self.event_callbacks:
-            self.event_callbacks[event_name](event_name, event.value)
+            self.event_callbacks[event_name](event_name, value)
         else:
             # Log unhandled events for debugging
-            logger.debug(f"Unhandled event: {event_name} = {event.value}")
+            logger.debug(f"Unhandled event: {event_name} = {value}")
+    
+    def resync(self):
+        """
+        Bring everything downstream in line with the device after dropped events
+        
+        Keys whose state differs from the events seen get a synthetic press
+        or release, and every axis is re-read, so no mapped key stays stuck.
+        """
+        device = self.device
+        try:
+            active = set(device.active_keys())
+            axes = [(code, device.absinfo(code).value) for code in self.abs_codes]
+        except OSError as e:
+            logger.error(f"Failed to read device state after dropped events: {e}")
+            return
+        
+        self.resyncs += 1
+        # Re-read axis values are delivered as they are
+        for axis_filter in self.axis_filters.values():
+            axis_filter.reset()
+        changed = sorted(self.keys_down ^ active)
+        for code in changed:
+            self.dispatch(ecodes.EV_KEY, code, 1 if code in active else 0)
+        for code, value in axes:
+            self.dispatch(ecodes.EV_ABS, code, value)
+        logger.warning(f"Input events were dropped by the kernel; resynchronized "
+                       f"{len(changed)} keys and {len(axes)} axes")
+    
+    def _settle_axes(self):
+        """
+        Loop callback: move smoothed axes on towards their last raw value
+        
+        A device only reports an axis when it moves, so without this an
+        axis that stopped would stay wherever its filter had got to. The
+        filters advance by the time elapsed, not by another sample, so the
+        smoothing does not depend on how often this runs.
+        """
+        self._settle_handle = None
+        if self._dropping:
+            return
+        now = time.monotonic()
+        settled = []
+        pending = False
+        for code, axis_filter in self.axis_filters.items():
+            if axis_filter.output != axis_filter.raw:
+                value = axis_filter.settle(now)
+                if value is not None:
+                    settled.append((code, value))
+                pending = pending or axis_filter.output != axis_filter.raw
+        if pending and self.loop is not None:
+            self._settle_handle = self.loop.call_later(self.SETTLE_INTERVAL, self._settle_axes)
+        if not settled:
+            return
+        if self.batch_callbacks:
+            self.batch_callbacks[0]()
+        try:
+            for code, value in settled:
+                self.dispatch(ecodes.EV_ABS, code, value, filtered=True)
+        finally:
+            if self.batch_callbacks:
+                self.batch_callbacks[1]()
     
-    def start_event_loop(self):
+    def start_event_loop(self, loop: Optional[EventLoop] = None):
         """
         Start the main event loop to read and process input events
         This is a blocking call that runs until interrupted
+        
+        Args:
+            loop: Event loop to read the device on, shared with timers
+                  and other readers. A private loop is created if None.
         """
         if not self.device:
             logger.error("Device not connected. Call connect() first.")
@@ -144,17 +411,58 @@ class JoystickInputHandler:
             
         logger.info("Starting event loop. Press Ctrl+C to stop.")
         
+        if loop is None:
+            loop = EventLoop()
+        self.loop = loop
+        fd = self.device.fd
+        loop.add_reader(fd, self.on_device_readable)
+        
         try:
-            for event in self.device.read_loop():
-                self.process_event(event)
-                
+            loop.run()
         except KeyboardInterrupt:
             logger.info("Event loop interrupted by user")
         except Exception as e:
             logger.error(f"Error in event loop: {e}")
         finally:
+            loop.remove_reader(fd)
             self.disconnect()
     
+    def set_batch_callbacks(self, begin: Callable, end: Callable):
+        """
+        Register functions called around each input report
+        
+        A report is the events up to and including a SYN_REPORT, i.e. one
+        state of the device. Reports read together still get a frame each,
+        so a press and release of the same button in one read is not lost.
+        
+        Args:
+            begin: Called before the first event of a report
+            end: Called after the last event of a report
+        """
+        self.batch_callbacks = (begin, end)
+    
+    def on_device_readable(self):
+        """Read and process every event currently queued on the device"""
+        callbacks = self.batch_callbacks
+        in_frame = False
+        try:
+            for event in self.device.read():
+                if callbacks and not in_frame:
+                    callbacks[0]()
+                    in_frame = True
+                self.process_event(event)
+                if in_frame and event.type == ecodes.EV_SYN and event.code == ecodes.SYN_REPORT:
+                    callbacks[1]()
+                    in_frame = False
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            logger.error(f"Input device error: {e}")
+            self.loop.stop()
+        finally:
+            if in_frame:
+                callbacks[1]()
+    
     def get_device_info(self) -> Dict[str, Any]:
         """
         Get information about the connected device
@@ -203,7 +511,7 @@ def list_all_devices():
 
 
 if __name__ == "__main__":
-    import sys
+    logging.basicConfig(level=logging.INFO)
     
     # List devices if no arguments
     if len(sys.argv) == 1:
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Loop Profiler - Sampling profile of the event loop and per-stage timing of the input path
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Output files are <prefix>.collapsed and <prefix>.txt
+DEFAULT_PROFILE_OUTPUT = '/tmp/joystick-profile'
+
+# Functions listed in the summary table
+SUMMARY_TOP = 20
+
+
+def _frame_label(code) -> str:
+    """Name a code object the way flamegraph tools show it"""
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _visible(codes: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    """Leave this module's frames (the StageTimer wrappers) out of a sampled stack"""
+    return tuple(code for code in codes if code.co_filename != __file__)
+
+
+class StageTimer:
+    """
+    Wall time spent in named stages of the input path
+
+    A stage is a method of a handler object. While timing is on, the
+    method is shadowed by a timing wrapper stored on the instance, and
+    removing the wrapper restores the class method, so the hot path
+    carries no timing code at all while profiling is off. Stages nest
+    (translate_event runs inside the decode stage), and each stage's
+    self time excludes the stages called from it.
+    """
+
+    def __init__(self):
+        # stage -> [calls, total, self, max] in seconds
+        self.stats: Dict[str, List[float]] = {}
+        self._wrapped: List[Tuple[Any, str, Any]] = []
+        self._local = threading.local()
+
+    def wrap(self, obj: Any, attribute: str, stage: str):
+        """
+        Start timing a method
+
+        Args:
+            obj: Instance whose method is timed
+            attribute: Method name
+            stage: Stage name the time is reported under
+        """
+        function = getattr(obj, attribute)
+        stats = self.stats.setdefault(stage, [0, 0.0, 0.0, 0.0])
+        local = self._local
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            # Child time of the stages currently running on this thread
+            stack = local.__dict__.setdefault('stack', [])
+            stack.append(0.0)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += elapsed - children
+                if elapsed > stats[3]:
+                    stats[3] = elapsed
+
+        self._wrapped.append((obj, attribute, obj.__dict__.get(attribute)))
+        setattr(obj, attribute, timed)
+
+    def unwrap_all(self):
+        """Stop timing every wrapped method"""
+        while self._wrapped:
+            obj, attribute, previous = self._wrapped.pop()
+            if previous is None:
+                delattr(obj, attribute)
+            else:
+                setattr(obj, attribute, previous)
+
+    def table(self) -> List[str]:
+        """Format the stage times, one line per stage"""
+        lines = [f"{'Stage':<14}{'Calls':>10}{'Total ms':>12}{'Self ms':>12}{'Mean us':>10}{'Max us':>10}"]
+        for stage, (calls, total, own, longest) in self.stats.items():
+            mean = total / calls * 1e6 if calls else 0.0
+            lines.append(f"{stage:<14}{calls:>10}{total * 1000:>12.1f}{own * 1000:>12.1f}"
+                         f"{mean:>10.1f}{longest * 1e6:>10.1f}")
+        return lines
+
+
+class LoopProfiler:
+    """
+    Statistical profile of what the event loop thread spends its time on
+
+    The loop thread's stack is sampled every interval of wall time while
+    it runs callbacks; samples while it waits in poll() are only counted
+    as idle. A loop on the main thread is sampled from a SIGALRM handler
+    (ITIMER_REAL), which runs between two bytecodes of whatever the loop
+    is doing. Any other loop thread is sampled from a sampler thread;
+    that one needs the GIL, so its samples cluster where the loop gives
+    the GIL up, around system calls.
+
+    Stacks are kept as tuples of code objects and only named when the
+    results are written: one line per distinct stack in the collapsed
+    format of flamegraph.pl and speedscope, plus a summary table of the
+    stage times and the functions with the most self samples.
+    """
+
+    def __init__(self, loop, interval: float = 0.005):
+        """
+        Initialize the profiler
+
+        Args:
+            loop: EventLoop to profile
+            interval: Seconds between samples
+        """
+        self.loop = loop
+        self.interval = interval
+        self.stages = StageTimer()
+        self.samples: Dict[Tuple[Any, ...], int] = {}
+        self.idle_samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._active = False
+        self._thread_id: Optional[int] = None
+        self._previous_handler = None
+        self._stop = threading.Event()
+        self._sampler_thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def start(self, stages: Iterable[Tuple[Any, str, str]] = ()):
+        """
+        Start profiling (call from the loop thread); earlier results are discarded
+
+        Args:
+            stages: (object, method name, stage name) of the methods to time
+        """
+        if self.active:
+            return
+        self.stages = StageTimer()
+        for obj, attribute, stage in stages:
+            self.stages.wrap(obj, attribute, stage)
+        self.samples = {}
+        self.idle_samples = 0
+        self.started = time.monotonic()
+        self._active = True
+        if threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+            signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+        else:
+            self._thread_id = threading.get_ident()
+            self._stop.clear()
+            self._sampler_thread = threading.Thread(target=self._sample_loop, name='loop-profiler', daemon=True)
+            self._sampler_thread.start()
+
+    def stop(self):
+        """Stop profiling (call from the loop thread); results are kept until the next start()"""
+        if not self.active:
+            return
+        if self._sampler_thread is None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._previous_handler)
+        else:
+            self._stop.set()
+            self._sampler_thread.join()
+            self._sampler_thread = None
+        self._active = False
+        self.stages.unwrap_all()
+        self.duration = time.monotonic() - self.started
+
+    def _record(self, frame):
+        """Count one sample of the loop thread, interrupted in frame"""
+        if not self.loop.busy_since:
+            self.idle_samples += 1
+            return
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        key = tuple(codes)
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def _on_alarm(self, signum, frame):
+        """SIGALRM handler: sample the main thread"""
+        self._record(frame)
+
+    def _sample_loop(self):
+        """Sampler thread: sample the loop thread from outside"""
+        thread_id = self._thread_id
+        while not self._stop.wait(self.interval):
+            self._record(sys._current_frames().get(thread_id))
+
+    def collapsed(self) -> List[str]:
+        """
+        Format the samples as collapsed stacks
+
+        Returns:
+            Lines of 'outer;...;inner count', heaviest stack first
+        """
+        labels: Dict[Any, str] = {}
+        lines = []
+        for codes, count in sorted(self.samples.items(), key=lambda item: -item[1]):
+            names = []
+            for code in reversed(_visible(codes)):
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code).replace(';', ':')
+                names.append(label)
+            lines.append(f"{';'.join(names)} {count}")
+        return lines
+
+    def summary(self) -> List[str]:
+        """Format the stage times and the busiest functions as a table"""
+        busy = sum(self.samples.values())
+        total = busy + self.idle_samples
+        lines = [f"Profiled {self.duration:.1f} s: {busy} busy samples of {total} "
+                 f"({busy / total * 100 if total else 0:.1f}% busy, {self.interval * 1000:g} ms interval)", ""]
+        lines.extend(self.stages.table())
+
+        own: Dict[Any, int] = {}
+        inclusive: Dict[Any, int] = {}
+        for codes, count in self.samples.items():
+            codes = _visible(codes)
+            if codes:
+                own[codes[0]] = own.get(codes[0], 0) + count
+            for code in set(codes):
+                inclusive[code] = inclusive.get(code, 0) + count
+
+        lines += ["", f"{'Self %':>8}{'Total %':>9}  Function"]
+        for code, count in sorted(own.items(), key=lambda item: -item[1])[:SUMMARY_TOP]:
+            lines.append(f"{count / busy * 100:>8.1f}{inclusive[code] / busy * 100:>9.1f}  {_frame_label(code)}")
+        return lines
+
+    def write(self, prefix: str) -> Tuple[str, str]:
+        """
+        Write the collapsed stacks and the summary table
+
+        Args:
+            prefix: Output path without extension
+
+        Returns:
+            (collapsed stacks path, summary path)
+        """
+        collapsed_path = f"{prefix}.collapsed"
+        summary_path = f"{prefix}.txt"
+        with open(collapsed_path, 'w') as f:
+            f.writelines(line + '\n' for line in self.collapsed())
+        with open(summary_path, 'w') as f:
+            f.writelines(line + '\n' for line in self.summary())
+        return collapsed_path, summary_path
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Loop Watchdog - systemd readiness/watchdog notifications and event loop stall detection
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Environment variables systemd passes to a Type=notify service
+NOTIFY_ENVIRONMENT = ('NOTIFY_SOCKET', 'WATCHDOG_USEC', 'WATCHDOG_PID')
+
+
+def notify(state: str) -> bool:
+    """
+    Send a state update to systemd (sd_notify protocol)
+
+    Args:
+        state: e.g. 'READY=1', 'WATCHDOG=1', 'STOPPING=1'
+
+    Returns:
+        True if sent; False when not running under a Type=notify service
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address[0] == '@':
+        # Abstract namespace socket
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.sendto(state.encode(), address)
+    except OSError as e:
+        logger.warning(f"Failed to notify systemd: {e}")
+        return False
+    return True
+
+
+def watchdog_interval() -> Optional[float]:
+    """
+    Get the watchdog timeout systemd expects pings within (WatchdogSec=)
+
+    Returns:
+        Seconds, or None if the watchdog is not enabled for this process
+    """
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6
+
+
+class StallDetector:
+    """
+    Records event loop iterations that run longer than a threshold
+
+    The loop reports each slow iteration with its duration when it
+    ends. Meanwhile a monitor thread looks at the loop every half
+    threshold and, while an iteration has been running for at least
+    that long, takes the loop thread's stack, so the report shows what
+    the loop was doing and not only that it was late. An iteration
+    still running after hang_time is logged from the monitor thread
+    right away, before the systemd watchdog restarts the process.
+    """
+
+    # Innermost frames kept per captured stack
+    STACK_DEPTH = 12
+
+    def __init__(self, loop, threshold: float = 0.05, hang_time: float = 1.0, history: int = 20):
+        """
+        Initialize the detector
+
+        Args:
+            loop: EventLoop to watch
+            threshold: Iterations longer than this are recorded (seconds)
+            hang_time: Report an iteration still running after this long (seconds)
+            history: Number of recent stalls kept
+        """
+        self.loop = loop
+        self.threshold = threshold
+        self.hang_time = hang_time
+        self.stalls: deque = deque(maxlen=history)
+        self.count = 0
+        self.longest = 0.0
+        self._thread_id: Optional[int] = None
+        # (iteration start, stack) of the latest sample; replaced as a whole
+        self._sample: Tuple[float, Optional[List[str]]] = (0.0, None)
+        self._hang_reported = 0.0
+        self._stop = threading.Event()
+        self._monitor_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start watching (call from the loop thread)"""
+        self._thread_id = threading.get_ident()
+        self.loop.slow_iteration_threshold = self.threshold
+        self.loop.slow_iteration_hook = self._on_slow_iteration
+        self._stop.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor, name='stall-monitor', daemon=True)
+        self._monitor_thread.start()
+
+    def stop(self):
+        """Stop watching"""
+        self.loop.slow_iteration_hook = None
+        self._stop.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+            self._monitor_thread = None
+
+    def _loop_stack(self) -> Optional[List[str]]:
+        """Format the loop thread's current stack, innermost frame last"""
+        # Only needed once something is slow
+        import traceback
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return None
+        return traceback.format_list(traceback.extract_stack(frame, limit=self.STACK_DEPTH))
+
+    def _monitor(self):
+        """Monitor thread: sample the loop thread's stack while an iteration runs long"""
+        interval = self.threshold / 2
+        while not self._stop.wait(interval):
+            start = self.loop.busy_since
+            if not start:
+                continue
+            busy = time.monotonic() - start
+            if busy < interval:
+                continue
+            stack = self._loop_stack()
+            if self.loop.busy_since != start:
+                continue  # The iteration ended while the stack was taken
+            self._sample = (start, stack)
+            if busy >= self.hang_time and self._hang_reported != start:
+                self._hang_reported = start
+                logger.error(f"Event loop busy for {busy:.1f} s so far, in:\n{''.join(stack or []).rstrip()}")
+
+    def _on_slow_iteration(self, start: float, duration: float):
+        """Loop thread: record an iteration that exceeded the threshold"""
+        sample_start, stack = self._sample
+        if sample_start != start:
+            stack = None
+        self.count += 1
+        self.longest = max(self.longest, duration)
+        self.stalls.append({
+            'time': time.time() - (time.monotonic() - start),
+            'duration_ms': duration * 1000,
+            'stack': stack,
+        })
+        if stack:
+            logger.warning(f"Event loop iteration took {duration * 1000:.0f} ms, in:\n{''.join(stack).rstrip()}")
+        else:
+            logger.warning(f"Event loop iteration took {duration * 1000:.0f} ms")
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Get the recorded stalls, oldest first"""
+        return list(self.stalls)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Macro Engine - Plays compiled macro timelines on the event loop
+"""
+
+import logging
+from typing import Callable, Dict, Any, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _MacroRun:
+    """State of one macro that is currently playing"""
+
+    __slots__ = ('name', 'timeline', 'start', 'index', 'handle', 'pressed')
+
+    def __init__(self, name: str, timeline: tuple, start: float):
+        self.name = name
+        self.timeline = timeline
+        self.start = start
+        self.index = 0
+        self.handle = None
+        self.pressed: Set[int] = set()
+
+
+class MacroPlayer:
+    """
+    Plays macros without blocking the input loop
+
+    A macro is a timeline of (offset_seconds, output_event) pairs compiled
+    by MappingEngine. Each running macro keeps a single timer on the loop
+    for its next step; all step times are measured from the macro start,
+    so lateness of one step never accumulates into the following ones.
+    """
+
+    def __init__(self, loop, sink: Callable[[Dict[str, Any]], None]):
+        """
+        Initialize the macro player
+
+        Args:
+            loop: EventLoop used to schedule steps
+            sink: Function receiving each output event as it becomes due
+        """
+        self.loop = loop
+        self.sink = sink
+        self._runs: Dict[str, _MacroRun] = {}
+
+        # Optional function called with the lateness (seconds) of each step
+        self.lateness_hook: Optional[Callable[[float], None]] = None
+
+    def play(self, macro_event: Dict[str, Any]) -> bool:
+        """
+        Start playing a macro
+
+        Args:
+            macro_event: Output event of type 'macro' from the mapping engine
+
+        Returns:
+            True if started, False if the same macro is still playing
+        """
+        name = macro_event.get('name')
+        if name in self._runs:
+            logger.debug(f"Macro {name} already playing")
+            return False
+
+        timeline = macro_event.get('timeline', ())
+        if not timeline:
+            return False
+
+        run = _MacroRun(name, timeline, self.loop.time())
+        self._runs[name] = run
+        self._step(run)
+        return True
+
+    def _step(self, run: _MacroRun):
+        """Emit every step of a macro that is due and schedule the next one"""
+        now = self.loop.time()
+        timeline = run.timeline
+
+        while run.index < len(timeline):
+            offset, event = timeline[run.index]
+            due = run.start + offset
+            if due > now:
+                run.handle = self.loop.call_at(due, self._step, run)
+                return
+
+            if self.lateness_hook is not None:
+                self.lateness_hook(now - due)
+            run.index += 1
+            self._emit(run, event)
+
+        run.handle = None
+        del self._runs[run.name]
+
+    def _emit(self, run: _MacroRun, event: Dict[str, Any]):
+        """Send an event and remember which keys the macro holds"""
+        keycodes = event.get('keycodes') or (event.get('keycode'),)
+        if event.get('pressed'):
+            run.pressed.update(keycodes)
+        else:
+            run.pressed.difference_update(keycodes)
+        self.sink(event)
+
+    def cancel(self, name: str) -> bool:
+        """
+        Stop a playing macro and release any keys it is holding
+
+        Args:
+            name: Macro name (the input event it is mapped to)
+
+        Returns:
+            True if the macro was playing
+        """
+        run = self._runs.pop(name, None)
+        if run is None:
+            return False
+
+        if run.handle is not None:
+            run.handle.cancel()
+        for keycode in run.pressed:
+            self.sink({'type': 'keyboard', 'keycode': keycode, 'pressed': False, 'modifier': 0})
+        run.pressed.clear()
+        logger.debug(f"Macro {name} cancelled")
+        return True
+
+    def cancel_all(self):
+        """Stop every playing macro"""
+        for name in list(self._runs):
+            self.cancel(name)
+
+    def active_count(self) -> int:
+        """Get the number of macros currently playing"""
+        return len(self._runs)
@@ -3,45 +3,187 @@
 Main Converter - Integrates input, mapping, and output handlers
 """
 
+import os
 import sys
+import time
 import signal
+import faulthandler
 import logging
 import argparse
+import threading
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 # Add src directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from calibration import DEFAULT_CALIBRATION_FILE
+from config_watcher import ConfigWatcher
+from control_server import ControlServer, DEFAULT_SOCKET_PATH
+from event_loop import EventLoop
 from input_handler import JoystickInputHandler
+from loop_profiler import LoopProfiler, DEFAULT_PROFILE_OUTPUT
+from loop_watchdog import StallDetector, notify, watchdog_interval
 from mapping_engine import MappingEngine
+from macro_engine import MacroPlayer
+from memory_report import memory_report, set_tracing
 from output_handler import USBGadgetOutputHandler
+from profile_store import ProfileStore, CompiledProfileCache, DEFAULT_PROFILE_DB
+from state_snapshot import StateSnapshotWriter, DEFAULT_STATE_PATH
+from turbo import TurboController
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
+def process_uptime() -> float:
+    """
+    Get the time since this process was launched, interpreter startup included
+    
+    Returns:
+        Seconds (10 ms resolution)
+    """
+    with open('/proc/self/stat') as f:
+        # Fields after the parenthesized command name; starttime is field 22
+        start_ticks = int(f.read().rpartition(')')[2].split()[19])
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK')
+
+
 class JoystickConverter:
     """Main joystick converter application"""
     
-    def __init__(self, config_path: str = "/home/pi/joystick_converter/config/mappings.json", enable_output: bool = True):
+    # Config changes from the control API are saved once edits pause
+    # for SAVE_DELAY, and at the latest SAVE_MAX_DELAY after the first
+    SAVE_DELAY = 0.5
+    SAVE_MAX_DELAY = 5.0
+    
+    # Profiles kept compiled in memory for instant switching, and the
+    # memory they may take
+    PROFILE_CACHE_SIZE = 16
+    PROFILE_CACHE_BYTES = 8 * 1024 * 1024
+    
+    # GIL switch interval while the web interface runs in this process
+    WEB_SWITCH_INTERVAL = 0.001
+    
+    def __init__(self, config_path: str = "/home/pi/joystick_converter/config/mappings.json", enable_output: bool = True,
+                 watch_config: bool = True, control_socket: Optional[str] = DEFAULT_SOCKET_PATH,
+                 state_file: Optional[str] = DEFAULT_STATE_PATH, profile_db: Optional[str] = None,
+                 web_address: Optional[Tuple[str, int]] = None, input_device: Optional[str] = None,
+                 hidg_device: str = "/dev/hidg0", output_thread: bool = False,
+                 stall_threshold: float = 0.05, notify_systemd: bool = True,
+                 profile_output: Optional[str] = None, profile_interval: float = 0.005,
+                 calibration_file: Optional[str] = None):
         """
         Initialize the converter
         
         Args:
             config_path: Path to configuration file
             enable_output: Whether to enable output device (default: True)
+            watch_config: Reload the configuration when the file changes
+            control_socket: Path of the control API socket (None = disabled)
+            state_file: Path of the shared controller state file (None = disabled)
+            profile_db: Profile library database (default: profiles.db next to the config)
+            web_address: (host, port) to serve the web interface on from this
+                         process (None = the web interface runs separately)
+            input_device: Input device path (None = the first gamepad found)
+            hidg_device: HID gadget device to send keyboard reports to
+            output_thread: Write HID reports from a separate thread
+            stall_threshold: Record event loop iterations longer than this, in seconds (0 = off)
+            notify_systemd: Send readiness and watchdog pings to systemd (Type=notify)
+            profile_output: Path prefix for profiling results (default: one per run in /tmp)
+            profile_interval: Seconds between profiler samples
+            calibration_file: Axis calibrations by device (default: calibration.json next to the config)
         """
-        self.input_handler = JoystickInputHandler()
+        self.loop = EventLoop()
+        self.input_handler = JoystickInputHandler(
+            input_device, calibration_file or str(Path(config_path).parent / DEFAULT_CALIBRATION_FILE))
         self.mapping_engine = MappingEngine(config_path)
+        # switch_profile only accepts config files below this directory
+        self.config_dir = Path(config_path).expanduser().resolve().parent
+        self.macro_player = MacroPlayer(self.loop, self.send_output)
+        self.turbo = TurboController(self.loop, self.send_output)
         self.output_handler = None  # Instantiated later in setup() if needed
         self.running = False
         # enable_output: User's configuration intent (from constructor or CLI)
         # output_available: Runtime state - whether output device is actually connected
         self.enable_output = enable_output
         self.output_available = False
+        self.hidg_device = hidg_device
+        self.output_thread = output_thread
+        
+        # Live config reload: the file is parsed and compiled on a worker
+        # thread, only the table swap runs on the event loop
+        self.config_watcher = ConfigWatcher(self.loop, config_path, self.reload_config) if watch_config else None
+        self._reload_thread: Optional[threading.Thread] = None
+        self._reload_pending = False
+        self._save_handle = None
+        self._save_first: Optional[float] = None
+        self._save_thread: Optional[threading.Thread] = None
+        self._saved_config: Optional[Dict[str, Any]] = None
+        
+        # Version of the installed configuration, unique across restarts,
+        # so clients can cache what they fetched until it changes
+        self._config_instance = f"{os.getpid():x}{int(time.time()):x}"
+        self._config_version = 0
+        self._config_modified = time.time()
+        
+        # Profile library; recently used profiles are kept compiled so
+        # switching to them is a table swap
+        self.profile_store = ProfileStore(profile_db or Path(config_path).parent / DEFAULT_PROFILE_DB)
+        self.profile_cache = CompiledProfileCache(self.PROFILE_CACHE_SIZE, self.PROFILE_CACHE_BYTES)
+        self.active_profile: Optional[Dict[str, Any]] = None
+        
+        # Local API used by the web interface: config changes, state
+        # queries and live input/output event streams. Served on the
+        # control socket, and directly to an in-process web interface.
+        self.control_socket = control_socket
+        self._publish_output = False
+        self.control_server = ControlServer(self.loop, control_socket, {
+            'ping': lambda request: 'pong',
+            'get_state': self._cmd_get_state,
+            'get_config': lambda request: self.mapping_engine.get_config(),
+            'get_version': self._cmd_get_version,
+            'set_mapping': self._cmd_set_mapping,
+            'delete_mapping': self._cmd_delete_mapping,
+            'patch_mappings': self._cmd_patch_mappings,
+            'set_device_name': self._cmd_set_device_name,
+            'import_config': self._cmd_import_config,
+            'reload': self._cmd_reload,
+            'switch_profile': self._cmd_switch_profile,
+            'list_profiles': self._cmd_list_profiles,
+            'activate_profile': self._cmd_activate_profile,
+            'save_profile': self._cmd_save_profile,
+            'get_metrics': self._cmd_get_metrics,
+            'get_stalls': lambda request: self.stall_detector.recent() if self.stall_detector else [],
+            'get_memory': self._cmd_get_memory,
+            'trace_memory': self._cmd_trace_memory,
+            'reload_calibration': self._cmd_reload_calibration,
+            'profile': self._cmd_profile,
+        })
+        self.control_server.subscription_hook = self._on_subscription_change
+        
+        self.web_address = web_address
+        self.web_server = None
+        
+        # Controller state published once per frame for local readers
+        self.state_snapshot = StateSnapshotWriter(state_file) if state_file else None
+        self._in_frame = False
+        
+        # Slow loop iterations, with the stack they were stuck in
+        self.stall_detector = StallDetector(self.loop, stall_threshold) if stall_threshold > 0 else None
+        self.notify_systemd = notify_systemd
+        
+        # Sampling profile and stage timing, switched on at runtime
+        self.profiler = LoopProfiler(self.loop, profile_interval)
+        self.profile_output = profile_output
+        
+        # Throughput and per-frame handling time, reported by get_metrics
+        self.started = time.time()
+        self.frames = 0
+        self.mapped_events = 0
+        self.output_events = 0
+        self.frame_time_total = 0.0
+        self.frame_time_max = 0.0
+        self._frame_start = 0.0
         
     def setup(self) -> bool:
         """
@@ -66,13 +208,10 @@ class JoystickConverter:
             logger.error("Failed to connect to input device")
             return False
             
-        device_info = self.input_handler.get_device_info()
-        logger.info(f"Connected to: {device_info.get('name', 'Unknown')}")
-        
         # Connect to output device (if enabled)
         if self.enable_output:
             logger.info("Connecting to output device...")
-            self.output_handler = USBGadgetOutputHandler()
+            self.output_handler = USBGadgetOutputHandler(self.hidg_device, threaded=self.output_thread)
             if not self.output_handler.connect():
                 logger.warning("Failed to connect to output device - running in input-only mode")
                 self.output_available = False
@@ -82,6 +221,15 @@ class JoystickConverter:
         else:
             logger.info("Output device disabled - running in input-only mode")
             self.output_available = False
+        
+        if self.state_snapshot:
+            if self.state_snapshot.open():
+                self.input_handler.raw_callback = self.state_snapshot.update_input
+            else:
+                self.state_snapshot = None
+        
+        # One HID report and one state update per batch of input events
+        self.input_handler.set_batch_callbacks(self.begin_frame, self.end_frame)
             
         logger.info("All components initialized successfully")
         return True
@@ -94,38 +242,544 @@ class JoystickConverter:
             event_name: Name of the input event
             value: Value of the event
         """
+        self.mapped_events += 1
         # Translate input to output
         output_event = self.mapping_engine.translate_event(event_name, value)
         
         if output_event:
-            # Send output only if output handler is available
-            if self.output_handler:
-                self.output_handler.process_output_event(output_event)
-                logger.debug(f"{event_name}={value} -> {output_event}")
-            else:
-                logger.debug(f"{event_name}={value} -> {output_event} (output disabled)")
+            self.dispatch_output(output_event)
+            logger.debug(f"{event_name}={value} -> {output_event}")
         else:
             logger.debug(f"No mapping for {event_name}={value}")
     
+    def begin_frame(self):
+        """Start a batch of input events"""
+        self._frame_start = time.perf_counter()
+        self._in_frame = True
+        if self.output_handler:
+            self.output_handler.begin_frame()
+    
+    def end_frame(self):
+        """Finish a batch of input events: send the report, publish state"""
+        if self.output_handler:
+            self.output_handler.end_frame()
+        self._in_frame = False
+        if self.state_snapshot:
+            self.publish_state()
+        
+        elapsed = time.perf_counter() - self._frame_start
+        self.frames += 1
+        self.frame_time_total += elapsed
+        if elapsed > self.frame_time_max:
+            self.frame_time_max = elapsed
+    
+    def publish_state(self):
+        """Update the shared state snapshot"""
+        snapshot = self.state_snapshot
+        snapshot.set_layer(self.mapping_engine.get_active_layer())
+        if self.output_handler:
+            snapshot.set_output(self.output_handler.current_modifier, self.output_handler.pressed_keys)
+        snapshot.commit()
+    
+    def dispatch_output(self, output_event: dict):
+        """
+        Route a translated output event to the component that handles it
+        
+        Args:
+            output_event: Output event dictionary
+        """
+        if output_event['type'] == 'macro':
+            # Macros play out over time on the event loop
+            self.macro_player.play(output_event)
+        elif 'turbo' in output_event:
+            # Turbo keys toggle on their own timers, one frame per toggle
+            self.turbo.handle_event(output_event)
+        else:
+            self.send_output(output_event)
+    
+    def send_output(self, output_event: dict):
+        """
+        Send an output event to the output device
+        
+        Args:
+            output_event: Output event dictionary
+        """
+        self.output_events += 1
+        # Send output only if output handler is available
+        if self.output_handler:
+            self.output_handler.process_output_event(output_event)
+        if self._publish_output:
+            self.control_server.publish('output', {'event': output_event, 'timestamp': time.time()})
+        if self.state_snapshot and not self._in_frame:
+            # Macro and turbo output happens between input frames
+            self.publish_state()
+    
+    def reload_config(self):
+        """Start rebuilding the mapping profile from the config file"""
+        if self._reload_thread is not None:
+            # A rebuild is running; reload again once it is installed
+            self._reload_pending = True
+            return
+        self._reload_thread = threading.Thread(target=self._build_reloaded_profile, daemon=True)
+        self._reload_thread.start()
+    
+    def _build_reloaded_profile(self):
+        """Worker thread: parse and compile the config file"""
+        start = time.perf_counter()
+        config = self.mapping_engine.read_config()
+        profile = self.mapping_engine.build_profile(config) if config is not None else None
+        build_ms = (time.perf_counter() - start) * 1000
+        self.loop.call_soon_threadsafe(self._install_reloaded_profile, config, profile, build_ms)
+    
+    def _install_reloaded_profile(self, config, profile, build_ms: float):
+        """Loop thread: swap in a rebuilt profile between input batches"""
+        self._reload_thread = None
+        
+        if profile is None:
+            logger.warning("Configuration reload failed, keeping current mappings")
+        elif config == self.mapping_engine.get_config() or config == self._saved_config:
+            # Our own save after a control API change, possibly already
+            # superseded by newer edits that are waiting to be saved
+            logger.debug("Configuration file unchanged, nothing to reload")
+        else:
+            start = time.perf_counter()
+            released = self.install_profile(config, profile)
+            swap_ms = (time.perf_counter() - start) * 1000
+            
+            logger.info(f"Reloaded configuration: {len(self.mapping_engine.mappings)} mappings "
+                        f"(compiled in {build_ms:.1f} ms, swapped in {swap_ms:.3f} ms, "
+                        f"{released} keys released)")
+        
+        if self._reload_pending:
+            self._reload_pending = False
+            self.reload_config()
+    
+    def install_profile(self, config: Dict[str, Any], profile) -> int:
+        """
+        Swap in a compiled profile, releasing keys whose mapping changed
+        
+        Args:
+            config: Configuration dictionary
+            profile: mapping_engine.build_profile(config)
+            
+        Returns:
+            Number of keys released
+        """
+        releases = self.mapping_engine.swap_profile(config, profile)
+        self._config_version += 1
+        self._config_modified = time.time()
+        self.begin_frame()
+        for release in releases:
+            self.dispatch_output(release)
+        self.end_frame()
+        self.register_callbacks()
+        return len(releases)
+    
+    def apply_config(self, config: Dict[str, Any], save: bool = True) -> Dict[str, Any]:
+        """
+        Compile and install a configuration pushed over the control API
+        
+        Args:
+            config: Complete configuration dictionary
+            save: Also write it to the config file (debounced)
+            
+        Returns:
+            Summary for the control reply
+        """
+        released = self.install_profile(config, self.mapping_engine.build_profile(config))
+        if save:
+            self.schedule_save()
+        return {'mappings_count': len(self.mapping_engine.mappings), 'released': released}
+    
+    def schedule_save(self):
+        """Save the configuration once a burst of changes has settled"""
+        now = self.loop.time()
+        if self._save_first is None:
+            self._save_first = now
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+        when = min(now + self.SAVE_DELAY, self._save_first + self.SAVE_MAX_DELAY)
+        self._save_handle = self.loop.call_at(when, self.flush_save)
+    
+    def flush_save(self, wait: bool = False):
+        """
+        Write a pending save; the write and fsync run on a worker thread
+        
+        Args:
+            wait: Block until the file is written
+        """
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._save_first is None:
+            return
+        
+        if self._save_thread is not None and self._save_thread.is_alive():
+            if not wait:
+                # The previous write is still syncing; try again shortly
+                self._save_handle = self.loop.call_later(self.SAVE_DELAY, self.flush_save)
+                return
+            self._save_thread.join()
+        
+        self._save_first = None
+        self._saved_config = self.mapping_engine.get_config()
+        self._save_thread = threading.Thread(
+            target=self.mapping_engine.write_config,
+            args=(self._saved_config, self.mapping_engine.config_path),
+            daemon=True
+        )
+        self._save_thread.start()
+        if wait:
+            self._save_thread.join()
+    
+    def _cmd_get_state(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: report the converter's runtime state"""
+        device = self.input_handler.device
+        return {
+            'device_name': self.mapping_engine.device_name,
+            'config_path': str(self.mapping_engine.config_path),
+            'mappings_count': len(self.mapping_engine.mappings),
+            'active_layer': self.mapping_engine.get_active_layer(),
+            'input_device': {
+                'name': device.name,
+                'path': device.path,
+                'phys': device.phys,
+                'uniq': device.uniq,
+            } if device else None,
+            'output_available': self.output_available,
+            'active_macros': self.macro_player.active_count(),
+            'turbo_keys': self.turbo.active_keys(),
+            'active_profile': self.active_profile,
+        }
+    
+    def _cmd_get_version(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: report the config version, with the config itself if 'config' is set"""
+        result = {
+            'version': f"{self._config_instance}-{self._config_version}",
+            'modified': self._config_modified,
+        }
+        if request.get('config'):
+            # In the same command, so the version always matches the config
+            result['config'] = self.mapping_engine.get_config()
+        return result
+    
+    def _cmd_get_metrics(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: report throughput and input handling time"""
+        return {
+            'pid': os.getpid(),
+            'uptime': time.time() - self.started,
+            'input_connected': self.input_handler.device is not None,
+            'output_available': self.output_available,
+            'frames': self.frames,
+            'mapped_events': self.mapped_events,
+            'output_events': self.output_events,
+            'frame_ms_mean': self.frame_time_total / self.frames * 1000 if self.frames else 0.0,
+            'frame_ms_max': self.frame_time_max * 1000,
+            'input_resyncs': self.input_handler.resyncs,
+            'reports_written': self.output_handler.reports_written if self.output_handler else 0,
+            'reports_dropped': self.output_handler.reports_dropped if self.output_handler else 0,
+            'stalls': self.stall_detector.count if self.stall_detector else 0,
+            'longest_stall_ms': self.stall_detector.longest * 1000 if self.stall_detector else 0.0,
+            # Commands run on the event loop thread, so this is the input path's CPU time
+            'loop_cpu_seconds': time.thread_time(),
+            'cpus': sorted(os.sched_getaffinity(0)),
+        }
+    
+    def _cmd_get_memory(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: report resident memory and the size of the mapping structures"""
+        if 'trace' in request:
+            set_tracing(bool(request['trace']))
+        structures = self.mapping_engine.memory_structures()
+        structures['input_state'] = (self.input_handler.keys_down, self.input_handler.abs_codes)
+        structures['output_state'] = self.output_handler.pressed_keys if self.output_handler else None
+        structures['stall_history'] = self.stall_detector.stalls if self.stall_detector else None
+        report = memory_report(structures, int(request.get('top', 10)))
+        report['profile_cache'] = self.profile_cache.stats()
+        return report
+    
+    def _cmd_trace_memory(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: start or stop allocation tracing for memory reports"""
+        set_tracing(bool(request['enabled']))
+        return {'tracing': bool(request['enabled'])}
+    
+    def _cmd_reload_calibration(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: re-read the connected device's axis calibration"""
+        self.input_handler.load_calibration()
+        return {'axes': len(self.input_handler.calibrations)}
+    
+    def _cmd_set_mapping(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: add or replace one mapping"""
+        mapping = request['mapping']
+        if not isinstance(mapping, dict):
+            raise ValueError("'mapping' must be an object")
+        return self.apply_config(self.mapping_engine.with_mapping_changes({request['event_name']: mapping}))
+    
+    def _cmd_delete_mapping(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: remove one mapping"""
+        event_name = request['event_name']
+        if event_name not in self.mapping_engine.mappings:
+            return {'removed': False}
+        result = self.apply_config(self.mapping_engine.with_mapping_changes({event_name: None}))
+        result['removed'] = True
+        return result
+    
+    def _cmd_patch_mappings(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: apply many mapping changes at once (None removes)"""
+        return self.apply_config(self.mapping_engine.with_mapping_changes(request['changes']))
+    
+    def _cmd_set_device_name(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: rename the device"""
+        config = self.mapping_engine.get_config()
+        config['device_name'] = str(request['device_name'])
+        return self.apply_config(config)
+    
+    def _cmd_import_config(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: merge sections of a configuration into the current one"""
+        data = request['config']
+        if not isinstance(data, dict):
+            raise ValueError("'config' must be an object")
+        # Sections missing from the import keep their current value
+        config = self.mapping_engine.get_config()
+        config.update(data)
+        return self.apply_config(config)
+    
+    def _cmd_reload(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: re-read the config file"""
+        self.reload_config()
+        return {'scheduled': True}
+    
+    def _cmd_switch_profile(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: make another config file the active profile"""
+        path = Path(request['path']).expanduser().resolve()
+        # The path comes from the socket and later saves write to it, so it
+        # must not lead out of the config directory
+        if self.config_dir not in path.parents:
+            raise ValueError(f"Profile must be a file in {self.config_dir}")
+        config = self.mapping_engine.read_config(str(path))
+        if config is None:
+            raise ValueError(f"Could not read profile {path}")
+        
+        # Edits to the current profile go to its own file first
+        self.flush_save(wait=True)
+        result = self.apply_config(config, save=False)
+        self.mapping_engine.config_path = path
+        if self.config_watcher:
+            self.config_watcher.stop()
+            self.config_watcher.path = path
+            self.config_watcher.start()
+        logger.info(f"Switched to profile {path}")
+        result['config_path'] = str(path)
+        return result
+    
+    def _cmd_list_profiles(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Control command: search the profile library"""
+        return self.profile_store.search(request.get('query'), request.get('game'),
+                                         request.get('device'), int(request.get('limit', 100)))
+    
+    def _cmd_activate_profile(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: switch to a profile from the library"""
+        start = time.perf_counter()
+        name = request['name']
+        profile_id, version = self.profile_store.head(name)
+        version = request.get('version') or version
+        
+        cached = self.profile_cache.get(profile_id, version)
+        if cached is None:
+            config = self.profile_store.get(name, version)['config']
+            compiled = self.mapping_engine.build_profile(config)
+            self.profile_cache.put(profile_id, version, config, compiled)
+        else:
+            config, compiled = cached
+        
+        released = self.install_profile(config, compiled)
+        # Persisted as the config file too, so the profile survives a restart
+        self.schedule_save()
+        switch_ms = (time.perf_counter() - start) * 1000
+        self.profile_store.mark_used(name)
+        
+        self.active_profile = {'name': name, 'version': version}
+        logger.info(f"Activated profile {name} version {version} in {switch_ms:.2f} ms"
+                    f"{' (cached)' if cached else ''}")
+        return {'name': name, 'version': version, 'cached': cached is not None,
+                'switch_ms': switch_ms, 'released': released,
+                'mappings_count': len(self.mapping_engine.mappings)}
+    
+    def _cmd_save_profile(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: store the running configuration in the library"""
+        name = request['name']
+        config = self.mapping_engine.get_config()
+        version = self.profile_store.save(name, config, request.get('game'), request.get('device'),
+                                          request.get('description'), request.get('comment', ''))
+        # The running configuration is this version now, already compiled
+        profile_id = self.profile_store.head(name)[0]
+        self.profile_cache.put(profile_id, version, config, self.mapping_engine.current_profile())
+        self.active_profile = {'name': name, 'version': version}
+        return {'name': name, 'version': version}
+    
+    def warm_profile_cache(self):
+        """Worker thread: compile the most recently used profiles ahead of time"""
+        try:
+            for name, profile_id, version in self.profile_store.recently_used(self.PROFILE_CACHE_SIZE):
+                # Less recently used profiles would only push out the ones compiled so far
+                if self.profile_cache.full:
+                    break
+                if self.profile_cache.get(profile_id, version) is None:
+                    config = self.profile_store.get(name, version)['config']
+                    self.profile_cache.put(profile_id, version, config, self.mapping_engine.build_profile(config))
+        except Exception as e:
+            logger.warning(f"Could not precompile profiles: {e}")
+            return
+        if len(self.profile_cache):
+            logger.info(f"Precompiled {len(self.profile_cache)} profiles")
+    
+    def _cmd_profile(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Control command: start or stop profiling ('action': 'start' or 'stop')"""
+        action = request.get('action', 'stop' if self.profiler.active else 'start')
+        if action == 'start':
+            self.start_profiling()
+            return {'active': True}
+        if action != 'stop':
+            raise ValueError("'action' must be 'start' or 'stop'")
+        paths = self.stop_profiling()
+        return {'active': False, 'collapsed': paths[0] if paths else None, 'summary': paths[1] if paths else None}
+    
+    def _on_subscription_change(self, topic: str, count: int):
+        """Only produce event streams while someone is listening"""
+        if topic == 'input':
+            self.input_handler.monitor_callback = self._publish_input if count else None
+        elif topic == 'output':
+            self._publish_output = count > 0
+    
+    def _publish_input(self, event_name: str, value: int):
+        """Forward a raw input event to control subscribers"""
+        self.control_server.publish('input', {
+            'event_name': event_name,
+            'value': value,
+            'timestamp': time.time()
+        })
+    
+    def start_web(self):
+        """Serve the web interface from a thread of this process"""
+        # Loaded only in this mode; Flask is by far the largest import
+        import web_server
+        
+        # A thread waiting for the GIL asks for it after this interval;
+        # keep it short so web threads cannot hold up the input path long
+        sys.setswitchinterval(self.WEB_SWITCH_INTERVAL)
+        host, port = self.web_address
+        self.web_server = web_server.serve_in_process(self, host, port)
+    
+    def start_watchdog(self):
+        """Tell systemd the converter is ready and keep its watchdog fed from the event loop"""
+        notify('READY=1')
+        interval = watchdog_interval()
+        if interval:
+            # Pings stop as soon as the loop hangs, and systemd restarts us
+            logger.info(f"systemd watchdog enabled ({interval:.0f} s)")
+            self._watchdog_ping(interval / 2)
+    
+    def _watchdog_ping(self, period: float):
+        notify('WATCHDOG=1')
+        self.loop.call_later(period, self._watchdog_ping, period)
+    
+    def profile_stages(self) -> List[Tuple[Any, str, str]]:
+        """
+        Get the methods timed as stages of the input path while profiling
+        
+        Returns:
+            (object, method name, stage name) tuples
+        """
+        stages = [
+            (self.input_handler, 'process_event', 'decode'),
+            (self.mapping_engine, 'translate_event', 'translate'),
+        ]
+        if self.output_handler:
+            stages += [
+                (self.output_handler, 'process_output_event', 'output'),
+                (self.output_handler, 'build_report', 'report'),
+                (self.output_handler, 'write_report', 'write'),
+            ]
+            if self.output_handler.threaded:
+                # With a writer thread, write_report only queues the report
+                stages.append((self.output_handler, '_write_waiting', 'os.write'))
+        return stages
+    
+    def start_profiling(self):
+        """Start recording a profile of the event loop (loop thread)"""
+        if self.profiler.active:
+            return
+        self.profiler.start(self.profile_stages())
+        logger.info(f"Profiling started ({self.profiler.interval * 1000:g} ms sample interval)")
+    
+    def stop_profiling(self) -> Optional[Tuple[str, str]]:
+        """
+        Stop profiling and write the results (loop thread)
+        
+        Returns:
+            (collapsed stacks path, summary path), or None if not profiling
+        """
+        if not self.profiler.active:
+            return None
+        self.profiler.stop()
+        prefix = self.profile_output or f"{DEFAULT_PROFILE_OUTPUT}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}"
+        try:
+            paths = self.profiler.write(prefix)
+        except OSError as e:
+            logger.error(f"Failed to write profile: {e}")
+            return None
+        logger.info("Profile summary:\n" + '\n'.join(self.profiler.summary()))
+        logger.info(f"Profile written to {paths[0]} and {paths[1]}")
+        return paths
+    
+    def toggle_profiling(self):
+        """Start profiling, or stop and write the results if running"""
+        if self.profiler.active:
+            self.stop_profiling()
+        else:
+            self.start_profiling()
+    
     def register_callbacks(self):
         """Register input event callbacks"""
-        # Get all mapped events
-        for event_name in self.mapping_engine.mappings.keys():
+        # Get all events mapped in any layer
+        for event_name in self.mapping_engine.get_input_events():
             self.input_handler.register_callback(event_name, self.on_input_event)
             logger.debug(f"Registered callback for {event_name}")
+        self.input_handler.set_axis_filters(self.mapping_engine.axis_filters)
     
-    def run(self):
+    def run(self, profile: bool = False):
         """
         Run the converter main loop
+        
+        Args:
+            profile: Profile from the start (results are written at shutdown)
         """
         logger.info("Starting Joystick Converter...")
         logger.info("Press Ctrl+C to stop")
         
         self.running = True
         self.register_callbacks()
+        if self.config_watcher:
+            self.config_watcher.start()
+        if self.control_socket:
+            self.control_server.start(owner_of=str(self.mapping_engine.config_path.parent))
+        if self.profile_store.path.exists():
+            threading.Thread(target=self.warm_profile_cache, daemon=True).start()
+        if self.web_address:
+            self.start_web()
+        if self.stall_detector:
+            self.stall_detector.start()
+        if profile:
+            self.start_profiling()
+        
+        try:
+            logger.info(f"Ready {process_uptime() * 1000:.0f} ms after launch")
+        except (OSError, ValueError):
+            logger.info("Ready")
+        if self.notify_systemd:
+            self.start_watchdog()
         
         try:
-            self.input_handler.start_event_loop()
+            self.input_handler.start_event_loop(self.loop)
         except KeyboardInterrupt:
             logger.info("Received interrupt signal")
         finally:
@@ -136,10 +790,32 @@ class JoystickConverter:
         logger.info("Shutting down...")
         
         self.running = False
+        if self.notify_systemd:
+            notify('STOPPING=1')
+        if self.stall_detector:
+            self.stall_detector.stop()
+        self.stop_profiling()
+        
+        if self.config_watcher:
+            self.config_watcher.stop()
+        if self.web_server:
+            self.web_server.shutdown()
+        self.control_server.stop()
+        self.flush_save(wait=True)
+        
+        # Stop macros that are still playing
+        self.macro_player.cancel_all()
+        self.turbo.stop_all()
+        
+        # Forget held inputs and active layers
+        self.mapping_engine.release_all_held()
         
         # Release all keys (if output handler exists)
         if self.output_handler:
             self.output_handler.release_all()
+        if self.state_snapshot:
+            self.state_snapshot.close()
+        self.profile_store.close()
         
         # Disconnect devices
         self.input_handler.disconnect()
@@ -149,9 +825,26 @@ class JoystickConverter:
         logger.info("Shutdown complete")
 
 
+def parse_address(value: str) -> Tuple[str, int]:
+    """Parse a [HOST:]PORT command line value"""
+    host, _, port = value.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+
+def parse_cpus(value: str) -> List[int]:
+    """Parse a CPU list such as '1', '1,3' or '2-3'"""
+    cpus = set()
+    for part in value.split(','):
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
 def signal_handler(signum, frame):
     """Handle interrupt signals"""
     logger.info(f"Received signal {signum}")
+    # Finish shutting down when a supervisor or systemd sends another one
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
     sys.exit(0)
 
 
@@ -161,8 +854,54 @@ def main():
     parser = argparse.ArgumentParser(description='Joystick Converter - Convert joystick input to keyboard/mouse output')
     parser.add_argument('config', nargs='?', default=None, help='Path to configuration file')
     parser.add_argument('--no-output', action='store_true', help='Run without output device (input-only mode)')
+    parser.add_argument('--no-watch', action='store_true', help='Do not reload the configuration when the file changes')
+    parser.add_argument('--control-socket', default=DEFAULT_SOCKET_PATH,
+                        help=f'Unix socket for the control API (default: {DEFAULT_SOCKET_PATH})')
+    parser.add_argument('--no-control', action='store_true', help='Do not open the control API socket')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_PATH,
+                        help=f'Shared controller state file (default: {DEFAULT_STATE_PATH})')
+    parser.add_argument('--no-state-file', action='store_true', help='Do not publish the controller state file')
+    parser.add_argument('--web', metavar='[HOST:]PORT', default=None,
+                        help='Also serve the web interface from this process (instead of web_server.py)')
+    parser.add_argument('--profile-db', default=None,
+                        help=f'Profile library database (default: {DEFAULT_PROFILE_DB} next to the config file)')
+    parser.add_argument('--calibration-file', default=None,
+                        help=f'Axis calibrations by device (default: {DEFAULT_CALIBRATION_FILE} next to the config file)')
+    parser.add_argument('--input-device', default=None,
+                        help='Input device, e.g. /dev/input/by-path/...-event-joystick (default: first gamepad)')
+    parser.add_argument('--hidg', default='/dev/hidg0', help='HID gadget device (default: /dev/hidg0)')
+    parser.add_argument('--output-thread', action='store_true',
+                        help='Write HID reports from a separate thread so input is never held up by the host')
+    parser.add_argument('--stall-ms', type=float, default=50,
+                        help='Log event loop iterations slower than this with their stack (0 = off, default: 50)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the event loop from the start and write the results at exit '
+                             '(SIGUSR1 toggles profiling at any time)')
+    parser.add_argument('--profile-output', default=None, metavar='PREFIX',
+                        help=f'Write the profile to PREFIX.collapsed and PREFIX.txt '
+                             f'(default: {DEFAULT_PROFILE_OUTPUT}-PID-TIME)')
+    parser.add_argument('--profile-interval-ms', type=float, default=5,
+                        help='Profiler sample interval (default: 5)')
+    parser.add_argument('--cpus', type=parse_cpus, default=None, help='Pin the converter to these CPUs, e.g. 2 or 2-3')
+    parser.add_argument('--name', default=None, help='Name shown in log messages (set by the supervisor)')
     args = parser.parse_args()
     
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - {args.name + " - " if args.name else ""}%(name)s - %(levelname)s - %(message)s'
+    )
+    
+    # Dump every thread's stack on fatal signals, including the
+    # SIGABRT systemd sends when the watchdog expires
+    faulthandler.enable()
+    
+    if args.cpus:
+        # Before any thread is started, so they all inherit it
+        try:
+            os.sched_setaffinity(0, args.cpus)
+        except OSError as e:
+            logger.warning(f"Could not pin to CPUs {args.cpus}: {e}")
+    
     # Setup signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -180,13 +919,28 @@ def main():
     
     # Create and run converter
     enable_output = not args.no_output
-    converter = JoystickConverter(str(config_path), enable_output=enable_output)
+    converter = JoystickConverter(str(config_path), enable_output=enable_output,
+                                  watch_config=not args.no_watch,
+                                  control_socket=None if args.no_control else args.control_socket,
+                                  state_file=None if args.no_state_file else args.state_file,
+                                  profile_db=args.profile_db,
+                                  web_address=parse_address(args.web) if args.web else None,
+                                  input_device=args.input_device, hidg_device=args.hidg,
+                                  output_thread=args.output_thread,
+                                  stall_threshold=args.stall_ms / 1000,
+                                  profile_output=args.profile_output,
+                                  profile_interval=args.profile_interval_ms / 1000,
+                                  calibration_file=args.calibration_file)
     
     if not converter.setup():
         logger.error("Setup failed")
         sys.exit(1)
     
-    converter.run()
+    # Capture a profile of a running converter: kill -USR1 to start, again to stop
+    signal.signal(signal.SIGUSR1,
+                  lambda signum, frame: converter.loop.call_soon_threadsafe(converter.toggle_profiling))
+    
+    converter.run(profile=args.profile)
 
 
 if __name__ == "__main__":
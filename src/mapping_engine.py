@@ -3,14 +3,98 @@
 Mapping Engine - Maps joystick inputs to keyboard/mouse outputs
 """
 
+import os
 import json
+import stat
+import time
+import marshal
+import hashlib
 import logging
+from array import array
+from collections import deque
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compiled dispatch entry kinds. Entries are plain tuples whose first
+# element is one of these constants, so a whole compiled table is plain data.
+KIND_KEYBOARD = 0
+KIND_COMBO = 1
+KIND_DPAD = 2
+KIND_LAYER = 3
+KIND_MACRO = 4
+
+# Part of the compiled cache key; bump whenever compiled entries change shape
+COMPILER_VERSION = 3
+
+
+class CompiledProfile:
+    """
+    Compiled form of a mapping configuration
+    
+    Built without touching any engine runtime state, so it can be prepared
+    on another thread and installed with MappingEngine.swap_profile().
+    """
+    
+    __slots__ = ('tables', 'chord_bits', 'chords', 'seq_columns',
+                 'seq_delta', 'seq_windows', 'seq_outputs', 'combo_events')
+    
+    def __init__(self, tables: Dict[str, Dict[str, tuple]],
+                 chord_bits: Dict[str, int], chords: Dict[int, tuple],
+                 seq_columns: Dict[str, int], seq_delta: array,
+                 seq_windows: array, seq_outputs: List[Optional[tuple]],
+                 combo_events: frozenset):
+        self.tables = tables
+        self.chord_bits = chord_bits
+        self.chords = chords
+        self.seq_columns = seq_columns
+        self.seq_delta = seq_delta
+        self.seq_windows = seq_windows
+        self.seq_outputs = seq_outputs
+        self.combo_events = combo_events
+    
+    def to_data(self) -> tuple:
+        """
+        Convert to plain data for the compiled config cache
+        
+        Only dicts, tuples, lists, sets, strings, bytes and numbers, so the
+        cache is stored with marshal and loading it never runs code.
+        marshal keeps objects that are shared, e.g. between layer tables,
+        shared after loading.
+        """
+        return (self.tables, self.chord_bits, self.chords, self.seq_columns,
+                self.seq_delta.typecode, self.seq_delta.tobytes(), self.seq_windows.tobytes(),
+                self.seq_outputs, self.combo_events)
+    
+    @classmethod
+    def from_data(cls, data: tuple) -> 'CompiledProfile':
+        """
+        Rebuild a compiled profile from to_data() output
+        
+        Args:
+            data: Result of to_data()
+            
+        Returns:
+            Compiled profile
+            
+        Raises:
+            ValueError: If the data is malformed
+        """
+        try:
+            tables, chord_bits, chords, columns, typecode, delta, windows, outputs, combo_events = data
+        except (TypeError, ValueError):
+            raise ValueError("malformed compiled profile")
+        if not (isinstance(tables, dict) and isinstance(chord_bits, dict) and isinstance(chords, dict)
+                and isinstance(columns, dict) and isinstance(outputs, list)
+                and isinstance(combo_events, frozenset)):
+            raise ValueError("malformed compiled profile")
+        delta_array = array(typecode)
+        delta_array.frombytes(delta)
+        windows_array = array('d')
+        windows_array.frombytes(windows)
+        return cls(tables, chord_bits, chords, columns, delta_array, windows_array, outputs, combo_events)
+
 
 class MappingEngine:
     """Handles mapping configuration and translation of inputs to outputs"""
@@ -66,21 +150,213 @@ class MappingEngine:
         'RIGHTMETA': 0x80,
     }
     
-    def __init__(self, config_path: str = "config/mappings.json"):
+    # Characters typed by macro "text" steps: char -> (key name, shifted)
+    TEXT_KEY_MAP = {
+        ' ': ('SPACE', False), '\n': ('ENTER', False), '\t': ('TAB', False),
+        '-': ('MINUS', False), '=': ('EQUAL', False), '[': ('LEFTBRACE', False),
+        ']': ('RIGHTBRACE', False), '\\': ('BACKSLASH', False), ';': ('SEMICOLON', False),
+        "'": ('APOSTROPHE', False), '`': ('GRAVE', False), ',': ('COMMA', False),
+        '.': ('DOT', False), '/': ('SLASH', False),
+        '!': ('1', True), '@': ('2', True), '#': ('3', True), '$': ('4', True),
+        '%': ('5', True), '^': ('6', True), '&': ('7', True), '*': ('8', True),
+        '(': ('9', True), ')': ('0', True), '_': ('MINUS', True), '+': ('EQUAL', True),
+        '{': ('LEFTBRACE', True), '}': ('RIGHTBRACE', True), '|': ('BACKSLASH', True),
+        ':': ('SEMICOLON', True), '"': ('APOSTROPHE', True), '~': ('GRAVE', True),
+        '<': ('COMMA', True), '>': ('DOT', True), '?': ('SLASH', True),
+    }
+    
+    # Default macro timing in milliseconds
+    MACRO_TAP_MS = 20
+    MACRO_GAP_MS = 20
+    
+    # Name of the implicit bottom layer holding the top-level "mappings"
+    BASE_LAYER = 'base'
+    
+    # Supported layer switching modes
+    LAYER_MODES = ('hold', 'toggle')
+    
+    # D-pad (hat) axes and the sequence direction tokens of their positions
+    HAT_AXES = {'ABS_HAT0X': 0, 'ABS_HAT0Y': 1}
+    DIRECTION_TOKENS = {
+        (0, -1): 'UP', (0, 1): 'DOWN', (-1, 0): 'LEFT', (1, 0): 'RIGHT',
+        (-1, -1): 'UP_LEFT', (1, -1): 'UP_RIGHT',
+        (-1, 1): 'DOWN_LEFT', (1, 1): 'DOWN_RIGHT',
+    }
+    
+    # Default maximum time between two steps of a sequence
+    SEQUENCE_WINDOW_MS = 250
+    
+    _tables_version: Optional[str] = None
+    
+    def __init__(self, config_path: str = "config/mappings.json", compiled_cache: bool = True):
         """
         Initialize the mapping engine
         
         Args:
             config_path: Path to the JSON configuration file
+            compiled_cache: Keep the compiled profile next to the config
+                file and load it instead of recompiling an unchanged file
         """
         self.config_path = Path(config_path)
+        self.compiled_cache = compiled_cache
         self.mappings: Dict[str, Dict[str, Any]] = {}
+        self.layers: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.chords: List[Dict[str, Any]] = []
+        self.sequences: List[Dict[str, Any]] = []
+        # Smoothing filter settings by axis name, applied by the input handler
+        self.axis_filters: Dict[str, Dict[str, Any]] = {}
         self.device_name: str = "Unknown Device"
         
+        # Compiled per-layer dispatch tables; switching layers only
+        # re-points _active_table at another prebuilt dict
+        self._tables: Dict[str, Dict[str, tuple]] = {}
+        self._active_table: Dict[str, tuple] = {}
+        self._layer_stack: List[str] = []
+        
+        # Release actions for inputs that are currently held, keyed by event
+        # name, so a release always undoes what the press did even if the
+        # active layer changed in between
+        self._held: Dict[str, tuple] = {}
+        
+        # Chords: each chord button owns one bit; chords are keyed by the
+        # full bitmask of their buttons and looked up with the held mask
+        self._chord_bits: Dict[str, int] = {}
+        self._chords: Dict[int, tuple] = {}
+        self._chord_mask = 0
+        
+        # Sequences: DFA built from all sequences (Aho-Corasick), so one
+        # transition per input token regardless of how many are configured.
+        # Transitions are a flat array with one row per state and one
+        # column per token, next state = delta[state * columns + column].
+        self._seq_columns: Dict[str, int] = {}
+        self._seq_width = 0
+        self._seq_delta = array('H')
+        self._seq_windows = array('d', [0.0])
+        self._seq_outputs: List[Optional[tuple]] = [None]
+        self._seq_state = 0
+        self._seq_time = 0.0
+        self._hat = [0, 0]
+        
+        # Events that feed chord or sequence recognition
+        self._combo_events: frozenset = frozenset()
+        
+        self._profile: Optional[CompiledProfile] = None
+        self.compile()
+        
+    def apply_config(self, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Replace the current configuration and recompile it
+        
+        Args:
+            config: Configuration dictionary as stored in the JSON file
+            
+        Returns:
+            Release events for held keys whose mapping changed
+        """
+        return self.swap_profile(config, self.build_profile(config))
+    
+    def swap_profile(self, config: Dict[str, Any], profile: CompiledProfile) -> List[Dict[str, Any]]:
+        """
+        Install a configuration and its precompiled profile
+        
+        Held inputs keep their press only if their mapping is unchanged in
+        the new profile; all others are released and forgotten.
+        
+        Args:
+            config: Configuration dictionary the profile was built from
+            profile: Result of build_profile(config)
+            
+        Returns:
+            Release events for held keys whose mapping changed
+        """
+        self.device_name = config.get('device_name', 'Unknown Device')
+        self.mappings = config.get('mappings', {})
+        self.layers = {
+            name: layer.get('mappings', {})
+            for name, layer in config.get('layers', {}).items()
+        }
+        self.chords = config.get('chords', [])
+        self.sequences = config.get('sequences', [])
+        self.axis_filters = config.get('axis_filters', {})
+        self._install_profile(profile)
+        
+        releases = []
+        for event_name, held in list(self._held.items()):
+            if held[0] == KIND_LAYER or held[0] == KIND_MACRO:
+                continue
+            entry = self._active_table.get(event_name)
+            if entry is not None and entry[0] == held[0] and held[1] in entry[2::2]:
+                continue
+            del self._held[event_name]
+            releases.append(held[1])
+        return releases
+    
+    def _install_profile(self, profile: CompiledProfile):
+        """Point the engine's lookup state at a compiled profile"""
+        self._profile = profile
+        self._tables = profile.tables
+        self._chord_bits = profile.chord_bits
+        self._chords = profile.chords
+        self._seq_columns = profile.seq_columns
+        self._seq_width = len(profile.seq_columns)
+        self._seq_delta = profile.seq_delta
+        self._seq_windows = profile.seq_windows
+        self._seq_outputs = profile.seq_outputs
+        self._combo_events = profile.combo_events
+        
+        self._layer_stack = [name for name in self._layer_stack if name in self._tables]
+        self._select_active_layer()
+        self._chord_mask = 0
+        self._seq_state = 0
+    
+    def get_config(self) -> Dict[str, Any]:
+        """
+        Get the current configuration as stored in the JSON file
+        
+        Returns:
+            Configuration dictionary
+        """
+        config = {
+            'device_name': self.device_name,
+            'mappings': self.mappings
+        }
+        if self.layers:
+            config['layers'] = {
+                name: {'mappings': mappings}
+                for name, mappings in self.layers.items()
+            }
+        if self.chords:
+            config['chords'] = self.chords
+        if self.sequences:
+            config['sequences'] = self.sequences
+        if self.axis_filters:
+            config['axis_filters'] = self.axis_filters
+        return config
+    
+    def read_config(self, path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Read and parse the configuration file without applying it
+        
+        Args:
+            path: File to read instead of the engine's config_path
+            
+        Returns:
+            Configuration dictionary, or None if it could not be read
+        """
+        try:
+            with open(path or self.config_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to read config: {e}")
+            return None
+    
     def load_config(self) -> bool:
         """
         Load mapping configuration from JSON file
         
+        An unchanged file is loaded from the compiled cache, skipping
+        parsing and compilation.
+        
         Returns:
             True if successful, False otherwise
         """
@@ -89,15 +365,27 @@ class MappingEngine:
                 logger.warning(f"Config file not found: {self.config_path}")
                 self.create_default_config()
                 return True
-                
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                
-            self.device_name = config.get('device_name', 'Unknown Device')
-            self.mappings = config.get('mappings', {})
-            
-            logger.info(f"Loaded configuration for {self.device_name}")
+            
+            start = time.perf_counter()
+            data = self.config_path.read_bytes()
+            cached = self.load_compiled(data) if self.compiled_cache else None
+            if cached is not None:
+                config, profile = cached
+            else:
+                config = json.loads(data)
+                profile = self.build_profile(config)
+                if self.compiled_cache:
+                    self.store_compiled(data, config, profile)
+            self.swap_profile(config, profile)
+            load_ms = (time.perf_counter() - start) * 1000
+            
+            logger.info(f"Loaded configuration for {self.device_name} "
+                        f"({'compiled cache' if cached else 'compiled'}, {load_ms:.1f} ms)")
             logger.info(f"Total mappings: {len(self.mappings)}")
+            if self.layers:
+                logger.info(f"Layers: {', '.join(self.layers)}")
+            if self.chords or self.sequences:
+                logger.info(f"Chords: {len(self.chords)}, sequences: {len(self.sequences)}")
             
             return True
             
@@ -112,25 +400,125 @@ class MappingEngine:
         Returns:
             True if successful, False otherwise
         """
+        return self.write_config(self.get_config())
+    
+    def write_config(self, config: Dict[str, Any], path: Optional[Path] = None) -> bool:
+        """
+        Atomically replace the config file with a configuration
+        
+        The file is written to a temporary file in the same directory,
+        synced once and renamed over the old one, so after a crash or
+        power loss the file holds either the old or the new configuration.
+        Does not touch engine state and is safe to call from any thread.
+        
+        Args:
+            config: Configuration dictionary
+            path: File to write instead of the engine's config_path
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        import tempfile  # Only needed when writing
+        
+        path = Path(path or self.config_path)
+        tmp_path = None
         try:
             # Ensure config directory exists
-            self.config_path.parent.mkdir(parents=True, exist_ok=True)
+            path.parent.mkdir(parents=True, exist_ok=True)
             
-            config = {
-                'device_name': self.device_name,
-                'mappings': self.mappings
-            }
+            data = json.dumps(config, indent=2, ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix='.tmp', dir=path.parent)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            # Keep the permissions and owner of the file being replaced
+            try:
+                st = os.stat(path)
+                os.chmod(tmp_path, stat.S_IMODE(st.st_mode))
+                if os.geteuid() == 0:
+                    os.chown(tmp_path, st.st_uid, st.st_gid)
+            except FileNotFoundError:
+                os.chmod(tmp_path, 0o644)
             
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-                
-            logger.info(f"Saved configuration to {self.config_path}")
+            os.replace(tmp_path, path)
+            logger.info(f"Saved configuration to {path}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to save config: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
             return False
     
+    @classmethod
+    def tables_version(cls) -> str:
+        """Get a digest of everything besides the config that compiled profiles depend on"""
+        if cls._tables_version is None:
+            tables = (COMPILER_VERSION, marshal.version, sorted(cls.KEY_MAP.items()),
+                      sorted(cls.MODIFIER_MAP.items()), sorted(cls.TEXT_KEY_MAP.items()),
+                      cls.MACRO_TAP_MS, cls.MACRO_GAP_MS, cls.SEQUENCE_WINDOW_MS)
+            cls._tables_version = hashlib.sha256(repr(tables).encode()).hexdigest()[:16]
+        return cls._tables_version
+    
+    @property
+    def compiled_cache_path(self) -> Path:
+        """File holding the compiled form of the config file"""
+        return self.config_path.with_name(f".{self.config_path.name}.compiled")
+    
+    def _compiled_key(self, data: bytes) -> bytes:
+        return hashlib.sha256(self.tables_version().encode() + b'\0' + data).digest()
+    
+    def load_compiled(self, data: bytes) -> Optional[tuple]:
+        """
+        Get the cached compiled profile of a config file's content
+        
+        Args:
+            data: Raw content of the config file
+            
+        Returns:
+            (config, profile), or None if there is no matching cache entry
+        """
+        path = self.compiled_cache_path
+        try:
+            with open(path, 'rb') as f:
+                key, config, profile = marshal.loads(f.read())
+            if key != self._compiled_key(data):
+                return None
+            return config, CompiledProfile.from_data(profile)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable compiled config cache {path}: {e}")
+            return None
+    
+    def store_compiled(self, data: bytes, config: Dict[str, Any], profile: CompiledProfile):
+        """
+        Save the compiled profile of a config file's content for the next load
+        
+        The cache is only an optimization: it is replaced atomically but not
+        synced, and a damaged file is simply recompiled.
+        
+        Args:
+            data: Raw content of the config file
+            config: The parsed configuration
+            profile: build_profile(config)
+        """
+        import tempfile  # Only needed when writing
+        
+        path = self.compiled_cache_path
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=f"{path.name}.", suffix='.tmp', dir=path.parent)
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump((self._compiled_key(data), config, profile.to_data()), f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write compiled config cache {path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    
     def create_default_config(self):
         """Create a default configuration file"""
         self.device_name = "Default Gamepad"
@@ -178,6 +566,10 @@ class MappingEngine:
                 "description": "D-pad Up/Down"
             }
         }
+        self.layers = {}
+        self.chords = []
+        self.sequences = []
+        self.compile()
         
         self.save_config()
         logger.info("Created default configuration")
@@ -250,12 +642,16 @@ class MappingEngine:
             logger.warning(f"Unknown key: {key_name}")
             return {}
             
-        return {
+        event = {
             'type': 'keyboard',
             'keycode': keycode,
             'pressed': bool(value),
             'modifier': 0
         }
+        if mapping.get('turbo'):
+            # Auto-fire rate in Hz while the input is held
+            event['turbo'] = float(mapping['turbo'])
+        return event
     
     def process_keyboard_combo_mapping(self, mapping: Dict[str, Any], value: int) -> Dict[str, Any]:
         """
@@ -331,10 +727,447 @@ class MappingEngine:
             'modifier': 0
         }
     
+    def compile_entry(self, event_name: str, mapping: Dict[str, Any],
+                      layer_names=None, events=None) -> Optional[tuple]:
+        """
+        Compile a single mapping into a dispatch entry
+        
+        Output events are built once here so translating an input event
+        is a table lookup instead of re-parsing the mapping.
+        
+        Args:
+            event_name: Name of the input event (used for diagnostics)
+            mapping: Mapping configuration
+            layer_names: Layers that 'layer' mappings may refer to
+                         (default: the engine's current layers)
+            events: Output events of the profile being built, see shared_event()
+            
+        Returns:
+            Dispatch entry tuple or None if the mapping is unusable
+        """
+        mapping_type = mapping.get('type')
+        
+        if mapping_type == 'keyboard':
+            press = self.process_keyboard_mapping(mapping, 1)
+            if not press:
+                return None
+            return (KIND_KEYBOARD, self.shared_event(events, press),
+                    self.shared_event(events, self.process_keyboard_mapping(mapping, 0)))
+        elif mapping_type == 'keyboard_combo':
+            press = self.process_keyboard_combo_mapping(mapping, 1)
+            if not press:
+                return None
+            return (KIND_COMBO, self.shared_event(events, press),
+                    self.shared_event(events, self.process_keyboard_combo_mapping(mapping, 0)))
+        elif mapping_type in ('dpad_horizontal', 'dpad_vertical'):
+            axis_type = mapping_type.split('_', 1)[1]
+            positive = self.shared_event(events, self.process_dpad_mapping(mapping, 1, axis_type)) or None
+            negative = self.shared_event(events, self.process_dpad_mapping(mapping, -1, axis_type)) or None
+            if positive is None and negative is None:
+                return None
+            return (KIND_DPAD, positive, self.shared_event(events, self._release_of(positive)),
+                    negative, self.shared_event(events, self._release_of(negative)))
+        elif mapping_type == 'macro':
+            timeline = self.compile_macro(event_name, mapping, events)
+            if not timeline:
+                return None
+            return (KIND_MACRO, {'type': 'macro', 'name': event_name, 'timeline': timeline})
+        elif mapping_type == 'layer':
+            layer_name = mapping.get('layer')
+            mode = mapping.get('mode', 'hold')
+            if layer_name not in (self.layers if layer_names is None else layer_names):
+                logger.warning(f"{event_name}: unknown layer '{layer_name}'")
+                return None
+            if mode not in self.LAYER_MODES:
+                logger.warning(f"{event_name}: unknown layer mode '{mode}'")
+                return None
+            return (KIND_LAYER, layer_name, mode)
+        else:
+            logger.warning(f"{event_name}: unknown mapping type: {mapping_type}")
+            return None
+    
+    def compile_macro(self, event_name: str, mapping: Dict[str, Any], events=None) -> tuple:
+        """
+        Compile macro steps into a timeline of output events
+        
+        Supported steps:
+            {"key": "A", "hold": 100}          press and release a key
+            {"combo": ["LEFTCTRL", "C"]}       press and release a combo
+            {"text": "Hello!"}                 type a string
+            {"delay": 250}                     wait
+        "hold" is optional and defaults to the mapping's "tap_ms".
+        
+        Args:
+            event_name: Name of the input event (used for diagnostics)
+            mapping: Macro mapping configuration
+            events: Output events of the profile being built, see shared_event()
+            
+        Returns:
+            Tuple of (offset_seconds, output_event) sorted by offset
+        """
+        tap_ms = mapping.get('tap_ms', self.MACRO_TAP_MS)
+        gap_ms = mapping.get('gap_ms', self.MACRO_GAP_MS)
+        timeline = []
+        t = 0
+        
+        def tap(press, hold_ms):
+            nonlocal t
+            timeline.append((t / 1000.0, self.shared_event(events, press)))
+            timeline.append(((t + hold_ms) / 1000.0, self.shared_event(events, self._release_of(press))))
+            t += hold_ms + gap_ms
+        
+        for step in mapping.get('steps', []):
+            hold_ms = step.get('hold', tap_ms)
+            if 'delay' in step:
+                t += step['delay']
+            elif 'key' in step:
+                press = self.process_keyboard_mapping(step, 1)
+                if press:
+                    tap(press, hold_ms)
+            elif 'combo' in step:
+                press = self.process_keyboard_combo_mapping(step, 1)
+                if press:
+                    tap(press, hold_ms)
+            elif 'text' in step:
+                for char in step['text']:
+                    key_name, shifted = self.TEXT_KEY_MAP.get(char, (char, char.isupper()))
+                    keycode = self.translate_key(key_name)
+                    if keycode is None:
+                        logger.warning(f"{event_name}: cannot type character {char!r}")
+                        continue
+                    tap({
+                        'type': 'keyboard',
+                        'keycode': keycode,
+                        'pressed': True,
+                        'modifier': self.MODIFIER_MAP['LEFTSHIFT'] if shifted else 0
+                    }, hold_ms)
+            else:
+                logger.warning(f"{event_name}: unknown macro step: {step}")
+        
+        timeline.sort(key=lambda item: item[0])
+        return tuple(timeline)
+    
+    @staticmethod
+    def shared_event(events: Optional[Dict[tuple, Dict[str, Any]]],
+                     event: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Get the shared instance of a compiled output event
+        
+        Events are never modified once compiled, so every table, layer,
+        chord and sequence of a profile producing the same output shares
+        one dictionary. The events belong to the profile and go away with it.
+        
+        Args:
+            events: Events of the profile being built, by content (None = no sharing)
+            event: Output event dictionary (not modified afterwards)
+            
+        Returns:
+            An equal dictionary shared within the profile
+        """
+        if not event or events is None:
+            return event
+        key = tuple((name, tuple(value) if isinstance(value, list) else value)
+                    for name, value in event.items())
+        return events.setdefault(key, event)
+    
+    @staticmethod
+    def _release_of(press_event: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Build the release counterpart of a keyboard press event"""
+        if press_event is None:
+            return None
+        release = dict(press_event)
+        release['pressed'] = False
+        return release
+    
+    def compile_table(self, mappings: Dict[str, Dict[str, Any]], layer_names=None,
+                      events=None) -> Dict[str, tuple]:
+        """
+        Compile a mapping dict into a dispatch table
+        
+        Args:
+            mappings: Mapping configurations keyed by event name
+            layer_names: Layers that 'layer' mappings may refer to
+            events: Output events of the profile being built, see shared_event()
+            
+        Returns:
+            Dispatch table keyed by event name
+        """
+        table = {}
+        for event_name, mapping in mappings.items():
+            entry = self.compile_entry(event_name, mapping, layer_names, events)
+            if entry is not None:
+                table[event_name] = entry
+        return table
+    
+    def build_profile(self, config: Dict[str, Any]) -> CompiledProfile:
+        """
+        Compile a configuration into dispatch tables and recognizers
+        
+        Layers are transparent: each layer table starts from the base table
+        and overrides only the events the layer defines, so a lookup in any
+        layer is a single dict access. Safe to call from any thread.
+        
+        Args:
+            config: Configuration dictionary as stored in the JSON file
+            
+        Returns:
+            Compiled profile
+        """
+        layers = {
+            name: layer.get('mappings', {})
+            for name, layer in config.get('layers', {}).items()
+        }
+        
+        events: Dict[tuple, Dict[str, Any]] = {}
+        
+        base = self.compile_table(config.get('mappings', {}), layers, events)
+        tables = {self.BASE_LAYER: base}
+        for layer_name, layer_mappings in layers.items():
+            table = dict(base)
+            table.update(self.compile_table(layer_mappings, layers, events))
+            tables[layer_name] = table
+        
+        chord_bits, chords = self.compile_chords(config.get('chords', []), layers, events)
+        columns, delta, windows, outputs = self.compile_sequences(
+            config.get('sequences', []), layers, events)
+        
+        # Only these events pay for chord/sequence recognition
+        combo_events = set(chord_bits)
+        for token in columns:
+            if token in self.DIRECTION_TOKENS.values():
+                combo_events.update(self.HAT_AXES)
+            else:
+                combo_events.add(token)
+        
+        return CompiledProfile(tables, chord_bits, chords, columns, delta,
+                               windows, outputs, frozenset(combo_events))
+    
+    def current_profile(self) -> Optional[CompiledProfile]:
+        """Get the compiled profile currently installed"""
+        return self._profile
+    
+    def memory_structures(self) -> Dict[str, Any]:
+        """
+        Get the engine's data structures for a memory report
+        
+        Returns:
+            Compiled tables, configuration and per-input runtime state by name
+        """
+        return {
+            'compiled_tables': self._profile,
+            'config': self.get_config(),
+            'runtime_state': (self._held, self._layer_stack, self._hat, self._chord_mask, self._seq_state),
+        }
+    
+    def compile(self):
+        """Recompile the current configuration"""
+        self._install_profile(self.build_profile(self.get_config()))
+    
+    def compile_chords(self, chord_configs: List[Dict[str, Any]], layer_names=None, events=None) -> tuple:
+        """
+        Assign chord buttons to bits and index chords by their bitmask
+        
+        Args:
+            chord_configs: Chord configurations
+            layer_names: Layers that 'layer' outputs may refer to
+            events: Output events of the profile being built, see shared_event()
+            
+        Returns:
+            Tuple of (bit per button, entry per chord bitmask)
+        """
+        bits: Dict[str, int] = {}
+        chords: Dict[int, tuple] = {}
+        
+        for chord in chord_configs:
+            buttons = chord.get('buttons', [])
+            name = '+'.join(buttons)
+            if len(set(buttons)) < 2:
+                logger.warning(f"Chord {name} needs at least two buttons")
+                continue
+            entry = self.compile_entry(name, chord, layer_names, events)
+            if entry is None:
+                continue
+            mask = 0
+            for button in buttons:
+                if button not in bits:
+                    bits[button] = 1 << len(bits)
+                mask |= bits[button]
+            chords[mask] = entry
+        
+        return bits, chords
+    
+    def compile_sequences(self, sequence_configs: List[Dict[str, Any]], layer_names=None,
+                          events=None) -> tuple:
+        """
+        Compile all sequences into one deterministic automaton
+        
+        Sequence steps are button names (matched on press) or D-pad
+        direction tokens (UP, DOWN_RIGHT, ...). The last step must be a
+        button: its press triggers the sequence's output instead of the
+        button's own mapping.
+        
+        Args:
+            sequence_configs: Sequence configurations
+            layer_names: Layers that 'layer' outputs may refer to
+            events: Output events of the profile being built, see shared_event()
+            
+        Returns:
+            Tuple of (token -> column, transition array, step window
+            per state, output per state); the array is empty if there
+            are no sequences
+        """
+        directions = set(self.DIRECTION_TOKENS.values())
+        goto: List[Dict[str, int]] = [{}]
+        windows = [0.0]
+        outputs: List[Optional[tuple]] = [None]
+        
+        # Build the trie
+        for sequence in sequence_configs:
+            steps = sequence.get('steps', [])
+            name = ' '.join(steps)
+            if len(steps) < 2 or steps[-1] in directions:
+                logger.warning(f"Sequence {name} needs two or more steps ending with a button")
+                continue
+            entry = self.compile_entry(name, sequence, layer_names, events)
+            if entry is None:
+                continue
+            window = sequence.get('window_ms', self.SEQUENCE_WINDOW_MS) / 1000.0
+            state = 0
+            for token in steps:
+                next_state = goto[state].get(token)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    windows.append(0.0)
+                    outputs.append(None)
+                    goto[state][token] = next_state
+                state = next_state
+                windows[state] = max(windows[state], window)
+            outputs[state] = entry
+        
+        # Add failure transitions breadth-first so every state has a
+        # complete row; missing tokens lead back to the root (state 0)
+        alphabet = sorted({token for transitions in goto for token in transitions})
+        columns = {token: column for column, token in enumerate(alphabet)}
+        width = len(columns)
+        if not width:
+            return columns, array('H'), array('d', windows), outputs
+        delta = array('H' if len(goto) <= 0xFFFF else 'I', [0]) * (len(goto) * width)
+        for token, next_state in goto[0].items():
+            delta[columns[token]] = next_state
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            if outputs[state] is None:
+                outputs[state] = outputs[fail[state]]
+            row = state * width
+            fallback = fail[state] * width
+            for token, column in columns.items():
+                next_state = goto[state].get(token)
+                if next_state is not None:
+                    fail[next_state] = delta[fallback + column]
+                    delta[row + column] = next_state
+                    queue.append(next_state)
+                else:
+                    delta[row + column] = delta[fallback + column]
+        
+        return columns, delta, array('d', windows), outputs
+    
+    def _match_combo(self, event_name: str, value: int) -> Optional[tuple]:
+        """
+        Feed an event to chord and sequence recognition
+        
+        Args:
+            event_name: Name of the input event
+            value: Value of the input event
+            
+        Returns:
+            Dispatch entry of a completed sequence or chord, or None
+        """
+        token = None
+        axis = self.HAT_AXES.get(event_name)
+        if axis is not None:
+            self._hat[axis] = (value > 0) - (value < 0)
+            token = self.DIRECTION_TOKENS.get((self._hat[0], self._hat[1]))
+        else:
+            bit = self._chord_bits.get(event_name)
+            if bit:
+                if value == 1:
+                    self._chord_mask |= bit
+                elif value == 0:
+                    self._chord_mask &= ~bit
+            if value == 1:
+                token = event_name
+        
+        if token is None:
+            return None
+        
+        entry = None
+        if self._seq_delta:
+            now = time.monotonic()
+            state = self._seq_state
+            if state and now - self._seq_time > self._seq_windows[state]:
+                state = 0
+            column = self._seq_columns.get(token)
+            state = self._seq_delta[state * self._seq_width + column] if column is not None else 0
+            self._seq_time = now
+            entry = self._seq_outputs[state]
+            self._seq_state = 0 if entry is not None else state
+        
+        if entry is None and axis is None:
+            entry = self._chords.get(self._chord_mask)
+        return entry
+    
+    def _select_active_layer(self):
+        """Point the active table at the topmost active layer"""
+        layer = self._layer_stack[-1] if self._layer_stack else self.BASE_LAYER
+        self._active_table = self._tables[layer]
+    
+    def get_active_layer(self) -> str:
+        """Get the name of the currently active layer"""
+        return self._layer_stack[-1] if self._layer_stack else self.BASE_LAYER
+    
+    def get_input_events(self) -> List[str]:
+        """Get every input event name mapped in any layer"""
+        events = set(self._combo_events)
+        for table in self._tables.values():
+            events.update(table)
+        return sorted(events)
+    
+    def activate_layer(self, layer_name: str):
+        """
+        Activate a layer on top of any already active layers
+        
+        Args:
+            layer_name: Name of the layer
+        """
+        if layer_name in self._layer_stack:
+            self._layer_stack.remove(layer_name)
+        self._layer_stack.append(layer_name)
+        self._select_active_layer()
+        logger.debug(f"Layer activated: {layer_name}")
+    
+    def deactivate_layer(self, layer_name: str):
+        """
+        Deactivate a layer
+        
+        Args:
+            layer_name: Name of the layer
+        """
+        if layer_name in self._layer_stack:
+            self._layer_stack.remove(layer_name)
+            self._select_active_layer()
+            logger.debug(f"Layer deactivated: {layer_name}")
+    
     def translate_event(self, event_name: str, value: int) -> Optional[Dict[str, Any]]:
         """
         Translate an input event to an output event
         
+        Presses are looked up in the active layer. Releases undo whatever
+        the matching press produced, even if the layer changed meanwhile.
+        Returned dictionaries are shared and must not be modified.
+        
         Args:
             event_name: Name of the input event
             value: Value of the input event
@@ -342,23 +1175,102 @@ class MappingEngine:
         Returns:
             Output event dictionary or None
         """
-        mapping = self.get_mapping(event_name)
-        if not mapping:
+        held = self._held.pop(event_name, None)
+        
+        combo = None
+        if event_name in self._combo_events:
+            combo = self._match_combo(event_name, value)
+        
+        if value == 0:
+            if held is not None:
+                return self._release_held(held)
+            # Release of an input we never saw pressed
+            entry = self._active_table.get(event_name)
+            if entry is not None and entry[0] in (KIND_KEYBOARD, KIND_COMBO):
+                return entry[2]
             return None
-            
-        mapping_type = mapping.get('type')
         
-        if mapping_type == 'keyboard':
-            return self.process_keyboard_mapping(mapping, value)
-        elif mapping_type == 'keyboard_combo':
-            return self.process_keyboard_combo_mapping(mapping, value)
-        elif mapping_type == 'dpad_horizontal':
-            return self.process_dpad_mapping(mapping, value, 'horizontal')
-        elif mapping_type == 'dpad_vertical':
-            return self.process_dpad_mapping(mapping, value, 'vertical')
-        else:
-            logger.warning(f"Unknown mapping type: {mapping_type}")
+        entry = combo if combo is not None else self._active_table.get(event_name)
+        if entry is None:
+            if held is not None:
+                return self._release_held(held)
             return None
+        
+        kind = entry[0]
+        
+        if kind == KIND_KEYBOARD or kind == KIND_COMBO:
+            if held is not None:
+                # Autorepeat of an input that is still held
+                self._held[event_name] = held
+                return None
+            self._held[event_name] = (kind, entry[2])
+            return entry[1]
+        elif kind == KIND_DPAD:
+            if value > 0:
+                press, release = entry[1], entry[2]
+            else:
+                press, release = entry[3], entry[4]
+            if press is None:
+                return self._release_held(held) if held is not None else None
+            self._held[event_name] = (kind, release)
+            if held is not None and held[1] is not release:
+                # Direction flipped without passing through center
+                return {'type': 'batch', 'events': [held[1], press]}
+            return press
+        elif kind == KIND_MACRO:
+            self._held[event_name] = (kind, None)
+            if held is not None:
+                return None
+            return entry[1]
+        elif kind == KIND_LAYER:
+            layer_name, mode = entry[1], entry[2]
+            if held is not None:
+                # Repeated press of an input that is still held
+                self._held[event_name] = held
+                return None
+            if mode == 'toggle' and layer_name in self._layer_stack:
+                self.deactivate_layer(layer_name)
+            else:
+                self.activate_layer(layer_name)
+            self._held[event_name] = (kind, layer_name, mode)
+            return None
+        
+        return None
+    
+    def _release_held(self, held: tuple) -> Optional[Dict[str, Any]]:
+        """
+        Undo a held press
+        
+        Args:
+            held: Release action recorded when the input was pressed
+            
+        Returns:
+            Output event dictionary or None
+        """
+        if held[0] == KIND_LAYER:
+            if held[2] == 'hold':
+                self.deactivate_layer(held[1])
+            return None
+        return held[1]
+    
+    def release_all_held(self) -> List[Dict[str, Any]]:
+        """
+        Forget every held input and drop all hold-mode layers
+        
+        Returns:
+            Output release events for keys that were held
+        """
+        releases = []
+        for held in self._held.values():
+            if held[0] != KIND_LAYER:
+                releases.append(held[1])
+        self._held.clear()
+        self._layer_stack.clear()
+        self._select_active_layer()
+        self._chord_mask = 0
+        self._seq_state = 0
+        self._hat = [0, 0]
+        return releases
     
     def add_mapping(self, event_name: str, mapping: Dict[str, Any]):
         """
@@ -369,6 +1281,7 @@ class MappingEngine:
             mapping: Mapping configuration
         """
         self.mappings[event_name] = mapping
+        self.compile()
         logger.info(f"Added mapping for {event_name}")
     
     def remove_mapping(self, event_name: str) -> bool:
@@ -383,16 +1296,56 @@ class MappingEngine:
         """
         if event_name in self.mappings:
             del self.mappings[event_name]
+            self.compile()
             logger.info(f"Removed mapping for {event_name}")
             return True
         return False
     
+    def with_mapping_changes(self, changes: Dict[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Get a copy of the configuration with a batch of mapping changes applied
+        
+        Args:
+            changes: Event name -> new mapping, or None to remove the mapping
+            
+        Returns:
+            Configuration dictionary; the engine itself is not modified
+            
+        Raises:
+            ValueError: If any change is malformed or does not compile (nothing is applied)
+        """
+        if not isinstance(changes, dict):
+            raise ValueError("Mapping changes must be an object")
+        for event_name, mapping in changes.items():
+            if mapping is not None and not isinstance(mapping, dict):
+                raise ValueError(f"{event_name}: mapping must be an object or null")
+        
+        # The compiler drops unusable mappings with a warning; a batch
+        # containing one is rejected as a whole instead
+        invalid = [event_name for event_name, mapping in changes.items()
+                   if mapping is not None and self.compile_entry(event_name, mapping) is None]
+        if invalid:
+            raise ValueError(f"Invalid mapping for {', '.join(invalid)}")
+        
+        mappings = dict(self.mappings)
+        for event_name, mapping in changes.items():
+            if mapping is None:
+                mappings.pop(event_name, None)
+            else:
+                mappings[event_name] = mapping
+        
+        config = self.get_config()
+        config['mappings'] = mappings
+        return config
+    
     def get_all_mappings(self) -> Dict[str, Dict[str, Any]]:
         """Get all current mappings"""
         return self.mappings.copy()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     # Test the mapping engine
     engine = MappingEngine()
     
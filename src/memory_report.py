@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Memory Report - Resident memory, top allocators and sizes of the converter's data structures
+"""
+
+import os
+import gc
+import sys
+import json
+import argparse
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# /proc/<pid>/status fields reported, in kB there
+STATUS_FIELDS = {'VmRSS': 'rss', 'VmHWM': 'rss_peak', 'RssAnon': 'rss_anon', 'RssFile': 'rss_file'}
+
+# Containers whose contents count towards a structure's size
+CONTAINERS = (list, tuple, set, frozenset, deque)
+
+
+def process_memory(pid: str = 'self') -> Dict[str, int]:
+    """
+    Get a process's resident memory
+
+    Args:
+        pid: Process id, or 'self'
+
+    Returns:
+        Bytes for 'rss', 'rss_peak', 'rss_anon' and 'rss_file'
+    """
+    memory = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in STATUS_FIELDS:
+                memory[STATUS_FIELDS[name]] = int(value.split()[0]) * 1024
+    return memory
+
+
+def deep_size(root: Any) -> Tuple[int, int]:
+    """
+    Measure a data structure with everything it contains
+
+    Dicts, lists, tuples, sets, deques and objects with __slots__ are
+    followed; anything else (functions, handlers, modules) counts with
+    its own size only, so a structure never pulls in the whole program.
+    An object reachable several times is counted once.
+
+    Args:
+        root: Object to measure
+
+    Returns:
+        (bytes, number of objects)
+    """
+    seen = set()
+    stack = [root]
+    size = count = 0
+    while stack:
+        obj = stack.pop()
+        if obj is None or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        count += 1
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, CONTAINERS):
+            stack.extend(obj)
+        else:
+            for name in getattr(type(obj), '__slots__', ()):
+                stack.append(getattr(obj, name, None))
+    return size, count
+
+
+def set_tracing(enabled: bool):
+    """Start or stop recording allocations with tracemalloc (it slows allocation down)"""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def top_allocations(limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    Get the source lines holding the most memory allocated since tracing started
+
+    Args:
+        limit: Number of lines
+
+    Returns:
+        [{'location', 'size', 'count'}, ...] largest first, or None if not tracing
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    return [
+        {'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+         'size': stat.size, 'count': stat.count}
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+
+def memory_report(structures: Dict[str, Any], top: int = 10) -> Dict[str, Any]:
+    """
+    Build a memory report of this process
+
+    Args:
+        structures: Named data structures to measure with deep_size()
+        top: Allocating lines to list while tracemalloc is tracing
+
+    Returns:
+        Report dictionary (sizes in bytes)
+    """
+    report: Dict[str, Any] = {'pid': os.getpid()}
+    report.update(process_memory())
+    report['python_blocks'] = sys.getallocatedblocks()
+    report['gc_objects'] = len(gc.get_objects())
+    report['structures'] = {}
+    for name, obj in structures.items():
+        size, count = deep_size(obj)
+        report['structures'][name] = {'bytes': size, 'objects': count}
+    report['tracemalloc'] = top_allocations(top)
+    return report
+
+
+def _kib(value: int) -> str:
+    return f"{value / 1024:,.0f} KiB"
+
+
+def format_report(report: Dict[str, Any]) -> List[str]:
+    """Format a memory report for the terminal"""
+    lines = [f"PID {report['pid']}: RSS {_kib(report['rss'])} (peak {_kib(report['rss_peak'])}, "
+             f"anonymous {_kib(report.get('rss_anon', 0))}, file {_kib(report.get('rss_file', 0))})",
+             f"Python: {report['python_blocks']:,} memory blocks, {report['gc_objects']:,} tracked objects"]
+    cache = report.get('profile_cache')
+    if cache:
+        lines.append(f"Profile cache: {cache['profiles']} profiles, {_kib(cache['bytes'])} "
+                     f"of {_kib(cache['max_bytes'])}")
+    if report['structures']:
+        lines += ["", f"{'Structure':<20}{'Size':>14}{'Objects':>10}"]
+        for name, size in report['structures'].items():
+            lines.append(f"{name:<20}{_kib(size['bytes']):>14}{size['objects']:>10,}")
+    if report.get('tracemalloc'):
+        lines += ["", f"{'Size':>12}{'Blocks':>9}  Allocated at"]
+        for entry in report['tracemalloc']:
+            lines.append(f"{_kib(entry['size']):>12}{entry['count']:>9,}  {entry['location']}")
+    elif report.get('tracemalloc') is None:
+        lines += ["", "Allocation tracing is off (--trace on to start it)"]
+    return lines
+
+
+def main():
+    """Print the memory report of a running converter and web interface"""
+    # Imported here so the daemon does not load the client for the report alone
+    sys.path.insert(0, str(Path(__file__).parent))
+    from control_client import ControlClient, ControlError, ControlTimeout, ControlUnavailable, DEFAULT_SOCKET_PATH
+
+    parser = argparse.ArgumentParser(description='Memory report of the running converter')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH,
+                        help=f'Converter control socket (default: {DEFAULT_SOCKET_PATH})')
+    parser.add_argument('--url', default=None,
+                        help='Also report the web interface, e.g. http://127.0.0.1:8080')
+    parser.add_argument('--top', type=int, default=10, help='Allocating source lines to list')
+    parser.add_argument('--trace', choices=['on', 'off'], default=None,
+                        help='Start or stop allocation tracing (tracemalloc) in the processes first')
+    parser.add_argument('--json', action='store_true', help='Print the raw reports')
+    args = parser.parse_args()
+
+    request = {'top': args.top}
+    if args.trace:
+        request['trace'] = args.trace == 'on'
+    reports = {}
+    try:
+        reports['converter'] = ControlClient(args.socket).request('get_memory', **request)
+    except (ControlUnavailable, ControlTimeout, ControlError) as e:
+        print(f"Converter not reachable on {args.socket}: {e}", file=sys.stderr)
+    if args.url:
+        import urllib.request
+        url = args.url.rstrip('/')
+        if 'trace' in request:
+            trace = urllib.request.Request(f"{url}/api/memory/trace", method='POST',
+                                           data=json.dumps({'enabled': request['trace']}).encode(),
+                                           headers={'Content-Type': 'application/json'})
+            urllib.request.urlopen(trace, timeout=10).close()
+        with urllib.request.urlopen(f"{url}/api/memory?top={args.top}", timeout=10) as response:
+            web = json.load(response)
+        if web.get('web'):
+            reports['web interface'] = web['web']
+    if not reports:
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    for name, report in reports.items():
+        print(f"== {name} ==")
+        print('\n'.join(format_report(report)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,38 +4,120 @@ Output Handler - Sends keyboard/mouse events via USB HID Gadget
 """
 
 import os
+import re
+import time
+import select
 import struct
 import logging
+import threading
 from typing import Optional, Dict, Any
-import time
 
-logging.basicConfig(level=logging.INFO)
+from spsc_ring import SPSCRing
+
 logger = logging.getLogger(__name__)
 
+# HID Report Descriptor for a standard keyboard
+KEYBOARD_REPORT_DESC = bytes([
+    0x05, 0x01,  # Usage Page (Generic Desktop)
+    0x09, 0x06,  # Usage (Keyboard)
+    0xA1, 0x01,  # Collection (Application)
+    0x05, 0x07,  # Usage Page (Key Codes)
+    0x19, 0xE0,  # Usage Minimum (224)
+    0x29, 0xE7,  # Usage Maximum (231)
+    0x15, 0x00,  # Logical Minimum (0)
+    0x25, 0x01,  # Logical Maximum (1)
+    0x75, 0x01,  # Report Size (1)
+    0x95, 0x08,  # Report Count (8)
+    0x81, 0x02,  # Input (Data, Variable, Absolute)
+    0x95, 0x01,  # Report Count (1)
+    0x75, 0x08,  # Report Size (8)
+    0x81, 0x01,  # Input (Constant)
+    0x95, 0x05,  # Report Count (5)
+    0x75, 0x01,  # Report Size (1)
+    0x05, 0x08,  # Usage Page (LEDs)
+    0x19, 0x01,  # Usage Minimum (1)
+    0x29, 0x05,  # Usage Maximum (5)
+    0x91, 0x02,  # Output (Data, Variable, Absolute)
+    0x95, 0x01,  # Report Count (1)
+    0x75, 0x03,  # Report Size (3)
+    0x91, 0x01,  # Output (Constant)
+    0x95, 0x06,  # Report Count (6)
+    0x75, 0x08,  # Report Size (8)
+    0x15, 0x00,  # Logical Minimum (0)
+    0x25, 0x65,  # Logical Maximum (101)
+    0x05, 0x07,  # Usage Page (Key Codes)
+    0x19, 0x00,  # Usage Minimum (0)
+    0x29, 0x65,  # Usage Maximum (101)
+    0x81, 0x00,  # Input (Data, Array)
+    0xC0         # End Collection
+])
+
+
+def hidg_index(hidg_device: str) -> int:
+    """Get the function number of a HID gadget device path (/dev/hidgN -> N)"""
+    digits = re.search(r'(\d+)$', hidg_device)
+    return int(digits.group(1)) if digits else 0
+
 
 class USBGadgetOutputHandler:
     """Handles output to USB HID Gadget device"""
     
-    def __init__(self, hidg_device: str = "/dev/hidg0"):
+    # Reports queued for the writer thread before the oldest are dropped
+    RING_SIZE = 64
+    # Time the writer keeps waiting for the host to take queued reports on disconnect
+    FLUSH_TIMEOUT = 1.0
+    
+    def __init__(self, hidg_device: str = "/dev/hidg0", threaded: bool = False):
         """
         Initialize the output handler
         
         Args:
             hidg_device: Path to the HID gadget device
+            threaded: Write reports from a writer thread, so sending
+                      never waits on the USB host
         """
         self.hidg_device = hidg_device
         self.device_fd: Optional[int] = None
         self.current_modifier = 0
         self.pressed_keys = set()
         
-    def setup_usb_gadget(self) -> bool:
+        # Frame coalescing: while a frame is open, state changes only mark
+        # the report dirty and a single report is written by end_frame()
+        self._frame_depth = 0
+        self._frame_dirty = False
+        self._last_report: Optional[bytes] = None
+        
+        # Writer thread: reports are queued on a ring and written in order,
+        # waiting for the host as long as it takes. When the ring is full
+        # the writer sends the latest report (the full key state) once it
+        # has caught up.
+        self.threaded = threaded
+        self._ring: Optional[SPSCRing] = None
+        self._writer: Optional[threading.Thread] = None
+        self._writer_running = False
+        self._resync = False
+        self._flush_deadline = 0.0
+        self.reports_written = 0
+        self.reports_dropped = 0
+        
+    def setup_usb_gadget(self, functions: Optional[int] = None) -> bool:
         """
         Setup USB Gadget mode (requires root privileges)
         This configures the Raspberry Pi as a USB HID keyboard
         
+        Each function appears to the host as a separate keyboard, so
+        several players can share one USB port.
+        
+        Args:
+            functions: Number of keyboard functions (/dev/hidg0, /dev/hidg1, ...)
+                       Default: enough for this handler's device
+        
         Returns:
             True if successful, False otherwise
         """
+        if functions is None:
+            functions = hidg_index(self.hidg_device) + 1
+        
         try:
             # Check if running as root
             if os.geteuid() != 0:
@@ -46,10 +128,29 @@ class USBGadgetOutputHandler:
             configfs = "/sys/kernel/config/usb_gadget"
             gadget_name = "joystick_hid"
             gadget_path = f"{configfs}/{gadget_name}"
+            config_path = f"{gadget_path}/configs/c.1"
             
             # Check if gadget already exists
             if os.path.exists(gadget_path):
-                logger.info("USB Gadget already configured")
+                missing = [index for index in range(functions)
+                           if not os.path.exists(f"{config_path}/hid.usb{index}")]
+                if not missing:
+                    logger.info("USB Gadget already configured")
+                    return True
+                
+                # Functions can only be added while the gadget is unbound
+                with open(f"{gadget_path}/UDC") as f:
+                    udc = f.read().strip()
+                if udc:
+                    with open(f"{gadget_path}/UDC", "w") as f:
+                        f.write("\n")
+                for index in missing:
+                    self._create_hid_function(gadget_path, config_path, index)
+                with open(f"{gadget_path}/UDC", "w") as f:
+                    f.write(udc or os.listdir("/sys/class/udc")[0])
+                
+                logger.info(f"Added keyboard functions {missing} to the USB Gadget")
+                time.sleep(1)
                 return True
             
             # Create gadget directory
@@ -77,7 +178,6 @@ class USBGadgetOutputHandler:
                 f.write("HID Keyboard Converter")
             
             # Create configuration
-            config_path = f"{gadget_path}/configs/c.1"
             os.makedirs(config_path, exist_ok=True)
             
             config_strings_path = f"{config_path}/strings/0x409"
@@ -88,60 +188,9 @@ class USBGadgetOutputHandler:
             with open(f"{config_path}/MaxPower", "w") as f:
                 f.write("250")  # 250 mA
             
-            # Create HID function (keyboard)
-            function_path = f"{gadget_path}/functions/hid.usb0"
-            os.makedirs(function_path, exist_ok=True)
-            
-            with open(f"{function_path}/protocol", "w") as f:
-                f.write("1")  # Keyboard protocol
-            with open(f"{function_path}/subclass", "w") as f:
-                f.write("1")  # Boot interface subclass
-            with open(f"{function_path}/report_length", "w") as f:
-                f.write("8")  # 8 bytes for keyboard report
-            
-            # HID Report Descriptor for a standard keyboard
-            report_desc = bytes([
-                0x05, 0x01,  # Usage Page (Generic Desktop)
-                0x09, 0x06,  # Usage (Keyboard)
-                0xA1, 0x01,  # Collection (Application)
-                0x05, 0x07,  # Usage Page (Key Codes)
-                0x19, 0xE0,  # Usage Minimum (224)
-                0x29, 0xE7,  # Usage Maximum (231)
-                0x15, 0x00,  # Logical Minimum (0)
-                0x25, 0x01,  # Logical Maximum (1)
-                0x75, 0x01,  # Report Size (1)
-                0x95, 0x08,  # Report Count (8)
-                0x81, 0x02,  # Input (Data, Variable, Absolute)
-                0x95, 0x01,  # Report Count (1)
-                0x75, 0x08,  # Report Size (8)
-                0x81, 0x01,  # Input (Constant)
-                0x95, 0x05,  # Report Count (5)
-                0x75, 0x01,  # Report Size (1)
-                0x05, 0x08,  # Usage Page (LEDs)
-                0x19, 0x01,  # Usage Minimum (1)
-                0x29, 0x05,  # Usage Maximum (5)
-                0x91, 0x02,  # Output (Data, Variable, Absolute)
-                0x95, 0x01,  # Report Count (1)
-                0x75, 0x03,  # Report Size (3)
-                0x91, 0x01,  # Output (Constant)
-                0x95, 0x06,  # Report Count (6)
-                0x75, 0x08,  # Report Size (8)
-                0x15, 0x00,  # Logical Minimum (0)
-                0x25, 0x65,  # Logical Maximum (101)
-                0x05, 0x07,  # Usage Page (Key Codes)
-                0x19, 0x00,  # Usage Minimum (0)
-                0x29, 0x65,  # Usage Maximum (101)
-                0x81, 0x00,  # Input (Data, Array)
-                0xC0         # End Collection
-            ])
-            
-            with open(f"{function_path}/report_desc", "wb") as f:
-                f.write(report_desc)
-            
-            # Link function to configuration
-            link_path = f"{config_path}/hid.usb0"
-            if not os.path.exists(link_path):
-                os.symlink(function_path, link_path)
+            # Create HID functions (keyboards)
+            for index in range(functions):
+                self._create_hid_function(gadget_path, config_path, index)
             
             # Enable the gadget
             udc_list = os.listdir("/sys/class/udc")
@@ -163,6 +212,25 @@ class USBGadgetOutputHandler:
             logger.error(f"Failed to setup USB Gadget: {e}")
             return False
     
+    def _create_hid_function(self, gadget_path: str, config_path: str, index: int):
+        """Create keyboard function hid.usb<index> (/dev/hidg<index>) and link it to the configuration"""
+        function_path = f"{gadget_path}/functions/hid.usb{index}"
+        os.makedirs(function_path, exist_ok=True)
+        
+        with open(f"{function_path}/protocol", "w") as f:
+            f.write("1")  # Keyboard protocol
+        with open(f"{function_path}/subclass", "w") as f:
+            f.write("1")  # Boot interface subclass
+        with open(f"{function_path}/report_length", "w") as f:
+            f.write("8")  # 8 bytes for keyboard report
+        with open(f"{function_path}/report_desc", "wb") as f:
+            f.write(KEYBOARD_REPORT_DESC)
+        
+        # Link function to configuration
+        link_path = f"{config_path}/hid.usb{index}"
+        if not os.path.exists(link_path):
+            os.symlink(function_path, link_path)
+    
     def connect(self) -> bool:
         """
         Connect to the HID gadget device
@@ -188,6 +256,9 @@ class USBGadgetOutputHandler:
             self.device_fd = os.open(self.hidg_device, os.O_WRONLY | os.O_NONBLOCK)
             logger.info(f"Connected to HID device: {self.hidg_device}")
             
+            if self.threaded:
+                self.start_writer()
+            
             return True
             
         except Exception as e:
@@ -196,6 +267,7 @@ class USBGadgetOutputHandler:
     
     def disconnect(self):
         """Disconnect from the HID device"""
+        self.stop_writer()
         if self.device_fd is not None:
             os.close(self.device_fd)
             self.device_fd = None
@@ -209,21 +281,134 @@ class USBGadgetOutputHandler:
             modifier: Modifier keys bitmask
             keycode: Key code (0 for key release)
         """
+        # HID keyboard report format:
+        # Byte 0: Modifier keys
+        # Byte 1: Reserved (0)
+        # Bytes 2-7: Up to 6 simultaneous key presses
+        self.write_report(struct.pack('8B', modifier, 0, keycode, 0, 0, 0, 0, 0))
+    
+    def build_report(self) -> bytes:
+        """
+        Build a keyboard report from the currently pressed keys
+        
+        Returns:
+            8-byte HID keyboard report
+        """
+        keys = list(self.pressed_keys)[:6]
+        keys.extend([0] * (6 - len(keys)))
+        return struct.pack('8B', self.current_modifier, 0, *keys)
+    
+    def write_report(self, report: bytes):
+        """
+        Write a raw report to the HID device
+        
+        Args:
+            report: 8-byte HID keyboard report
+        """
         if self.device_fd is None:
             logger.error("Not connected to HID device")
             return
+        
+        if self._ring is not None:
+            self._last_report = report
+            if not self._ring.push(report):
+                # The host is not keeping up; intermediate reports are lost
+                self.reports_dropped += 1
+                self._resync = True
+                self._ring.wake()
+            return
             
         try:
-            # HID keyboard report format:
-            # Byte 0: Modifier keys
-            # Byte 1: Reserved (0)
-            # Bytes 2-7: Up to 6 simultaneous key presses
-            report = struct.pack('8B', modifier, 0, keycode, 0, 0, 0, 0, 0)
             os.write(self.device_fd, report)
+            self._last_report = report
+            self.reports_written += 1
             
         except Exception as e:
             logger.error(f"Failed to send report: {e}")
     
+    def start_writer(self):
+        """Start the writer thread"""
+        if self._writer is not None:
+            return
+        self._ring = SPSCRing(self.RING_SIZE, 8)
+        self._writer_running = True
+        self._writer = threading.Thread(target=self._writer_loop, name='hid-writer', daemon=True)
+        self._writer.start()
+    
+    def stop_writer(self):
+        """Write the queued reports (for at most FLUSH_TIMEOUT) and stop the writer thread"""
+        if self._writer is None:
+            return
+        self._flush_deadline = time.monotonic() + self.FLUSH_TIMEOUT
+        self._writer_running = False
+        self._ring.wake()
+        self._writer.join(self.FLUSH_TIMEOUT + 0.5)
+        self._writer = None
+        self._ring.close()
+        self._ring = None
+    
+    def _writer_loop(self):
+        """Writer thread: write queued reports in order"""
+        ring = self._ring
+        poller = select.poll()
+        poller.register(self.device_fd, select.POLLOUT)
+        while True:
+            record = ring.peek()
+            if record is not None:
+                self._write_waiting(record, poller)
+                ring.advance()
+            elif self._resync:
+                # Reports were dropped; the latest holds the complete state
+                self._resync = False
+                self._write_waiting(self._last_report, poller)
+            elif not self._writer_running:
+                break
+            else:
+                ring.wait()
+    
+    def _write_waiting(self, report, poller):
+        """Writer thread: write one report, waiting while the host has not taken the previous one"""
+        while True:
+            try:
+                os.write(self.device_fd, report)
+                self.reports_written += 1
+                return
+            except BlockingIOError:
+                if not self._writer_running and time.monotonic() > self._flush_deadline:
+                    return
+                poller.poll(100)
+            except OSError as e:
+                logger.error(f"Failed to send report: {e}")
+                return
+    
+    def report_state(self):
+        """Send the current key state, or defer it while a frame is open"""
+        if self._frame_depth:
+            self._frame_dirty = True
+            return
+        report = self.build_report()
+        if report != self._last_report:
+            self.write_report(report)
+    
+    def begin_frame(self):
+        """
+        Start coalescing state changes into a single report
+        
+        Frames nest; the report is sent when the outermost frame ends.
+        A press and release of the same key within one frame cancel out,
+        so each input report and each timed output gets a frame of its own.
+        """
+        self._frame_depth += 1
+    
+    def end_frame(self):
+        """End a frame and send one report if the key state changed"""
+        if self._frame_depth == 0:
+            return
+        self._frame_depth -= 1
+        if self._frame_depth == 0 and self._frame_dirty:
+            self._frame_dirty = False
+            self.report_state()
+    
     def press_key(self, keycode: int, modifier: int = 0):
         """
         Press a key
@@ -234,7 +419,7 @@ class USBGadgetOutputHandler:
         """
         self.current_modifier = modifier
         self.pressed_keys.add(keycode)
-        self.send_report(modifier, keycode)
+        self.report_state()
         logger.debug(f"Key pressed: {keycode} (modifier: {modifier})")
     
     def release_key(self, keycode: int):
@@ -246,14 +431,10 @@ class USBGadgetOutputHandler:
         """
         self.pressed_keys.discard(keycode)
         
-        # If no keys pressed, send empty report
+        # Modifiers are released together with the last key
         if not self.pressed_keys:
             self.current_modifier = 0
-            self.send_report(0, 0)
-        else:
-            # Send report with remaining pressed keys
-            remaining_key = next(iter(self.pressed_keys))
-            self.send_report(self.current_modifier, remaining_key)
+        self.report_state()
             
         logger.debug(f"Key released: {keycode}")
     
@@ -261,6 +442,8 @@ class USBGadgetOutputHandler:
         """Release all pressed keys"""
         self.pressed_keys.clear()
         self.current_modifier = 0
+        self._frame_depth = 0
+        self._frame_dirty = False
         self.send_report(0, 0)
         logger.debug("All keys released")
     
@@ -276,7 +459,11 @@ class USBGadgetOutputHandler:
             
         event_type = event.get('type')
         
-        if event_type == 'keyboard':
+        if event_type == 'batch':
+            for sub_event in event.get('events', []):
+                self.process_output_event(sub_event)
+                
+        elif event_type == 'keyboard':
             keycode = event.get('keycode')
             if keycode is None:
                 return
@@ -307,6 +494,8 @@ class USBGadgetOutputHandler:
 if __name__ == "__main__":
     import sys
     
+    logging.basicConfig(level=logging.INFO)
+    
     # Test the output handler
     handler = USBGadgetOutputHandler()
     
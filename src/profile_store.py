@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Profile Store - Library of named mapping profiles with version history
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from memory_report import deep_size
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DB = 'profiles.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    game TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    device TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    description TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    last_used REAL
+);
+CREATE INDEX IF NOT EXISTS profiles_game ON profiles (game);
+CREATE INDEX IF NOT EXISTS profiles_device ON profiles (device);
+CREATE INDEX IF NOT EXISTS profiles_last_used ON profiles (last_used);
+CREATE TABLE IF NOT EXISTS profile_versions (
+    profile_id INTEGER NOT NULL REFERENCES profiles (id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    comment TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    PRIMARY KEY (profile_id, version)
+) WITHOUT ROWID;
+"""
+
+PROFILE_COLUMNS = 'name, game, device, description, version, created, updated, last_used'
+
+
+class ProfileNotFound(KeyError):
+    """No profile (or profile version) with the requested name"""
+
+    def __str__(self) -> str:
+        return f"Profile not found: {self.args[0]}"
+
+
+class ProfileStore:
+    """
+    Named profiles in an SQLite database
+
+    Every save adds a version; the profile row points at the latest one,
+    so older versions stay available for history and rollback. Names,
+    games and devices are indexed and compared case-insensitively.
+    The database is opened on first use and may be shared between
+    threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_PROFILE_DB):
+        """
+        Initialize the store
+
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        self.path = Path(path)
+        self._db = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        if self._db is None:
+            # Imported on first use so the daemon does not pay for it unless profiles are used
+            import sqlite3
+            db = sqlite3.connect(str(self.path), check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            # WAL lets the web server read while the daemon writes, and
+            # NORMAL sync keeps SD card writes to one fsync per checkpoint
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA foreign_keys=ON')
+            db.execute('PRAGMA busy_timeout=2000')
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def _row(row) -> Dict[str, Any]:
+        return dict(zip(row.keys(), row))
+
+    def save(self, name: str, config: Dict[str, Any], game: Optional[str] = None,
+             device: Optional[str] = None, description: Optional[str] = None,
+             comment: str = '') -> int:
+        """
+        Store a configuration as the new version of a profile
+
+        Args:
+            name: Profile name (created if it does not exist)
+            config: Configuration dictionary
+            game: Game the profile is for (None = keep current)
+            device: Controller the profile is for (None = keep current, or
+                the config's device_name for a new profile)
+            description: Free text (None = keep current)
+            comment: Note stored with this version
+
+        Returns:
+            The new version number
+        """
+        # Names are stored without surrounding whitespace, and looked up the same way
+        name = name.strip() if name else ''
+        if not name:
+            raise ValueError("Profile name must not be empty")
+        if not isinstance(config, dict):
+            raise ValueError("Profile configuration must be an object")
+        data = json.dumps(config, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+
+        with self._lock:
+            db = self._connect()
+            with db:
+                row = db.execute('SELECT id, version FROM profiles WHERE name = ?', (name,)).fetchone()
+                if row is None:
+                    version = 1
+                    profile_id = db.execute(
+                        'INSERT INTO profiles (name, game, device, description, version, created, updated)'
+                        ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (name, game or '', device or config.get('device_name', ''),
+                         description or '', version, now, now)).lastrowid
+                else:
+                    profile_id, version = row['id'], row['version'] + 1
+                    db.execute(
+                        'UPDATE profiles SET version = ?, updated = ?, game = COALESCE(?, game),'
+                        ' device = COALESCE(?, device), description = COALESCE(?, description)'
+                        ' WHERE id = ?',
+                        (version, now, game, device, description, profile_id))
+                db.execute('INSERT INTO profile_versions (profile_id, version, config, comment, created)'
+                           ' VALUES (?, ?, ?, ?, ?)', (profile_id, version, data, comment, now))
+        logger.info(f"Saved profile {name} version {version}")
+        return version
+
+    def get(self, name: str, version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Get a profile's metadata and configuration
+
+        Args:
+            name: Profile name
+            version: Version to get (None = latest)
+
+        Returns:
+            Metadata dictionary with the version's 'config', 'comment'
+            and 'saved' time; 'version' is the returned version
+
+        Raises:
+            ProfileNotFound: No such profile or version
+        """
+        name = name.strip()
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                f'SELECT p.id, {", ".join("p." + c for c in PROFILE_COLUMNS.split(", "))},'
+                ' v.version AS config_version, v.config, v.comment, v.created AS saved'
+                ' FROM profiles p JOIN profile_versions v ON v.profile_id = p.id'
+                ' AND v.version = COALESCE(?, p.version) WHERE p.name = ?',
+                (version, name)).fetchone()
+        if row is None:
+            raise ProfileNotFound(f"{name} version {version}" if version else name)
+        profile = self._row(row)
+        profile['latest_version'] = profile['version']
+        profile['version'] = profile.pop('config_version')
+        profile['config'] = json.loads(profile['config'])
+        return profile
+
+    def head(self, name: str) -> Tuple[int, int]:
+        """
+        Get a profile's id and latest version number
+
+        Ids are never reused, so (id, version) identifies one saved
+        configuration even across deleting and recreating a profile.
+
+        Raises:
+            ProfileNotFound: No such profile
+        """
+        name = name.strip()
+        with self._lock:
+            row = self._connect().execute('SELECT id, version FROM profiles WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise ProfileNotFound(name)
+        return row[0], row[1]
+
+    def search(self, query: Optional[str] = None, game: Optional[str] = None,
+               device: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Find profiles
+
+        Args:
+            query: Text contained in the name, game or description
+            game: Exact game (case-insensitive)
+            device: Exact controller name (case-insensitive)
+            limit: Maximum number of results
+
+        Returns:
+            Profile metadata dictionaries ordered by name
+        """
+        clauses, params = [], []
+        if query:
+            clauses.append("(name LIKE ? ESCAPE '\\' OR game LIKE ? ESCAPE '\\'"
+                           " OR description LIKE ? ESCAPE '\\')")
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            params += [pattern] * 3
+        if game is not None:
+            clauses.append('game = ?')
+            params.append(game)
+        if device is not None:
+            clauses.append('device = ?')
+            params.append(device)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._connect().execute(
+                f'SELECT {PROFILE_COLUMNS} FROM profiles{where} ORDER BY name LIMIT ?',
+                params + [limit]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def recently_used(self, limit: int) -> List[Tuple[str, int, int]]:
+        """Get (name, id, latest version) of the most recently activated profiles"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT name, id, version FROM profiles WHERE last_used IS NOT NULL'
+                ' ORDER BY last_used DESC LIMIT ?', (limit,)).fetchall()
+        return [(row[0], row[1], row[2]) for row in rows]
+
+    def history(self, name: str) -> List[Dict[str, Any]]:
+        """
+        Get the saved versions of a profile, newest first
+
+        Raises:
+            ProfileNotFound: No such profile
+        """
+        name = name.strip()
+        with self._lock:
+            db = self._connect()
+            rows = db.execute(
+                'SELECT v.version, v.comment, v.created, length(v.config) AS size'
+                ' FROM profile_versions v JOIN profiles p ON p.id = v.profile_id'
+                ' WHERE p.name = ? ORDER BY v.version DESC', (name,)).fetchall()
+        if not rows:
+            raise ProfileNotFound(name)
+        return [self._row(row) for row in rows]
+
+    def mark_used(self, name: str):
+        """Record that a profile was activated"""
+        name = name.strip()
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute('UPDATE profiles SET last_used = ? WHERE name = ?', (time.time(), name))
+
+    def delete(self, name: str) -> bool:
+        """
+        Remove a profile and all its versions
+
+        Returns:
+            True if removed, False if not found
+        """
+        name = name.strip()
+        with self._lock:
+            db = self._connect()
+            with db:
+                removed = db.execute('DELETE FROM profiles WHERE name = ?', (name,)).rowcount > 0
+        if removed:
+            logger.info(f"Deleted profile {name}")
+        return removed
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class CompiledProfileCache:
+    """
+    Recently used profiles kept parsed and compiled
+
+    Keyed by profile id and version (see ProfileStore.head), so saving or
+    recreating a profile never hits a stale entry.
+    Safe to fill from a worker thread while the event loop reads it.
+
+    The cache is bounded both in profiles and in bytes. Only the compiled
+    tables are kept as objects; the configuration, needed again only when
+    the profile is activated, is kept as compressed JSON. The newest entry
+    is always kept, even when it alone is over the byte budget.
+    """
+
+    def __init__(self, capacity: int = 16, max_bytes: int = 8 * 1024 * 1024):
+        """
+        Initialize the cache
+
+        Args:
+            capacity: Profiles kept before the least recently used is evicted
+            max_bytes: Memory the entries may take before the least recently used is evicted
+        """
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # key -> (compressed config, compiled profile, size in bytes)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def full(self) -> bool:
+        """Whether another entry would evict one"""
+        return len(self._entries) >= self.capacity or self.nbytes >= self.max_bytes
+
+    def get(self, profile_id: int, version: int) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """Get (config, compiled profile), or None if not cached"""
+        key = (profile_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(zlib.decompress(entry[0])), entry[1]
+
+    def put(self, profile_id: int, version: int, config: Dict[str, Any], profile: Any):
+        """Cache a compiled profile"""
+        key = (profile_id, version)
+        blob = zlib.compress(json.dumps(config, separators=(',', ':')).encode())
+        size = len(blob) + deep_size(profile)[0]
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[2]
+            self._entries[key] = (blob, profile, size)
+            self.nbytes += size
+            while len(self._entries) > 1 and (len(self._entries) > self.capacity
+                                              or self.nbytes > self.max_bytes):
+                self.nbytes -= self._entries.popitem(last=False)[1][2]
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of cached profiles and the bytes they take"""
+        with self._lock:
+            return {'profiles': len(self._entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def main():
+    """Command line interface to the profile library"""
+    # Imported here so the daemon does not load the client for the store alone
+    sys.path.insert(0, str(Path(__file__).parent))
+    from control_client import ControlClient, ControlError, ControlTimeout, ControlUnavailable
+    from mapping_engine import MappingEngine
+
+    parser = argparse.ArgumentParser(description='Joystick Converter profile library')
+    parser.add_argument('--db', default=str(Path('config') / DEFAULT_PROFILE_DB),
+                        help='Profile database (default: config/profiles.db)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ls = subparsers.add_parser('list', help='List or search profiles')
+    ls.add_argument('query', nargs='?', help='Text in the name, game or description')
+    ls.add_argument('--game', help='Only profiles for this game')
+    ls.add_argument('--device', help='Only profiles for this controller')
+
+    show = subparsers.add_parser('show', help='Print a profile configuration')
+    show.add_argument('name')
+    show.add_argument('--version', type=int, help='Version to print (default: latest)')
+
+    history = subparsers.add_parser('history', help='List the saved versions of a profile')
+    history.add_argument('name')
+
+    save = subparsers.add_parser('save', help='Save a config file, or the running configuration, as a profile')
+    save.add_argument('name')
+    save.add_argument('file', nargs='?', help='Configuration file (default: the running configuration)')
+    save.add_argument('--game', help='Game the profile is for')
+    save.add_argument('--device', help='Controller the profile is for')
+    save.add_argument('--description', help='Description')
+    save.add_argument('-m', '--comment', default='', help='Note for this version')
+
+    activate = subparsers.add_parser('activate', help='Switch the converter to a profile')
+    activate.add_argument('name')
+    activate.add_argument('--version', type=int, help='Version to activate (default: latest)')
+    activate.add_argument('--config', default='config/mappings.json',
+                          help='Config file to write when the converter is not running')
+
+    delete = subparsers.add_parser('delete', help='Remove a profile and its history')
+    delete.add_argument('name')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    store = ProfileStore(args.db)
+    control = ControlClient()
+
+    try:
+        if args.command == 'list':
+            for profile in store.search(args.query, args.game, args.device):
+                print(f"{profile['name']:<32} v{profile['version']:<4} "
+                      f"{profile['game'] or '-':<24} {profile['device'] or '-'}")
+        elif args.command == 'show':
+            print(json.dumps(store.get(args.name, args.version)['config'], indent=2, ensure_ascii=False))
+        elif args.command == 'history':
+            for entry in store.history(args.name):
+                saved = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created']))
+                print(f"v{entry['version']:<4} {saved}  {entry['size']:>7} B  {entry['comment']}")
+        elif args.command == 'save':
+            if args.file:
+                with open(args.file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            else:
+                config = control.request('get_config')
+            version = store.save(args.name, config, args.game, args.device, args.description, args.comment)
+            print(f"Saved {args.name} version {version}")
+        elif args.command == 'activate':
+            try:
+                result = control.request('activate_profile', name=args.name, version=args.version)
+                print(f"Activated {args.name} version {result['version']} in "
+                      f"{result['switch_ms']:.2f} ms ({'cached' if result['cached'] else 'compiled'})")
+            except ControlUnavailable:
+                # Not running: make it the configuration the converter starts with
+                profile = store.get(args.name, args.version)
+                engine = MappingEngine(args.config)
+                if not engine.write_config(profile['config']):
+                    sys.exit(1)
+                store.mark_used(args.name)
+                print(f"Converter not running; wrote {args.name} version {profile['version']} to {args.config}")
+        elif args.command == 'delete':
+            if not store.delete(args.name):
+                raise ProfileNotFound(args.name)
+            print(f"Deleted {args.name}")
+    except (ProfileNotFound, ControlUnavailable, ControlTimeout, ControlError, ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
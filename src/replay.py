@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Replay - Record gamepad input to a capture file and play it back through the converter
+"""
+
+import sys
+import time
+import select
+import signal
+import struct
+import logging
+import argparse
+from collections import namedtuple
+from pathlib import Path
+from typing import List, Tuple
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from evdev import ecodes
+
+from input_handler import JoystickInputHandler
+from loop_profiler import DEFAULT_PROFILE_OUTPUT
+from main import JoystickConverter
+from output_handler import USBGadgetOutputHandler
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b'JCAP'
+CAPTURE_VERSION = 1
+
+# File header: magic, version, length of the UTF-8 device name that follows
+CAPTURE_HEADER = struct.Struct('<4sHH')
+
+# One input event: seconds since the first event, type, code, value
+CAPTURE_RECORD = struct.Struct('<dHHi')
+
+ReplayEvent = namedtuple('ReplayEvent', 'type code value')
+
+
+def record(device_path: str, output: str, duration: float) -> int:
+    """
+    Record every event of an input device, including SYN reports
+
+    Args:
+        device_path: Input device (None = the first gamepad found)
+        output: Capture file to write
+        duration: Stop after this many seconds (0 = at Ctrl+C)
+
+    Returns:
+        Number of events recorded
+    """
+    handler = JoystickInputHandler(device_path)
+    if not handler.connect():
+        raise OSError(f"could not open input device {device_path or '(auto-detect)'}")
+    device = handler.device
+
+    name = device.name.encode()
+    count = 0
+    first = None
+    deadline = time.monotonic() + duration if duration > 0 else None
+    with open(output, 'wb') as f:
+        f.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, len(name)) + name)
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not select.select([device.fd], [], [], timeout)[0]:
+                    continue
+                try:
+                    events = list(device.read())
+                except BlockingIOError:
+                    continue
+                for event in events:
+                    timestamp = event.timestamp()
+                    if first is None:
+                        first = timestamp
+                    f.write(CAPTURE_RECORD.pack(timestamp - first, event.type, event.code, event.value))
+                    count += 1
+        except KeyboardInterrupt:
+            pass
+        finally:
+            handler.disconnect()
+    return count
+
+
+def load_capture(path: str) -> Tuple[str, List[Tuple[float, List[ReplayEvent]]]]:
+    """
+    Read a capture file
+
+    Args:
+        path: Capture file written by record()
+
+    Returns:
+        (device name, batches), each batch being the time of its first
+        event and the events up to and including the next SYN_REPORT,
+        as the converter would have read them from the device
+
+    Raises:
+        ValueError: If the file is not a capture file
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < CAPTURE_HEADER.size:
+        raise ValueError(f"{path} is not a capture file")
+    magic, version, name_length = CAPTURE_HEADER.unpack_from(data)
+    if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+        raise ValueError(f"{path} is not a version {CAPTURE_VERSION} capture file")
+    offset = CAPTURE_HEADER.size + name_length
+    name = data[CAPTURE_HEADER.size:offset].decode(errors='replace')
+
+    batches: List[Tuple[float, List[ReplayEvent]]] = []
+    events: List[ReplayEvent] = []
+    start = 0.0
+    end = offset + (len(data) - offset) // CAPTURE_RECORD.size * CAPTURE_RECORD.size
+    for timestamp, event_type, code, value in CAPTURE_RECORD.iter_unpack(data[offset:end]):
+        if not events:
+            start = timestamp
+        events.append(ReplayEvent(event_type, code, value))
+        if event_type == ecodes.EV_SYN and code == ecodes.SYN_REPORT:
+            batches.append((start, events))
+            events = []
+    if events:
+        batches.append((start, events))
+    return name, batches
+
+
+class Replayer:
+    """
+    Feeds captured batches to a converter from its event loop
+
+    Each batch runs as its own loop callback, framed like a device read,
+    so macro and turbo timers interleave with the input as they would
+    live. Batches are either paced like the recording (optionally sped
+    up) or played back to back as fast as the loop goes.
+    """
+
+    def __init__(self, converter: JoystickConverter, batches: List[Tuple[float, List[ReplayEvent]]],
+                 speed: float = 1.0, repeat: int = 1):
+        """
+        Initialize the replayer
+
+        Args:
+            converter: Converter set up for replay (see setup_replay())
+            batches: Batches from load_capture()
+            speed: Playback speed relative to the recording (0 = no pacing)
+            repeat: Times to play the capture
+        """
+        self.converter = converter
+        self.batches = batches
+        self.speed = speed
+        self.repeat = repeat
+        self.events = 0
+        self.late_max = 0.0
+        self._round = 0
+        self._start = 0.0
+
+    def start(self):
+        """Schedule the first batch"""
+        self._round = 0
+        self._start = self.converter.loop.time()
+        self.converter.loop.call_soon_threadsafe(self._play, 0)
+
+    def _play(self, index: int):
+        """Loop callback: hand one batch to the input handler and schedule the next"""
+        converter = self.converter
+        loop = converter.loop
+        if self.speed:
+            self.late_max = max(self.late_max, loop.time() - self._due(index))
+
+        input_handler = converter.input_handler
+        begin, end = input_handler.batch_callbacks
+        events = self.batches[index][1]
+        begin()
+        try:
+            for event in events:
+                input_handler.process_event(event)
+        finally:
+            end()
+        self.events += len(events)
+
+        index += 1
+        if index == len(self.batches):
+            self._round += 1
+            if self._round >= self.repeat:
+                loop.stop()
+                return
+            index = 0
+            self._start = loop.time()
+        if self.speed:
+            loop.call_at(self._due(index), self._play, index)
+        else:
+            loop.call_later(0, self._play, index)
+
+    def _due(self, index: int) -> float:
+        """Loop time batch index should be played at"""
+        return self._start + (self.batches[index][0] - self.batches[0][0]) / self.speed
+
+
+def setup_replay(converter: JoystickConverter, output: str, output_thread: bool) -> bool:
+    """
+    Prepare a converter for replay: everything setup() does except opening the gamepad
+
+    Args:
+        converter: Converter to prepare
+        output: File or HID gadget device to write reports to (None = no output)
+        output_thread: Write reports from a writer thread
+
+    Returns:
+        True if successful
+    """
+    if not converter.mapping_engine.load_config():
+        logger.error("Failed to load configuration")
+        return False
+    if output:
+        converter.output_handler = USBGadgetOutputHandler(output, threaded=output_thread)
+        if not converter.output_handler.connect():
+            return False
+        converter.output_available = True
+    converter.input_handler.set_batch_callbacks(converter.begin_frame, converter.end_frame)
+    converter.input_handler.loop = converter.loop
+    converter.register_callbacks()
+    return True
+
+
+def play(args) -> int:
+    """Replay a capture through the converter and report throughput"""
+    try:
+        name, batches = load_capture(args.capture)
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot read capture: {e}")
+        return 1
+    if not batches:
+        logger.error("Capture contains no events")
+        return 1
+
+    converter = JoystickConverter(args.config, watch_config=False, control_socket=None, state_file=None,
+                                  stall_threshold=0, notify_systemd=False,
+                                  profile_output=args.profile_output or DEFAULT_PROFILE_OUTPUT,
+                                  profile_interval=args.profile_interval_ms / 1000)
+    if not setup_replay(converter, args.output, args.output_thread):
+        return 1
+
+    # As in the converter: kill -USR1 toggles profiling during playback
+    signal.signal(signal.SIGUSR1,
+                  lambda signum, frame: converter.loop.call_soon_threadsafe(converter.toggle_profiling))
+
+    replayer = Replayer(converter, batches, 0 if args.fast else args.speed, args.repeat)
+    if args.profile:
+        converter.start_profiling()
+    replayer.start()
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    converter.loop.run()
+    elapsed = time.perf_counter() - start
+    cpu = time.thread_time() - cpu_start
+    converter.stop_profiling()
+
+    print(f"Replayed {args.capture} ({name}): {replayer.events} events in {len(batches)} batches "
+          f"x {args.repeat}")
+    print(f"  wall {elapsed:.3f} s, loop CPU {cpu:.3f} s, {replayer.events / elapsed:.0f} events/s, "
+          f"{cpu / replayer.events * 1e6:.1f} us CPU per event")
+    print(f"  frame handling: mean {converter.frame_time_total / max(1, converter.frames) * 1e6:.1f} us, "
+          f"max {converter.frame_time_max * 1e6:.1f} us")
+    output = converter.output_handler
+    print(f"  mapped {converter.mapped_events}, output events {converter.output_events}, "
+          f"reports written {output.reports_written if output else 0}, "
+          f"dropped {output.reports_dropped if output else 0}")
+    if not args.fast:
+        print(f"  latest batch {replayer.late_max * 1000:.2f} ms behind schedule")
+
+    converter.macro_player.cancel_all()
+    converter.turbo.stop_all()
+    if output:
+        output.release_all()
+        output.disconnect()
+    converter.profile_store.close()
+    return 0
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Record gamepad input and replay it through the converter')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rec = subparsers.add_parser('record', help='Record input device events to a capture file')
+    rec.add_argument('output', help='Capture file to write')
+    rec.add_argument('--input-device', default=None, help='Input device (default: first gamepad)')
+    rec.add_argument('--duration', type=float, default=0, help='Seconds to record (default: until Ctrl+C)')
+
+    rep = subparsers.add_parser('play', help='Play a capture through the converter')
+    rep.add_argument('capture', help='Capture file from the record command')
+    rep.add_argument('--config', default='config/mappings.json', help='Configuration to load')
+    rep.add_argument('--output', default='/dev/null',
+                     help='File or HID gadget device reports are written to (default: /dev/null)')
+    rep.add_argument('--output-thread', action='store_true', help='Write reports from a writer thread')
+    rep.add_argument('--speed', type=float, default=1.0, help='Playback speed relative to the recording')
+    rep.add_argument('--fast', action='store_true', help='Play batches back to back without pacing')
+    rep.add_argument('--repeat', type=int, default=1, help='Times to play the capture')
+    rep.add_argument('--profile', action='store_true', help='Profile the event loop during playback')
+    rep.add_argument('--profile-output', default=None, metavar='PREFIX',
+                     help=f'Write the profile to PREFIX.collapsed and PREFIX.txt (default: {DEFAULT_PROFILE_OUTPUT})')
+    rep.add_argument('--profile-interval-ms', type=float, default=1, help='Profiler sample interval (default: 1)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'record':
+        print("Recording... press Ctrl+C to stop" if not args.duration else f"Recording for {args.duration:g} s...")
+        try:
+            count = record(args.input_device, args.output, args.duration)
+        except OSError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        print(f"Recorded {count} events to {args.output}")
+        sys.exit(0)
+
+    sys.exit(play(args))
+
+
+if __name__ == "__main__":
+    main()
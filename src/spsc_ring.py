@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+SPSC Ring - Bounded single-producer/single-consumer queue of fixed-size records
+"""
+
+import os
+import select
+from typing import Optional
+
+
+class SPSCRing:
+    """
+    Lock-free ring of fixed-size records between two threads
+
+    Records are copied into one buffer allocated up front. The producer
+    only moves the tail and the consumer only moves the head, each after
+    its slot access is complete, so neither side ever takes a lock or
+    allocates. Indices grow without wrapping and are masked on access.
+
+    A consumer with nothing to do sleeps in wait(). It announces that
+    before checking the ring a last time, and the producer only signals
+    the wakeup descriptor when a consumer is waiting, so pushes to a busy
+    consumer cost no system call.
+    """
+
+    def __init__(self, capacity: int, record_size: int):
+        """
+        Initialize the ring
+
+        Args:
+            capacity: Number of records (a power of two)
+            record_size: Bytes per record
+        """
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self.capacity = capacity
+        self.record_size = record_size
+        self._buffer = bytearray(capacity * record_size)
+        self._view = memoryview(self._buffer)
+        self._mask = capacity - 1
+        self._head = 0
+        self._tail = 0
+        self.high_water = 0
+
+        self._waiting = False
+        self._wake_fd = os.eventfd(0, os.EFD_CLOEXEC | os.EFD_NONBLOCK)
+        self._poll = select.poll()
+        self._poll.register(self._wake_fd, select.POLLIN)
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def push(self, record: bytes) -> bool:
+        """
+        Append a record (producer thread only)
+
+        Args:
+            record: Exactly record_size bytes
+
+        Returns:
+            False if the ring is full and the record was not queued
+        """
+        tail = self._tail
+        used = tail - self._head
+        if used > self._mask:
+            return False
+        offset = (tail & self._mask) * self.record_size
+        self._buffer[offset:offset + self.record_size] = record
+        self._tail = tail + 1
+        if used >= self.high_water:
+            self.high_water = used + 1
+        if self._waiting:
+            self.wake()
+        return True
+
+    def peek(self) -> Optional[memoryview]:
+        """
+        Get the oldest record without removing it (consumer thread only)
+
+        Returns:
+            View of the record, valid until advance(), or None if empty
+        """
+        head = self._head
+        if head == self._tail:
+            return None
+        offset = (head & self._mask) * self.record_size
+        return self._view[offset:offset + self.record_size]
+
+    def advance(self):
+        """Release the record returned by peek() (consumer thread only)"""
+        self._head += 1
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        Sleep until a record is pushed or wake() is called (consumer thread only)
+
+        Args:
+            timeout: Seconds to wait at most (None = no limit)
+        """
+        self._waiting = True
+        try:
+            if self._head == self._tail:
+                self._poll.poll(None if timeout is None else int(timeout * 1000))
+        finally:
+            self._waiting = False
+        try:
+            os.eventfd_read(self._wake_fd)
+        except BlockingIOError:
+            pass
+
+    def wake(self):
+        """Wake the consumer; safe from any thread"""
+        os.eventfd_write(self._wake_fd, 1)
+
+    def close(self):
+        """Release the wakeup descriptor"""
+        if self._wake_fd >= 0:
+            os.close(self._wake_fd)
+            self._wake_fd = -1
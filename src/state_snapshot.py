@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+State Snapshot - Live controller state in a shared memory-mapped file
+"""
+
+import os
+import mmap
+import time
+import struct
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = '/dev/shm/joystick-converter.state' if os.path.isdir('/dev/shm') \
+    else '/tmp/joystick-converter.state'
+
+# Event types and code ranges (linux/input-event-codes.h)
+EV_KEY = 0x01
+EV_ABS = 0x03
+KEY_CNT = 0x300
+ABS_CNT = 0x40
+
+MAGIC = b'JCST'
+VERSION = 1
+MAX_OUTPUT_KEYS = 14
+LAYER_NAME_SIZE = 32
+
+# Little-endian fixed layout:
+#   magic, version, total size, seqlock counter, frame counter,
+#   wall-clock time of the frame, writer pid (0 = stopped),
+#   active layer name, output modifier byte, output key count,
+#   output keycodes, padding, button bitmap (one bit per EV_KEY code),
+#   axis values (one int32 per EV_ABS code)
+LAYOUT = struct.Struct(f'<4sHHQQdI{LAYER_NAME_SIZE}sBB{MAX_OUTPUT_KEYS}s2x'
+                       f'{KEY_CNT // 8}s{ABS_CNT}i')
+SEQ_OFFSET = 8
+_SEQ = struct.Struct('<Q')
+
+
+class StateSnapshotWriter:
+    """
+    Publishes controller state to a memory-mapped file once per frame
+
+    Input events only update private state; commit() copies it into the
+    shared block under a seqlock. The counter is odd while the block is
+    being written and advances by two per update, so readers take a copy
+    and retry if the counter was odd or changed meanwhile. Readers never
+    signal the writer, so any number of them cost the daemon nothing.
+
+    The file is reused rather than replaced when the daemon restarts,
+    so long-running readers keep a valid mapping.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        """
+        Initialize the writer
+
+        Args:
+            path: File to map, preferably on a tmpfs such as /dev/shm
+        """
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._seq = 0
+        self._frame = 0
+        self._dirty = False
+        self._buttons = bytearray(KEY_CNT // 8)
+        self._axes = [0] * ABS_CNT
+        self._layer = ''
+        self._layer_bytes = b''
+        self._modifier = 0
+        self._keys = b''
+
+    def open(self) -> bool:
+        """
+        Create or reuse the state file and map it
+
+        Returns:
+            True if the snapshot is available
+        """
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size != LAYOUT.size:
+                    os.ftruncate(fd, LAYOUT.size)
+                self._mm = mmap.mmap(fd, LAYOUT.size)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.error(f"Failed to open state snapshot {self.path}: {e}")
+            return False
+
+        # Continue the counter of a previous run so readers never see it go back
+        magic, _, size, seq = struct.unpack_from('<4sHHQ', self._mm, 0)
+        self._seq = seq + (seq & 1) if magic == MAGIC and size == LAYOUT.size else 0
+        self._dirty = True
+        self.commit()
+        logger.info(f"Publishing controller state to {self.path}")
+        return True
+
+    def update_input(self, event_type: int, code: int, value: int):
+        """
+        Record a raw input event
+
+        Args:
+            event_type: evdev event type
+            code: evdev event code
+            value: Event value
+        """
+        if event_type == EV_KEY:
+            if code < KEY_CNT:
+                byte, bit = code >> 3, 1 << (code & 7)
+                if value:
+                    self._buttons[byte] |= bit
+                else:
+                    self._buttons[byte] &= ~bit & 0xFF
+                self._dirty = True
+        elif event_type == EV_ABS:
+            if code < ABS_CNT:
+                self._axes[code] = value
+                self._dirty = True
+
+    def set_layer(self, name: str):
+        """Record the active mapping layer"""
+        if name != self._layer:
+            self._layer = name
+            self._layer_bytes = name.encode()[:LAYER_NAME_SIZE]
+            self._dirty = True
+
+    def set_output(self, modifier: int, keycodes: Iterable[int]):
+        """Record the modifier byte and keycodes currently held on the output"""
+        keys = bytes(sorted(keycodes)[:MAX_OUTPUT_KEYS])
+        if modifier != self._modifier or keys != self._keys:
+            self._modifier = modifier
+            self._keys = keys
+            self._dirty = True
+
+    def commit(self, running: bool = True):
+        """
+        Publish the recorded state if anything changed since the last commit
+
+        Args:
+            running: False marks the snapshot as no longer updated
+        """
+        if self._mm is None or not self._dirty:
+            return
+        mm = self._mm
+        self._frame += 1
+        seq = self._seq + 1
+        _SEQ.pack_into(mm, SEQ_OFFSET, seq)
+        LAYOUT.pack_into(mm, 0, MAGIC, VERSION, LAYOUT.size, seq, self._frame, time.time(),
+                         os.getpid() if running else 0, self._layer_bytes,
+                         self._modifier, len(self._keys), self._keys,
+                         bytes(self._buttons), *self._axes)
+        self._seq = seq + 1
+        _SEQ.pack_into(mm, SEQ_OFFSET, self._seq)
+        self._dirty = False
+
+    def close(self):
+        """Publish an idle state and unmap the file"""
+        if self._mm is None:
+            return
+        self._buttons = bytearray(KEY_CNT // 8)
+        self._modifier = 0
+        self._keys = b''
+        self._dirty = True
+        self.commit(running=False)
+        self._mm.close()
+        self._mm = None
+
+
+class StateSnapshotReader:
+    """Reads consistent copies of the controller state published by the daemon"""
+
+    MAX_RETRIES = 1000
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        """
+        Initialize the reader
+
+        Args:
+            path: State file written by StateSnapshotWriter
+        """
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+
+    def _open(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                if os.fstat(fd).st_size < LAYOUT.size:
+                    return False
+                self._mm = mmap.mmap(fd, LAYOUT.size, prot=mmap.PROT_READ)
+            finally:
+                os.close(fd)
+        except OSError:
+            return False
+        return True
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """
+        Take a consistent copy of the current state
+
+        Returns:
+            State dictionary, or None if no snapshot is available
+        """
+        if self._mm is None and not self._open():
+            return None
+
+        mm = self._mm
+        for _ in range(self.MAX_RETRIES):
+            seq = _SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            if seq & 1:
+                continue  # Writer is mid-update
+            data = mm[:LAYOUT.size]
+            if _SEQ.unpack_from(mm, SEQ_OFFSET)[0] == seq:
+                return decode_snapshot(data)
+        return None
+
+    def close(self):
+        """Unmap the file"""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+def decode_snapshot(data: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Decode a copy of the state block
+
+    Args:
+        data: LAYOUT.size bytes taken from the state file
+
+    Returns:
+        State dictionary, or None if the block is not a valid snapshot
+    """
+    fields = LAYOUT.unpack(data)
+    magic, version, size, seq, frame, timestamp, pid, layer, modifier, key_count, keys, buttons = fields[:12]
+    if magic != MAGIC or version != VERSION or size != LAYOUT.size:
+        return None
+    return {
+        'seq': seq,
+        'frame': frame,
+        'timestamp': timestamp,
+        'running': pid != 0,
+        'pid': pid,
+        'active_layer': layer.rstrip(b'\0').decode(errors='replace'),
+        'output_modifier': modifier,
+        'output_keys': list(keys[:key_count]),
+        'buttons': [byte * 8 + bit for byte, bits in enumerate(buttons) if bits
+                    for bit in range(8) if bits >> bit & 1],
+        'axes': list(fields[12:]),
+    }
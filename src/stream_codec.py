@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Stream Codec - Compact binary framing of input events for the web UI
+"""
+
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+FRAME_VERSION = 1
+
+# Frame header: version, dropped event count (saturated), base timestamp (s)
+FRAME_HEADER = struct.Struct('<BHd')
+
+# Timestamp resolution of the per-event time deltas
+TIME_UNIT = 0.0001
+
+
+def _write_varint(out: bytearray, value: int):
+    """Append an unsigned LEB128 integer"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class BinaryEventEncoder:
+    """
+    Encodes batches of input events for one stream client
+
+    Each frame is a FRAME_HEADER followed by three LEB128 varints per
+    event: the event's numeric id, the zigzag-encoded change of its value
+    since the previous event with the same id, and the time since the
+    previous event in TIME_UNIT steps (the first event is relative to
+    the header's base timestamp). Typical events take 3-5 bytes.
+
+    Ids are assigned per client the first time an event name is seen;
+    encode() returns the new id -> name pairs so they can be sent to the
+    client ahead of the frame that uses them.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._values: List[int] = []
+
+    def encode(self, events: List[Dict[str, Any]],
+               dropped: int = 0) -> Tuple[Optional[Dict[int, str]], bytes]:
+        """
+        Encode a batch of events
+
+        Args:
+            events: Events with 'event_name', 'value' and 'timestamp'
+            dropped: Events the client missed before this batch
+
+        Returns:
+            (new id -> name assignments or None, frame bytes)
+        """
+        new_names = None
+        base = events[0]['timestamp'] if events else 0.0
+        out = bytearray(FRAME_HEADER.pack(FRAME_VERSION, min(dropped, 0xFFFF), base))
+
+        ids = self._ids
+        values = self._values
+        previous = base
+        for event in events:
+            name = event['event_name']
+            event_id = ids.get(name)
+            if event_id is None:
+                event_id = ids[name] = len(values)
+                values.append(0)
+                if new_names is None:
+                    new_names = {}
+                new_names[event_id] = name
+
+            value = int(event['value'])
+            delta = value - values[event_id]
+            values[event_id] = value
+
+            timestamp = event['timestamp']
+            ticks = max(0, round((timestamp - previous) / TIME_UNIT))
+            previous += ticks * TIME_UNIT
+
+            _write_varint(out, event_id)
+            _write_varint(out, (delta << 1) ^ (delta >> 63))
+            _write_varint(out, ticks)
+
+        return new_names, bytes(out)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Supervisor - Runs one converter pipeline per gamepad for several players
+"""
+
+import os
+import re
+import sys
+import json
+import signal
+import logging
+import argparse
+import threading
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from control_client import ControlClient, LocalControlClient, ControlError, ControlTimeout, ControlUnavailable
+from control_server import DEFAULT_SOCKET_PATH
+from event_loop import EventLoop
+from loop_watchdog import NOTIFY_ENVIRONMENT, notify, watchdog_interval
+from output_handler import USBGadgetOutputHandler, hidg_index
+from state_snapshot import DEFAULT_STATE_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PIPELINES_PATH = 'config/pipelines.json'
+
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _per_pipeline(path: str, name: str) -> str:
+    """Derive a pipeline's own file from a default path: x.sock -> x-<name>.sock"""
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}-{name}{path.suffix}"))
+
+
+def load_pipelines(path: str) -> List[Dict[str, Any]]:
+    """
+    Read and validate the pipeline definitions
+
+    The file holds {"pipelines": [...]}, one object per player:
+    name (required), input_device (required with more than one
+    pipeline), config (required), hidg, cpus, control_socket,
+    state_file, profile_db and output_thread. Relative config paths are resolved
+    against the file's directory.
+
+    Args:
+        path: Pipelines file
+
+    Returns:
+        Pipeline dictionaries with every option filled in
+
+    Raises:
+        ValueError: The file is not a valid pipeline definition
+    """
+    path = Path(path)
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not read {path}: {e}")
+
+    entries = data.get('pipelines') if isinstance(data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: 'pipelines' must be a non-empty list")
+
+    pipelines = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"{path}: pipeline {index} must be an object")
+        name = entry.get('name')
+        if not isinstance(name, str) or not NAME_PATTERN.match(name):
+            raise ValueError(f"{path}: pipeline {index} needs a name of letters, digits, '-' and '_'")
+        if not entry.get('config'):
+            raise ValueError(f"{path}: pipeline {name} has no 'config'")
+        if len(entries) > 1 and not entry.get('input_device'):
+            # Auto-detection would give every pipeline the same gamepad
+            raise ValueError(f"{path}: pipeline {name} has no 'input_device'")
+
+        cpus = entry.get('cpus')
+        if isinstance(cpus, int):
+            cpus = str(cpus)
+        elif isinstance(cpus, list):
+            cpus = ','.join(str(cpu) for cpu in cpus)
+
+        pipelines.append({
+            'name': name,
+            'input_device': entry.get('input_device'),
+            'config': str(path.parent / Path(entry['config']).expanduser()),
+            'hidg': entry.get('hidg', f"/dev/hidg{index}"),
+            'cpus': cpus,
+            'control_socket': entry.get('control_socket', _per_pipeline(DEFAULT_SOCKET_PATH, name)),
+            'state_file': entry.get('state_file', _per_pipeline(DEFAULT_STATE_PATH, name)),
+            'profile_db': entry.get('profile_db'),
+            'output_thread': bool(entry.get('output_thread', False)),
+        })
+
+    for key in ('name', 'input_device', 'hidg', 'control_socket', 'state_file'):
+        values = [pipeline[key] for pipeline in pipelines if pipeline[key]]
+        duplicates = sorted({value for value in values if values.count(value) > 1})
+        if duplicates:
+            raise ValueError(f"{path}: pipelines share the same {key}: {', '.join(duplicates)}")
+    return pipelines
+
+
+class ProcessWorker:
+    """A pipeline running as a converter child process"""
+
+    def __init__(self, pipeline: Dict[str, Any], loop: EventLoop, on_exit: Callable[['ProcessWorker', int], None]):
+        """
+        Initialize the worker
+
+        Args:
+            pipeline: Pipeline dictionary from load_pipelines()
+            loop: Supervisor event loop the exit is reported on
+            on_exit: Called with (worker, exit code) when the pipeline stops
+        """
+        self.pipeline = pipeline
+        self.loop = loop
+        self.on_exit = on_exit
+        self.process: Optional[subprocess.Popen] = None
+        self._pidfd: Optional[int] = None
+
+    def command(self) -> List[str]:
+        """Build the converter command line"""
+        pipeline = self.pipeline
+        command = [sys.executable, str(Path(__file__).parent / 'main.py'), pipeline['config'],
+                   '--name', pipeline['name']]
+        if pipeline['input_device']:
+            command += ['--input-device', pipeline['input_device']]
+        command += ['--hidg', pipeline['hidg']] if pipeline['hidg'] else ['--no-output']
+        if pipeline['cpus']:
+            command += ['--cpus', pipeline['cpus']]
+        command += ['--control-socket', pipeline['control_socket']] if pipeline['control_socket'] else ['--no-control']
+        command += ['--state-file', pipeline['state_file']] if pipeline['state_file'] else ['--no-state-file']
+        if pipeline['profile_db']:
+            command += ['--profile-db', pipeline['profile_db']]
+        if pipeline['output_thread']:
+            command.append('--output-thread')
+        return command
+
+    def start(self):
+        """Launch the converter process"""
+        # systemd notifications are the supervisor's own; systemd rejects them from children
+        env = {key: value for key, value in os.environ.items() if key not in NOTIFY_ENVIRONMENT}
+        self.process = subprocess.Popen(self.command(), env=env)
+        # Readable once the process exits, so the loop needs no polling
+        self._pidfd = os.pidfd_open(self.process.pid)
+        self.loop.add_reader(self._pidfd, self._on_exited)
+
+    def _on_exited(self):
+        self._release()
+        self.on_exit(self, self.process.wait())
+
+    def _release(self):
+        self.loop.remove_reader(self._pidfd)
+        os.close(self._pidfd)
+        self._pidfd = None
+
+    def is_running(self) -> bool:
+        return self._pidfd is not None
+
+    def stop(self, timeout: float = 5.0):
+        """Terminate the process and wait for it"""
+        if not self.is_running():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Pipeline {self.pipeline['name']} did not stop, killing it")
+            self.process.kill()
+            self.process.wait()
+        self._release()
+
+    def metrics(self) -> Optional[Dict[str, Any]]:
+        """Query the pipeline's metrics over its control socket (None = unavailable)"""
+        if not self.is_running() or not self.pipeline['control_socket']:
+            return None
+        client = ControlClient(self.pipeline['control_socket'], timeout=1.0)
+        try:
+            return client.request('get_metrics')
+        except (ControlUnavailable, ControlTimeout, ControlError):
+            return None
+        finally:
+            client.close()
+
+
+class ThreadWorker:
+    """A pipeline running on a thread of the supervisor process"""
+
+    def __init__(self, pipeline: Dict[str, Any], loop: EventLoop, on_exit: Callable[['ThreadWorker', int], None]):
+        """
+        Initialize the worker
+
+        Args:
+            pipeline: Pipeline dictionary from load_pipelines()
+            loop: Supervisor event loop the exit is reported on
+            on_exit: Called with (worker, exit code) when the pipeline stops
+        """
+        self.pipeline = pipeline
+        self.loop = loop
+        self.on_exit = on_exit
+        self.converter = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def start(self):
+        """Start the converter thread"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=self.pipeline['name'], daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # Only needed in this mode; imports the whole converter
+        from main import JoystickConverter, parse_cpus
+
+        pipeline = self.pipeline
+        code = 1
+        try:
+            if pipeline['cpus']:
+                # Affects this thread only; threads it starts inherit it
+                try:
+                    os.sched_setaffinity(0, parse_cpus(pipeline['cpus']))
+                except OSError as e:
+                    logger.warning(f"Could not pin pipeline {pipeline['name']} to CPUs {pipeline['cpus']}: {e}")
+            converter = JoystickConverter(pipeline['config'], enable_output=bool(pipeline['hidg']),
+                                          control_socket=pipeline['control_socket'],
+                                          state_file=pipeline['state_file'],
+                                          profile_db=pipeline['profile_db'],
+                                          input_device=pipeline['input_device'],
+                                          hidg_device=pipeline['hidg'] or '/dev/hidg0',
+                                          output_thread=pipeline['output_thread'],
+                                          notify_systemd=False)
+            if converter.setup():
+                self.converter = converter
+                if self._stopping:
+                    converter.shutdown()
+                else:
+                    converter.run()
+                code = 0
+        except Exception:
+            logger.exception(f"Pipeline {pipeline['name']} failed")
+        finally:
+            self.converter = None
+            self.loop.call_soon_threadsafe(self.on_exit, self, code)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the converter's event loop and wait for its shutdown"""
+        self._stopping = True
+        converter = self.converter
+        if converter is not None:
+            converter.loop.call_soon_threadsafe(converter.loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Pipeline {self.pipeline['name']} did not stop")
+
+    def metrics(self) -> Optional[Dict[str, Any]]:
+        """Query the pipeline's metrics on its event loop (None = unavailable)"""
+        converter = self.converter
+        if converter is None:
+            return None
+        try:
+            return LocalControlClient(converter.control_server, timeout=1.0).request('get_metrics')
+        except (ControlTimeout, ControlError):
+            return None
+
+
+class Supervisor:
+    """
+    Runs several independent converter pipelines, one per player
+
+    Every pipeline has its own input device, configuration, HID gadget
+    device and event loop, in its own process (or thread), optionally
+    pinned to its own CPUs. A pipeline that exits, e.g. because its
+    gamepad was unplugged, is restarted after a growing delay; the
+    others keep running untouched.
+    """
+
+    # Restart delay after a failure, doubled for each failure in a row
+    RESTART_DELAY = 1.0
+    RESTART_MAX_DELAY = 30.0
+    # A pipeline that ran this long before exiting is restarted promptly
+    STABLE_TIME = 60.0
+
+    def __init__(self, pipelines: List[Dict[str, Any]], workers: str = 'process', metrics_interval: float = 60.0):
+        """
+        Initialize the supervisor
+
+        Args:
+            pipelines: Pipeline dictionaries from load_pipelines()
+            workers: 'process' (isolated) or 'thread' (less memory, shared GIL)
+            metrics_interval: Seconds between metrics log lines (0 = never)
+        """
+        self.loop = EventLoop()
+        worker_class = ThreadWorker if workers == 'thread' else ProcessWorker
+        self.workers = [worker_class(pipeline, self.loop, self._on_exit) for pipeline in pipelines]
+        self.metrics_interval = metrics_interval
+        self.restarts: Dict[str, int] = {pipeline['name']: 0 for pipeline in pipelines}
+        self._failures: Dict[str, int] = dict(self.restarts)
+        self._started: Dict[str, float] = {}
+        self._stopping = False
+
+    def setup_gadget(self):
+        """Create one HID gadget function per pipeline before the pipelines start"""
+        devices = [worker.pipeline['hidg'] for worker in self.workers if worker.pipeline['hidg']]
+        if not devices or all(os.path.exists(device) for device in devices):
+            return
+        # Done once here: pipelines setting up the gadget at the same time would race
+        functions = max(hidg_index(device) for device in devices) + 1
+        if not USBGadgetOutputHandler(devices[0]).setup_usb_gadget(functions):
+            logger.warning("USB Gadget setup failed; pipelines run without output")
+
+    def start_worker(self, worker):
+        name = worker.pipeline['name']
+        logger.info(f"Starting pipeline {name}")
+        self._started[name] = self.loop.time()
+        worker.start()
+
+    def _on_exit(self, worker, code: int):
+        """Restart a pipeline that stopped, backing off while it keeps failing"""
+        if self._stopping:
+            return
+        name = worker.pipeline['name']
+        if self.loop.time() - self._started[name] >= self.STABLE_TIME:
+            self._failures[name] = 0
+        delay = min(self.RESTART_DELAY * 2 ** self._failures[name], self.RESTART_MAX_DELAY)
+        self._failures[name] += 1
+        self.restarts[name] += 1
+        logger.warning(f"Pipeline {name} exited (code {code}), restarting in {delay:.0f} s")
+        self.loop.call_later(delay, self._restart, worker)
+
+    def _restart(self, worker):
+        if not self._stopping:
+            self.start_worker(worker)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Collect every pipeline's metrics
+
+        Returns:
+            Pipeline name -> get_metrics result plus 'running' and 'restarts'
+        """
+        report = {}
+        for worker in self.workers:
+            name = worker.pipeline['name']
+            metrics = worker.metrics() or {}
+            metrics.update(running=worker.is_running(), restarts=self.restarts[name])
+            report[name] = metrics
+        return report
+
+    def _log_metrics(self):
+        for name, metrics in self.metrics().items():
+            logger.info(f"Pipeline {name}: {format_metrics(metrics)}")
+        self.loop.call_later(self.metrics_interval, self._log_metrics)
+
+    def run(self):
+        """Start every pipeline and supervise them until stop()"""
+        self.setup_gadget()
+        for worker in self.workers:
+            self.start_worker(worker)
+        if self.metrics_interval > 0:
+            self.loop.call_later(self.metrics_interval, self._log_metrics)
+        notify('READY=1')
+        interval = watchdog_interval()
+        if interval:
+            self._watchdog_ping(interval / 2)
+        self.loop.run()
+
+    def _watchdog_ping(self, period: float):
+        notify('WATCHDOG=1')
+        self.loop.call_later(period, self._watchdog_ping, period)
+
+    def stop(self):
+        """Stop every pipeline, then the supervisor loop (loop thread only)"""
+        logger.info("Stopping pipelines...")
+        notify('STOPPING=1')
+        self._stopping = True
+        for worker in self.workers:
+            worker.stop()
+        self.loop.stop()
+
+
+def format_metrics(metrics: Dict[str, Any]) -> str:
+    """Format a pipeline's metrics as one line"""
+    if 'frames' in metrics:
+        line = (f"pid {metrics['pid']}, cpus {','.join(map(str, metrics['cpus']))}, "
+                f"input {'connected' if metrics['input_connected'] else 'lost'}, "
+                f"output {'on' if metrics['output_available'] else 'off'}, "
+                f"{metrics['frames']} frames, {metrics['mapped_events']} events, "
+                f"{metrics['output_events']} outputs, frame {metrics['frame_ms_mean']:.3f} ms mean / "
+                f"{metrics['frame_ms_max']:.2f} ms max, loop CPU {metrics['loop_cpu_seconds']:.1f} s, "
+                f"{metrics['input_resyncs']} input resyncs, {metrics['reports_dropped']} reports dropped, "
+                f"{metrics['stalls']} loop stalls (longest {metrics['longest_stall_ms']:.0f} ms)")
+    else:
+        line = 'running, no metrics' if metrics.get('running') else 'not running'
+    if 'restarts' in metrics:
+        line += f", {metrics['restarts']} restarts"
+    return line
+
+
+def print_status(pipelines: List[Dict[str, Any]]) -> int:
+    """Print the metrics of running pipelines, queried over their control sockets"""
+    for pipeline in pipelines:
+        metrics = None
+        if pipeline['control_socket']:
+            client = ControlClient(pipeline['control_socket'], timeout=1.0)
+            try:
+                metrics = client.request('get_metrics')
+            except (ControlUnavailable, ControlTimeout, ControlError):
+                pass
+            finally:
+                client.close()
+        print(f"{pipeline['name']}: {format_metrics(metrics) if metrics else 'not reachable'}")
+    return 0
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Joystick Converter multi-player supervisor')
+    parser.add_argument('pipelines', nargs='?', default=DEFAULT_PIPELINES_PATH,
+                        help=f'Pipeline definitions (default: {DEFAULT_PIPELINES_PATH})')
+    parser.add_argument('--workers', choices=['process', 'thread'], default='process',
+                        help='Run each pipeline in its own process (default) or thread')
+    parser.add_argument('--metrics-interval', type=float, default=60,
+                        help='Seconds between per-pipeline metrics log lines (0 = off)')
+    parser.add_argument('--status', action='store_true', help='Print the metrics of running pipelines and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        pipelines = load_pipelines(args.pipelines)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    if args.status:
+        sys.exit(print_status(pipelines))
+
+    supervisor = Supervisor(pipelines, args.workers, args.metrics_interval)
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}")
+        supervisor.loop.call_soon_threadsafe(supervisor.stop)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
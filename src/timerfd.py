@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Timer FD - Kernel interval timers (timerfd) usable from the event loop
+"""
+
+import os
+import time
+import struct
+import ctypes
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CLOCK_MONOTONIC = 1
+TFD_NONBLOCK = 0o4000
+TFD_CLOEXEC = 0o2000000
+
+_EXPIRATIONS = struct.Struct('Q')
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+class _Itimerspec(ctypes.Structure):
+    _fields_ = [('it_interval', _Timespec), ('it_value', _Timespec)]
+
+
+_libc = None
+
+
+def _load_libc():
+    """Load libc timerfd functions for Pythons without os.timerfd_create"""
+    global _libc
+    if _libc is None:
+        # libc is already loaded into the interpreter; searching for it
+        # with ctypes.util.find_library would run ldconfig
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.timerfd_create.argtypes = [ctypes.c_int, ctypes.c_int]
+        libc.timerfd_create.restype = ctypes.c_int
+        libc.timerfd_settime.argtypes = [ctypes.c_int, ctypes.c_int,
+                                         ctypes.POINTER(_Itimerspec),
+                                         ctypes.POINTER(_Itimerspec)]
+        libc.timerfd_settime.restype = ctypes.c_int
+        _libc = libc
+    return _libc
+
+
+def _timespec(seconds: float) -> _Timespec:
+    whole = int(seconds)
+    return _Timespec(whole, int(round((seconds - whole) * 1e9)))
+
+
+class TimerFD:
+    """
+    Periodic CLOCK_MONOTONIC timer exposed as a readable file descriptor
+
+    The kernel keeps the period, so expirations do not drift with the
+    time the process takes to handle them; missed periods are reported
+    as an expiration count instead of being lost.
+    """
+
+    def __init__(self):
+        """Create a disarmed, non-blocking timer"""
+        if hasattr(os, 'timerfd_create'):
+            self.fd = os.timerfd_create(time.CLOCK_MONOTONIC,
+                                        flags=os.TFD_NONBLOCK | os.TFD_CLOEXEC)
+        else:
+            fd = _load_libc().timerfd_create(CLOCK_MONOTONIC, TFD_NONBLOCK | TFD_CLOEXEC)
+            if fd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            self.fd = fd
+
+    def arm(self, initial: float, interval: float = 0.0):
+        """
+        Start the timer
+
+        Args:
+            initial: Seconds until the first expiration (must be > 0)
+            interval: Period in seconds after that (0 = one-shot)
+        """
+        if hasattr(os, 'timerfd_settime'):
+            os.timerfd_settime(self.fd, initial=initial, interval=interval)
+            return
+        spec = _Itimerspec(_timespec(interval), _timespec(initial))
+        if _load_libc().timerfd_settime(self.fd, 0, ctypes.byref(spec), None) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def disarm(self):
+        """Stop the timer"""
+        if hasattr(os, 'timerfd_settime'):
+            os.timerfd_settime(self.fd, initial=0, interval=0)
+            return
+        spec = _Itimerspec(_timespec(0), _timespec(0))
+        _load_libc().timerfd_settime(self.fd, 0, ctypes.byref(spec), None)
+
+    def read(self) -> int:
+        """
+        Consume pending expirations
+
+        Returns:
+            Number of expirations since the last read (0 if none)
+        """
+        try:
+            return _EXPIRATIONS.unpack(os.read(self.fd, 8))[0]
+        except BlockingIOError:
+            return 0
+
+    def close(self):
+        """Close the timer file descriptor"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def create_timer() -> Optional[TimerFD]:
+    """
+    Create a TimerFD if the system supports it
+
+    Returns:
+        TimerFD or None when timerfd is unavailable
+    """
+    try:
+        return TimerFD()
+    except (OSError, AttributeError, TypeError) as e:
+        logger.debug(f"timerfd unavailable: {e}")
+        return None
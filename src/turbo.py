@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Turbo - Autofire for held keyboard mappings driven by kernel timers
+"""
+
+import logging
+from typing import Callable, Dict, Any, List, Optional
+
+from timerfd import create_timer
+
+logger = logging.getLogger(__name__)
+
+
+class _TurboKey:
+    """State of one key that is currently auto-firing"""
+
+    __slots__ = ('press', 'release', 'half_period', 'timer', 'handle',
+                 'next_toggle', 'pressed', 'missed')
+
+    def __init__(self, press: Dict[str, Any], release: Dict[str, Any], half_period: float):
+        self.press = press
+        self.release = release
+        self.half_period = half_period
+        self.timer = None
+        self.handle = None
+        self.next_toggle = 0.0
+        self.pressed = False
+        self.missed = 0
+
+
+class TurboController:
+    """
+    Repeats press/release of held turbo keys at a fixed rate
+
+    Each turbo key gets its own timerfd firing every half period, added to
+    the event loop as a reader. The kernel keeps the cadence, and every
+    expiration toggles the key exactly once, so each toggle is its own
+    output frame. When expirations were missed, only their parity is
+    applied instead of emitting a burst of toggles. Where timerfd is not
+    available the loop's own timers are used with absolute deadlines.
+    """
+
+    MAX_RATE_HZ = 50.0
+
+    def __init__(self, loop, sink: Callable[[Dict[str, Any]], None]):
+        """
+        Initialize the turbo controller
+
+        Args:
+            loop: EventLoop the timers are attached to
+            sink: Function receiving each press/release output event
+        """
+        self.loop = loop
+        self.sink = sink
+        self._keys: Dict[int, _TurboKey] = {}
+
+        # Optional function called with the time (loop clock) of each toggle
+        self.toggle_hook: Optional[Callable[[int, float], None]] = None
+
+    def handle_event(self, event: Dict[str, Any]):
+        """
+        Start or stop auto-firing for a keyboard output event with 'turbo'
+
+        Args:
+            event: Keyboard output event carrying the turbo rate in Hz
+        """
+        if event.get('pressed'):
+            self.start(event)
+        else:
+            self.stop(event.get('keycode'))
+
+    def start(self, press: Dict[str, Any]) -> bool:
+        """
+        Press a key and keep toggling it until stop()
+
+        Args:
+            press: Keyboard press event carrying the turbo rate in Hz
+
+        Returns:
+            True if auto-fire started
+        """
+        keycode = press.get('keycode')
+        if keycode is None or keycode in self._keys:
+            return False
+
+        rate = min(float(press.get('turbo') or 0), self.MAX_RATE_HZ)
+        if rate <= 0:
+            self.sink(press)
+            return False
+
+        release = dict(press)
+        release['pressed'] = False
+        key = _TurboKey(press, release, 0.5 / rate)
+        self._keys[keycode] = key
+
+        self._toggle(keycode, key)
+        key.timer = create_timer()
+        if key.timer is not None:
+            key.timer.arm(key.half_period, key.half_period)
+            self.loop.add_reader(key.timer.fd, self._on_timer, keycode)
+        else:
+            key.next_toggle = self.loop.time() + key.half_period
+            key.handle = self.loop.call_at(key.next_toggle, self._on_deadline, keycode)
+
+        logger.debug(f"Turbo started for key {keycode} at {rate} Hz")
+        return True
+
+    def _toggle(self, keycode: int, key: _TurboKey):
+        """Flip the key between pressed and released"""
+        key.pressed = not key.pressed
+        if self.toggle_hook is not None:
+            self.toggle_hook(keycode, self.loop.time())
+        self.sink(key.press if key.pressed else key.release)
+
+    def _on_timer(self, keycode: int):
+        """Handle timerfd expirations for a key"""
+        key = self._keys.get(keycode)
+        if key is None:
+            return
+        expirations = key.timer.read()
+        if not expirations:
+            return
+        key.missed += expirations - 1
+        if expirations % 2:
+            self._toggle(keycode, key)
+
+    def _on_deadline(self, keycode: int):
+        """Handle a loop timer toggle when timerfd is unavailable"""
+        key = self._keys.get(keycode)
+        if key is None:
+            return
+        now = self.loop.time()
+        expirations = 1 + int((now - key.next_toggle) / key.half_period)
+        key.next_toggle += expirations * key.half_period
+        key.missed += expirations - 1
+        if expirations % 2:
+            self._toggle(keycode, key)
+        key.handle = self.loop.call_at(key.next_toggle, self._on_deadline, keycode)
+
+    def stop(self, keycode: Optional[int]) -> bool:
+        """
+        Stop auto-firing a key and release it
+
+        Args:
+            keycode: HID keycode
+
+        Returns:
+            True if the key was auto-firing
+        """
+        key = self._keys.pop(keycode, None)
+        if key is None:
+            return False
+
+        if key.timer is not None:
+            self.loop.remove_reader(key.timer.fd)
+            key.timer.close()
+        if key.handle is not None:
+            key.handle.cancel()
+        self.sink(key.release)
+
+        if key.missed:
+            logger.debug(f"Turbo key {keycode} missed {key.missed} toggles")
+        return True
+
+    def stop_all(self):
+        """Stop every auto-firing key"""
+        for keycode in list(self._keys):
+            self.stop(keycode)
+
+    def active_keys(self) -> List[int]:
+        """Get the keycodes currently auto-firing"""
+        return list(self._keys)
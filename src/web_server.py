@@ -3,31 +3,48 @@
 Web Server - Flask web interface for configuration management
 """
 
+import os
 import sys
+import copy
 import json
 import logging
+import argparse
+import mimetypes
 import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory, Response
-from queue import Queue, Empty, Full
+from typing import Any, Callable, Dict, Optional, Tuple
+from flask import Flask, render_template, request, jsonify, Response
+
+try:
+    from flask_sock import Sock, ConnectionClosed
+except ImportError:
+    # Optional: without flask-sock the UI uses the SSE stream
+    Sock = None
 
 # Add src directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from calibration import CalibrationStore, DEFAULT_CALIBRATION_FILE, calibrate_device
+from control_client import ControlClient, LocalControlClient, ControlError, ControlTimeout, ControlUnavailable
+from event_hub import EventHub, EventFilter
+from http_cache import CachedBody, FileCache
+from profile_store import ProfileStore, ProfileNotFound, DEFAULT_PROFILE_DB
 from mapping_engine import MappingEngine
-from input_handler import JoystickInputHandler, list_all_devices
-import evdev
+from memory_report import memory_report, set_tracing
+from state_snapshot import StateSnapshotReader, EV_KEY, EV_ABS
+from stream_codec import BinaryEventEncoder
+# evdev and the input handler are imported where the device is used, so
+# the web interface starts without them while the daemon owns the gamepad
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, 
             template_folder='../web/templates',
-            static_folder='../web/static')
+            static_folder=None)
+static_files = FileCache(Path(__file__).parent.parent / 'web' / 'static')
+sock = Sock(app) if Sock else None
 
 # Global mapping engine instance
 config_path = Path.home() / "joystick_converter" / "config" / "mappings.json"
@@ -35,38 +52,236 @@ if not config_path.exists():
     config_path = Path("config/mappings.json")
 
 mapping_engine = MappingEngine(str(config_path))
-mapping_engine.load_config()
+# Requests are served on many threads; the local engine is only used under this lock
+engine_lock = threading.RLock()
+
+# Profile library shared with the daemon (SQLite allows concurrent readers)
+profile_store = ProfileStore(config_path.parent / DEFAULT_PROFILE_DB)
+
+# Axis calibrations by device, applied by the daemon when a device connects
+calibration_store = CalibrationStore(str(config_path.parent / DEFAULT_CALIBRATION_FILE))
+
+# The converter daemon owns the gamepad and the configuration; changes
+# and input events go through its control socket. The file and device
+# are only used directly while the daemon is not running.
+control = ControlClient()
+
+# Live controller state shared by the daemon through a memory-mapped file
+state_reader = StateSnapshotReader()
 
 # Global input handler for web debugging
 input_handler = None
+input_subscription = None
+input_lock = threading.RLock()
 input_thread = None
-event_queue = Queue(maxsize=100)
+# Every event stream client gets its own buffer, so several browser
+# tabs can watch the same device without stealing events from each other
+event_hub = EventHub(buffer_size=256)
+SSE_FLUSH_INTERVAL = 0.05
+SSE_KEEPALIVE = 5.0
 input_thread_running = False
 
 
+# Configuration fetched for the current config version, and the response
+# bodies built from it; both are dropped when the version changes
+cache_lock = threading.Lock()
+config_cache: Optional[Tuple[str, float, dict]] = None
+response_cache: Dict[str, CachedBody] = {}
+keys_response: Optional[CachedBody] = None
+
+
+def send_cached(cached: CachedBody, mimetype: str, cache_control: str = 'no-cache') -> Response:
+    """
+    Send a cached body compressed for the client, answering conditional
+    requests (If-None-Match / If-Modified-Since) with 304
+    """
+    encoding, body = cached.encoded(request.headers.get('Accept-Encoding', ''))
+    response = Response(body, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    response.set_etag(f"{cached.etag}-{encoding or 'identity'}")
+    if cached.last_modified:
+        response.last_modified = cached.last_modified
+    return response.make_conditional(request)
+
+
+def asset_url(filename: str) -> str:
+    """Get a static file URL that changes whenever the file does"""
+    cached = static_files.get(filename)
+    return f"/static/{filename}?v={cached.etag[:10]}" if cached else f"/static/{filename}"
+
+
+@app.context_processor
+def template_helpers():
+    return {'asset_url': asset_url}
+
+
+@app.errorhandler(ControlTimeout)
+def control_timeout(e):
+    """The converter is running but busy: report it rather than editing the config file behind its back"""
+    return jsonify({'error': str(e)}), 503
+
+
+@app.route('/static/<path:filename>', endpoint='static')
+def serve_static(filename):
+    """Serve a static file, precompressed and cached"""
+    cached = static_files.get(filename)
+    if cached is None:
+        return jsonify({'error': 'Not found'}), 404
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    # Versioned URLs never change content, so browsers need not revalidate
+    cache_control = 'public, max-age=31536000, immutable' if 'v' in request.args else 'no-cache'
+    return send_cached(cached, mimetype, cache_control)
+
+
 @app.route('/')
 def index():
     """Main page"""
-    return render_template('index.html')
+    page = render_template('index.html').encode()
+    key = 'index'
+    with cache_lock:
+        cached = response_cache.get(key)
+        if cached is None or cached.body != page:
+            cached = response_cache[key] = CachedBody(page)
+    return send_cached(cached, 'text/html')
+
+
+@contextmanager
+def local_engine():
+    """Lock and return the mapping engine working on the config file, for when the daemon is down"""
+    with engine_lock:
+        # The daemon may have changed the file since we last read it
+        mapping_engine.load_config()
+        yield mapping_engine
+
+
+def config_version() -> Tuple[str, float]:
+    """
+    Get the version of the current configuration
+    
+    Returns:
+        (version string, modification time)
+    """
+    try:
+        version = control.request('get_version')
+        return f"d{version['version']}", version['modified']
+    except ControlUnavailable:
+        try:
+            st = os.stat(mapping_engine.config_path)
+        except OSError:
+            return 'none', 0.0
+        return f"f{st.st_mtime_ns:x}-{st.st_size:x}", st.st_mtime
+
+
+def versioned_config() -> Tuple[str, float, dict]:
+    """
+    Get the configuration the converter is running with, and its version
+    
+    The configuration is only fetched again when the version changed.
+    """
+    global config_cache
+    version, modified = config_version()
+    cached = config_cache
+    if cached is not None and cached[0] == version:
+        return cached
+    
+    try:
+        # One command, so the version is the one of this very config
+        result = control.request('get_version', config=True)
+        version, modified, config = f"d{result['version']}", result['modified'], result['config']
+    except ControlUnavailable:
+        with local_engine() as engine:
+            # The file was read after its version was taken, so at worst
+            # the config is newer and the next version check fetches it again.
+            # Copied so it can be serialized after the lock is released
+            config = copy.deepcopy(engine.get_config())
+    
+    with cache_lock:
+        config_cache = (version, modified, config)
+        response_cache.clear()
+    return config_cache
+
+
+def current_config() -> dict:
+    """Get the configuration the converter is running with"""
+    return versioned_config()[2]
+
+
+def config_response(key: str, build: Callable[[dict], Any]) -> Response:
+    """
+    Send JSON built from the current configuration, memoized per config version
+    
+    Args:
+        key: Cache key identifying the response
+        build: Builds the response data from the configuration
+    """
+    version, modified, config = versioned_config()
+    with cache_lock:
+        cached = response_cache.get(key)
+    if cached is None or cached.etag != version:
+        cached = CachedBody(app.json.dumps(build(config)).encode(), etag=version, last_modified=modified)
+        with cache_lock:
+            response_cache[key] = cached
+    return send_cached(cached, 'application/json')
 
 
 @app.route('/api/mappings', methods=['GET'])
 def get_mappings():
     """Get all mappings"""
-    return jsonify({
-        'device_name': mapping_engine.device_name,
-        'mappings': mapping_engine.get_all_mappings()
+    return config_response('mappings', lambda config: {
+        'device_name': config.get('device_name', 'Unknown Device'),
+        'mappings': config.get('mappings', {})
     })
 
 
+@app.route('/api/mappings', methods=['PATCH'])
+def patch_mappings():
+    """
+    Apply many mapping changes in one transaction
+    
+    The body maps event names to their new mapping, or to null to remove
+    the mapping. Either every change is applied and saved once, or none is.
+    """
+    try:
+        changes = request.get_json()
+        
+        if not changes:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        try:
+            result = control.request('patch_mappings', changes=changes)
+            mappings_count = result['mappings_count']
+        except ControlUnavailable:
+            with local_engine() as engine:
+                config = engine.with_mapping_changes(changes)
+                engine.apply_config(config)
+                engine.save_config()
+                mappings_count = len(engine.mappings)
+        
+        return jsonify({
+            'success': True,
+            'changed': len(changes),
+            'mappings_count': mappings_count
+        })
+        
+    except (ValueError, ControlError) as e:
+        return jsonify({'error': str(e)}), 400
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error patching mappings: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/mappings/<event_name>', methods=['GET'])
 def get_mapping(event_name):
     """Get a specific mapping"""
-    mapping = mapping_engine.get_mapping(event_name)
-    if mapping:
-        return jsonify({event_name: mapping})
-    else:
+    if not current_config().get('mappings', {}).get(event_name):
         return jsonify({'error': 'Mapping not found'}), 404
+    return config_response(f'mapping:{event_name}',
+                           lambda config: {event_name: config['mappings'][event_name]})
 
 
 @app.route('/api/mappings/<event_name>', methods=['PUT'])
@@ -78,8 +293,12 @@ def update_mapping(event_name):
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        mapping_engine.add_mapping(event_name, data)
-        mapping_engine.save_config()
+        try:
+            control.request('set_mapping', event_name=event_name, mapping=data)
+        except ControlUnavailable:
+            with local_engine() as engine:
+                engine.add_mapping(event_name, data)
+                engine.save_config()
         
         return jsonify({
             'success': True,
@@ -87,6 +306,8 @@ def update_mapping(event_name):
             'mapping': data
         })
         
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Error updating mapping: {e}")
         return jsonify({'error': str(e)}), 500
@@ -96,12 +317,21 @@ def update_mapping(event_name):
 def delete_mapping(event_name):
     """Delete a mapping"""
     try:
-        if mapping_engine.remove_mapping(event_name):
-            mapping_engine.save_config()
+        try:
+            removed = control.request('delete_mapping', event_name=event_name)['removed']
+        except ControlUnavailable:
+            with local_engine() as engine:
+                removed = engine.remove_mapping(event_name)
+                if removed:
+                    engine.save_config()
+        
+        if removed:
             return jsonify({'success': True, 'event_name': event_name})
         else:
             return jsonify({'error': 'Mapping not found'}), 404
             
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Error deleting mapping: {e}")
         return jsonify({'error': str(e)}), 500
@@ -110,11 +340,25 @@ def delete_mapping(event_name):
 @app.route('/api/device', methods=['GET'])
 def get_device():
     """Get device information"""
-    return jsonify({
-        'device_name': mapping_engine.device_name,
-        'config_path': str(mapping_engine.config_path),
-        'mappings_count': len(mapping_engine.mappings)
-    })
+    try:
+        state = control.request('get_state')
+        return jsonify({
+            'device_name': state['device_name'],
+            'config_path': state['config_path'],
+            'mappings_count': state['mappings_count'],
+            'daemon_running': True,
+            'active_layer': state['active_layer'],
+            'input_device': state['input_device'],
+            'output_available': state['output_available']
+        })
+    except ControlUnavailable:
+        with local_engine() as engine:
+            return jsonify({
+                'device_name': engine.device_name,
+                'config_path': str(engine.config_path),
+                'mappings_count': len(engine.mappings),
+                'daemon_running': False
+            })
 
 
 @app.route('/api/device/name', methods=['PUT'])
@@ -127,14 +371,20 @@ def update_device_name():
         if not device_name:
             return jsonify({'error': 'No device name provided'}), 400
         
-        mapping_engine.device_name = device_name
-        mapping_engine.save_config()
+        try:
+            control.request('set_device_name', device_name=device_name)
+        except ControlUnavailable:
+            with local_engine() as engine:
+                engine.device_name = device_name
+                engine.save_config()
         
         return jsonify({
             'success': True,
             'device_name': device_name
         })
         
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Error updating device name: {e}")
         return jsonify({'error': str(e)}), 500
@@ -144,13 +394,20 @@ def update_device_name():
 def reload_config():
     """Reload configuration from file"""
     try:
-        mapping_engine.load_config()
+        try:
+            control.request('reload')
+            mappings_count = len(control.request('get_config')['mappings'])
+        except ControlUnavailable:
+            with local_engine() as engine:
+                mappings_count = len(engine.mappings)
         return jsonify({
             'success': True,
             'message': 'Configuration reloaded',
-            'mappings_count': len(mapping_engine.mappings)
+            'mappings_count': mappings_count
         })
         
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Error reloading config: {e}")
         return jsonify({'error': str(e)}), 500
@@ -160,12 +417,10 @@ def reload_config():
 def export_config():
     """Export configuration as JSON"""
     try:
-        config = {
-            'device_name': mapping_engine.device_name,
-            'mappings': mapping_engine.get_all_mappings()
-        }
-        return jsonify(config)
+        return config_response('export', lambda config: config)
         
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Error exporting config: {e}")
         return jsonify({'error': str(e)}), 500
@@ -177,32 +432,257 @@ def import_config():
     try:
         data = request.get_json()
         
-        if 'device_name' in data:
-            mapping_engine.device_name = data['device_name']
-            
-        if 'mappings' in data:
-            mapping_engine.mappings = data['mappings']
-            
-        mapping_engine.save_config()
+        try:
+            result = control.request('import_config', config=data)
+            mappings_count = result['mappings_count']
+        except ControlUnavailable:
+            with local_engine() as engine:
+                # Sections missing from the import keep their current value
+                config = engine.get_config()
+                config.update(data)
+                engine.apply_config(config)
+                engine.save_config()
+                mappings_count = len(engine.mappings)
         
         return jsonify({
             'success': True,
             'message': 'Configuration imported',
-            'mappings_count': len(mapping_engine.mappings)
+            'mappings_count': mappings_count
         })
         
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Error importing config: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """Search the profile library (?q=text&game=...&device=...)"""
+    try:
+        return jsonify({'profiles': profile_store.search(
+            request.args.get('q'), request.args.get('game'), request.args.get('device'),
+            request.args.get('limit', 100, type=int))})
+    except Exception as e:
+        logger.error(f"Error listing profiles: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Get a profile, optionally an older version (?version=N)"""
+    try:
+        return jsonify(profile_store.get(name, request.args.get('version', type=int)))
+    except ProfileNotFound as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@app.route('/api/profiles/<name>/history', methods=['GET'])
+def get_profile_history(name):
+    """List the saved versions of a profile"""
+    try:
+        return jsonify({'name': name, 'versions': profile_store.history(name)})
+    except ProfileNotFound as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@app.route('/api/profiles/<name>', methods=['PUT'])
+def save_profile(name):
+    """
+    Save a new profile version: the 'config' in the body, or the
+    running configuration if there is none
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        meta = {key: data.get(key) for key in ('game', 'device', 'description')}
+        comment = data.get('comment', '')
+        
+        if 'config' in data:
+            version = profile_store.save(name, data['config'], comment=comment, **meta)
+        else:
+            try:
+                version = control.request('save_profile', name=name, comment=comment, **meta)['version']
+            except ControlUnavailable:
+                version = profile_store.save(name, current_config(), comment=comment, **meta)
+        
+        return jsonify({'success': True, 'name': name, 'version': version})
+        
+    except (ValueError, ControlError) as e:
+        return jsonify({'error': str(e)}), 400
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error saving profile: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/profiles/<name>/activate', methods=['POST'])
+def activate_profile(name):
+    """Switch the converter to a profile (optional body: {"version": N})"""
+    try:
+        version = (request.get_json(silent=True) or {}).get('version')
+        try:
+            result = control.request('activate_profile', name=name, version=version)
+        except ControlUnavailable:
+            profile = profile_store.get(name, version)
+            with local_engine() as engine:
+                engine.apply_config(profile['config'])
+                engine.save_config()
+            profile_store.mark_used(name)
+            result = {'name': name, 'version': profile['version'],
+                      'mappings_count': len(profile['config'].get('mappings', {}))}
+        
+        return jsonify(dict(result, success=True))
+        
+    except ProfileNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ControlError as e:
+        return jsonify({'error': str(e)}), 400
+    except ControlTimeout as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error activating profile: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/profiles/<name>', methods=['DELETE'])
+def delete_profile(name):
+    """Remove a profile and its history"""
+    if profile_store.delete(name):
+        return jsonify({'success': True, 'name': name})
+    return jsonify({'error': f"Profile not found: {name}"}), 404
+
+
+@app.route('/api/calibration', methods=['GET'])
+def list_calibrations():
+    """List the stored axis calibrations by device key"""
+    return jsonify({'calibrations': calibration_store.load()})
+
+
+@app.route('/api/calibration', methods=['POST'])
+def run_calibration():
+    """
+    Calibrate a device's axes and store the result
+    
+    Blocks for the whole recording: first 'rest' seconds with the
+    controller untouched, then 'move' seconds while every stick and
+    trigger is moved to its limits.
+    """
+    data = request.get_json(silent=True) or {}
+    device_path = data.get('device_path')
+    if not device_path:
+        return jsonify({'error': 'device_path is required'}), 400
+    try:
+        rest = float(data.get('rest', 2.0))
+        move = float(data.get('move', 5.0))
+    except (TypeError, ValueError):
+        return jsonify({'error': "'rest' and 'move' must be numbers"}), 400
+    if not (0 < rest <= 30 and 0 < move <= 60):
+        return jsonify({'error': "'rest' must be at most 30 s and 'move' at most 60 s"}), 400
+    
+    try:
+        result = calibrate_device(device_path, rest, move)
+    except (OSError, ValueError) as e:
+        return jsonify({'error': f"Calibration failed: {e}"}), 500
+    if not result['axes']:
+        return jsonify({'error': 'No axis was moved', 'unmoved': result['unmoved']}), 400
+    calibration_store.save(result['key'], result['name'], result['axes'])
+    
+    # The daemon applies it right away if the device is the one it reads
+    applied = None
+    try:
+        applied = control.request('reload_calibration')['axes']
+    except (ControlUnavailable, ControlTimeout, ControlError):
+        pass
+    return jsonify({'success': True, 'key': result['key'], 'name': result['name'], 'axes': result['axes'],
+                    'unmoved': result['unmoved'], 'samples': result['samples'], 'daemon_axes': applied})
+
+
+@app.route('/api/calibration', methods=['DELETE'])
+def delete_calibration():
+    """Remove a device's calibration (?key=, as listed by GET /api/calibration)"""
+    key = request.args.get('key', '')
+    if not calibration_store.delete(key):
+        return jsonify({'error': f"No calibration for {key}"}), 404
+    try:
+        control.request('reload_calibration')
+    except (ControlUnavailable, ControlTimeout, ControlError):
+        pass
+    return jsonify({'success': True, 'key': key})
+
+
 @app.route('/api/keys', methods=['GET'])
 def get_available_keys():
     """Get list of available keys"""
-    return jsonify({
-        'keys': sorted(mapping_engine.KEY_MAP.keys()),
-        'modifiers': sorted(mapping_engine.MODIFIER_MAP.keys())
-    })
+    global keys_response
+    if keys_response is None:
+        # The key tables are constant; build and compress the response once
+        keys_response = CachedBody(app.json.dumps({
+            'keys': sorted(mapping_engine.KEY_MAP.keys()),
+            'modifiers': sorted(mapping_engine.MODIFIER_MAP.keys())
+        }).encode())
+    return send_cached(keys_response, 'application/json', 'public, max-age=3600')
+
+
+def code_name(event_type: int, code: int) -> str:
+    """Get the name of an event code, as the converter's mappings use it"""
+    import input_handler
+    return input_handler.code_name(event_type, code)
+
+
+@app.route('/api/state', methods=['GET'])
+def get_controller_state():
+    """Get the live controller state published by the converter"""
+    state = state_reader.read()
+    if state is None:
+        return jsonify({'running': False})
+    
+    state['buttons'] = [code_name(EV_KEY, code) for code in state['buttons']]
+    # Axes that are not at zero, by name
+    state['axes'] = {
+        code_name(EV_ABS, code): value
+        for code, value in enumerate(state['axes']) if value
+    }
+    return jsonify(state)
+
+
+@app.route('/api/memory', methods=['GET'])
+def get_memory():
+    """Get the memory reports of the converter and of this web server process"""
+    top = request.args.get('top', 10, type=int)
+    try:
+        converter = control.request('get_memory', top=top)
+    except ControlUnavailable:
+        converter = None
+    
+    # Inside the converter process the converter's report covers this one
+    web = None
+    if not isinstance(control, LocalControlClient):
+        web = memory_report({'config_cache': config_cache, 'response_cache': response_cache,
+                             'keys_response': keys_response}, top)
+    return jsonify({'converter': converter, 'web': web})
+
+
+@app.route('/api/memory/trace', methods=['POST'])
+def trace_memory():
+    """
+    Start or stop allocation tracing in the converter and this process
+    (body: {"enabled": true}); it slows every allocation down, so it is
+    never changed by a plain GET
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('enabled'), bool):
+        return jsonify({'error': "'enabled' must be true or false"}), 400
+    enabled = data['enabled']
+    try:
+        control.request('trace_memory', enabled=enabled)
+        converter = enabled
+    except ControlUnavailable:
+        converter = None
+    if not isinstance(control, LocalControlClient):
+        set_tracing(enabled)
+    return jsonify({'success': True, 'tracing': enabled, 'converter': converter})
 
 
 @app.route('/health', methods=['GET'])
@@ -215,6 +695,7 @@ def health_check():
 def list_input_devices():
     """List all available input devices"""
     try:
+        from input_handler import evdev
         devices = []
         for path in evdev.list_devices():
             device = evdev.InputDevice(path)
@@ -242,61 +723,64 @@ def list_input_devices():
 @app.route('/api/input/connect', methods=['POST'])
 def connect_input_device():
     """Connect to an input device for debugging"""
-    global input_handler, input_thread, input_thread_running
+    global input_handler, input_thread, input_thread_running, input_subscription
     
-    try:
-        data = request.get_json()
-        device_path = data.get('device_path')
-        
-        # Stop existing connection if any
-        disconnect_input_device_internal()
-        
-        # Create new input handler
-        input_handler = JoystickInputHandler(device_path)
-        
-        if not input_handler.connect():
-            return jsonify({'error': 'Failed to connect to device'}), 500
-        
-        # Register callback to put events in queue
-        def event_callback(event_name, value):
+    with input_lock:
+        try:
+            data = request.get_json()
+            device_path = data.get('device_path')
+            
+            # Stop existing connection if any
+            disconnect_input_device_internal()
+            
+            # Watch the daemon's own input stream rather than opening the
+            # gamepad a second time
             try:
-                event_queue.put({
+                state = control.request('get_state')
+                if state['input_device']:
+                    input_subscription = control.subscribe(['input'], queue_daemon_event)
+                    return jsonify({
+                        'success': True,
+                        'device_name': state['input_device']['name'],
+                        'device_path': state['input_device']['path']
+                    })
+            except ControlUnavailable:
+                pass
+            
+            # Create new input handler
+            from input_handler import JoystickInputHandler
+            input_handler = JoystickInputHandler(device_path, str(calibration_store.path))
+            
+            if not input_handler.connect():
+                return jsonify({'error': 'Failed to connect to device'}), 500
+            
+            # Register callback to broadcast events to stream clients
+            def event_callback(event_name, value):
+                event_hub.publish({
                     'event_name': event_name,
                     'value': value,
                     'timestamp': time.time()
-                }, block=False)
-            except Full:
-                pass  # Queue full, drop event
-        
-        # Register callbacks for common gamepad events
-        common_events = [
-            'BTN_A', 'BTN_B', 'BTN_X', 'BTN_Y',
-            'BTN_TL', 'BTN_TR', 'BTN_TL2', 'BTN_TR2',
-            'BTN_START', 'BTN_SELECT', 'BTN_MODE',
-            'BTN_THUMBL', 'BTN_THUMBR',
-            'ABS_X', 'ABS_Y', 'ABS_RX', 'ABS_RY',
-            'ABS_Z', 'ABS_RZ', 'ABS_HAT0X', 'ABS_HAT0Y'
-        ]
-        
-        for event in common_events:
-            input_handler.register_callback(event, event_callback)
-        
-        # Start input reading thread
-        input_thread_running = True
-        input_thread = threading.Thread(target=input_event_loop, daemon=True)
-        input_thread.start()
-        
-        device_info = input_handler.get_device_info()
-        
-        return jsonify({
-            'success': True,
-            'device_name': device_info.get('name', 'Unknown'),
-            'device_path': device_info.get('path', device_path)
-        })
-        
-    except Exception as e:
-        logger.error(f"Error connecting to device: {e}")
-        return jsonify({'error': str(e)}), 500
+                })
+            
+            # Capture every key and axis event the device reports
+            input_handler.monitor_callback = event_callback
+            
+            # Start input reading thread
+            input_thread_running = True
+            input_thread = threading.Thread(target=input_event_loop, daemon=True)
+            input_thread.start()
+            
+            device_info = input_handler.get_device_info()
+            
+            return jsonify({
+                'success': True,
+                'device_name': device_info.get('name', 'Unknown'),
+                'device_path': device_info.get('path', device_path)
+            })
+            
+        except Exception as e:
+            logger.error(f"Error connecting to device: {e}")
+            return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/input/disconnect', methods=['POST'])
@@ -310,30 +794,99 @@ def disconnect_input_device():
         return jsonify({'error': str(e)}), 500
 
 
+def stream_filter() -> EventFilter:
+    """
+    Build an event stream filter from the request's query parameters
+    
+    Query parameters (all optional):
+        events: Comma-separated event name patterns, e.g. BTN_*,ABS_X
+        max_rate: Axis updates per second per axis
+        min_delta: Smallest axis change to send
+        coalesce: 1 to send only the latest value of each axis per message
+    """
+    patterns = [p.strip() for p in request.args.get('events', '').split(',') if p.strip()]
+    return EventFilter(
+        patterns=patterns or None,
+        max_rate=request.args.get('max_rate', 0.0, type=float),
+        min_delta=request.args.get('min_delta', 0, type=int),
+        coalesce=request.args.get('coalesce', '0').lower() in ('1', 'true', 'yes')
+    )
+
+
 @app.route('/api/input/events', methods=['GET'])
 def stream_input_events():
-    """Stream input events using Server-Sent Events (SSE)"""
+    """
+    Stream input events using Server-Sent Events (SSE)
+    
+    Each message carries every event buffered during one flush interval:
+    {"events": [...], "dropped": <events this client missed since the last message>}
+    
+    Accepts the query parameters of stream_filter().
+    """
+    subscriber = event_hub.subscribe(stream_filter())
+    
     def generate():
         try:
-            while True:
-                try:
-                    # Get event from queue with timeout
-                    event = event_queue.get(timeout=5.0)
-                    # Send as SSE format
-                    yield f"data: {json.dumps(event)}\n\n"
-                except Empty:
-                    # Send keepalive ping every 5 seconds
-                    yield f": keepalive\n\n"
-                except Exception as e:
-                    logger.error(f"Error in event stream: {e}")
-                    break
+            while not subscriber.closed:
+                events, dropped = subscriber.drain(SSE_KEEPALIVE)
+                if not events and not dropped:
+                    # Send keepalive ping when idle
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps({'events': events, 'dropped': dropped})}\n\n"
+                # Let the next batch accumulate
+                time.sleep(SSE_FLUSH_INTERVAL)
         except GeneratorExit:
             # Client disconnected
             pass
+        except Exception as e:
+            logger.error(f"Error in event stream: {e}")
+        finally:
+            event_hub.unsubscribe(subscriber)
     
     return Response(generate(), mimetype='text/event-stream')
 
 
+def stream_input_events_binary(ws):
+    """
+    Stream input events over a WebSocket in binary frames
+    
+    One binary message per flush interval, encoded by BinaryEventEncoder.
+    Before a frame that uses new event ids, a text message
+    {"names": {"<id>": "<event name>", ...}} is sent. Accepts the query
+    parameters of stream_filter().
+    """
+    subscriber = event_hub.subscribe(stream_filter())
+    encoder = BinaryEventEncoder()
+    try:
+        while True:
+            events, dropped = subscriber.drain(SSE_KEEPALIVE)
+            if not events and not dropped:
+                # Idle: notice clients that went away
+                ws.receive(timeout=0)
+                continue
+            names, frame = encoder.encode(events, dropped)
+            if names:
+                ws.send(json.dumps({'names': names}))
+            ws.send(frame)
+            # Let the next batch accumulate
+            time.sleep(SSE_FLUSH_INTERVAL)
+    except ConnectionClosed:
+        pass
+    finally:
+        event_hub.unsubscribe(subscriber)
+
+
+if sock:
+    sock.route('/api/input/ws')(stream_input_events_binary)
+
+
+def queue_daemon_event(message):
+    """Broadcast an input event streamed by the converter daemon"""
+    message.pop('topic', None)
+    event_hub.publish(message)
+
+
 def input_event_loop():
     """Background thread to read input events"""
     global input_thread_running, input_handler
@@ -353,38 +906,136 @@ def input_event_loop():
 
 def disconnect_input_device_internal():
     """Internal function to disconnect from device"""
-    global input_handler, input_thread, input_thread_running
+    global input_handler, input_thread, input_thread_running, input_subscription
+    
+    with input_lock:
+        # Stop the daemon event stream
+        if input_subscription:
+            input_subscription.close()
+            input_subscription = None
+        
+        # Stop the event loop thread
+        if input_thread and input_thread.is_alive():
+            input_thread_running = False
+            input_thread.join(timeout=5.0)  # Increased timeout for clean shutdown
+            input_thread = None
+        
+        # Disconnect the device
+        if input_handler:
+            input_handler.disconnect()
+            input_handler = None
+
+
+# CPU niceness of request threads when serving inside the converter process
+IN_PROCESS_NICE = 10
+
+
+def serve_in_process(converter, host: str, port: int):
+    """
+    Serve the web interface from inside the converter process
+    
+    Requests use the converter's commands, event streams and profile
+    library directly instead of the control socket; commands still run
+    on the converter's event loop between input batches. Requests are
+    served on threads of their own at a lower CPU priority, so the
+    input path runs first whenever both are ready.
+    
+    Args:
+        converter: The running JoystickConverter
+        host: Address to listen on
+        port: Port to listen on
+        
+    Returns:
+        The server; call shutdown() to stop it
+    """
+    global control, profile_store, state_reader, calibration_store
+    from werkzeug.serving import make_server
     
-    # Stop the event loop thread
-    if input_thread and input_thread.is_alive():
-        input_thread_running = False
-        input_thread.join(timeout=5.0)  # Increased timeout for clean shutdown
-        input_thread = None
+    control = LocalControlClient(converter.control_server)
+    profile_store = converter.profile_store
+    calibration_store = CalibrationStore(converter.input_handler.calibration_file)
+    if converter.state_snapshot:
+        state_reader = StateSnapshotReader(converter.state_snapshot.path)
     
-    # Disconnect the device
-    if input_handler:
-        input_handler.disconnect()
-        input_handler = None
+    server = make_server(host, port, app, threaded=True)
+    # Per-request access lines would flood the converter's log
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
     
-    # Clear the event queue
-    while not event_queue.empty():
+    def serve():
+        # Request threads are started from here and inherit the priority
         try:
-            event_queue.get_nowait()
-        except Empty:
-            break
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), IN_PROCESS_NICE)
+        except OSError as e:
+            logger.warning(f"Could not lower web thread priority: {e}")
+        server.serve_forever()
+    
+    threading.Thread(target=serve, name='web-server', daemon=True).start()
+    logger.info(f"Web interface listening on {host}:{port} (in-process)")
+    return server
+
 
+def run_gunicorn(host: str, port: int, threads: int):
+    """
+    Serve the app with gunicorn's threaded worker
+    
+    A single worker process is used: the event hub, the debug device
+    connection and the daemon subscription live in this process. Each
+    open event stream occupies one thread, so threads must cover the
+    expected stream clients plus concurrent API requests.
+    """
+    from gunicorn.app.base import BaseApplication
+    
+    class WebApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', 1)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', threads)
+        
+        def load(self):
+            return app
+    
+    WebApplication().run()
 
 
 def main():
     """Main entry point"""
-    logger.info(f"Starting web server on port 8080")
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    parser = argparse.ArgumentParser(description='Joystick Converter web interface')
+    parser.add_argument('--host', default='0.0.0.0', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--threads', type=int, default=32,
+                        help='Request threads; each open event stream uses one (default: 32)')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'werkzeug'], default='auto',
+                        help='WSGI server (auto = gunicorn when installed)')
+    args = parser.parse_args()
+    
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn'
+        except ImportError:
+            logger.warning("gunicorn not installed, using the threaded development server")
+            server = 'werkzeug'
+    
+    logger.info(f"Starting web server on port {args.port} ({server})")
     logger.info(f"Config path: {config_path}")
+    logger.info(f"Converter control socket: {control.path}")
     
     try:
-        app.run(host='0.0.0.0', port=8080, debug=False)
+        if server == 'gunicorn':
+            run_gunicorn(args.host, args.port, args.threads)
+        else:
+            app.run(host=args.host, port=args.port, debug=False, threaded=True)
     finally:
         # Cleanup on shutdown
         disconnect_input_device_internal()
+        control.close()
 
 
 if __name__ == '__main__':
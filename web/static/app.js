@@ -18,11 +18,19 @@ const AXIS_DEADZONE_THRESHOLD = 0.1;
 // Backend input detection variables
 let backendInputConnected = false;
 let backendEventSource = null;
+let backendWebSocket = null;
+let backendWebSocketUnavailable = false;
 let backendEventLog = [];
 const MAX_BACKEND_EVENTS = 50;
 let reconnectAttempts = 0;
 const MAX_RECONNECT_ATTEMPTS = 5;
 const RECONNECT_BASE_DELAY = 2000; // 2 seconds
+// Server-side downsampling of the backend event stream
+const BACKEND_STREAM_OPTIONS = {max_rate: 20, min_delta: 2, coalesce: 1};
+// Binary stream frame layout (see src/stream_codec.py)
+const STREAM_FRAME_VERSION = 1;
+const STREAM_HEADER_SIZE = 11;
+const STREAM_TIME_UNIT = 0.0001;
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', function() {
@@ -90,6 +98,9 @@ function createMappingCard(eventName, mapping) {
     
     if (type === 'keyboard') {
         details = `<div><strong>按键:</strong> ${mapping.key}</div>`;
+        if (mapping.turbo) {
+            details += `<div><strong>连发:</strong> ${mapping.turbo} Hz</div>`;
+        }
     } else if (type === 'keyboard_combo') {
         details = `<div><strong>组合键:</strong> ${mapping.combo.join(' + ')}</div>`;
     } else if (type === 'dpad_horizontal' || type === 'dpad_vertical') {
@@ -97,6 +108,10 @@ function createMappingCard(eventName, mapping) {
             <div><strong>正方向:</strong> ${mapping.positive_key}</div>
             <div><strong>负方向:</strong> ${mapping.negative_key}</div>
         `;
+    } else if (type === 'macro') {
+        details = `<div><strong>宏步骤:</strong> ${(mapping.steps || []).length} 步</div>`;
+    } else if (type === 'layer') {
+        details = `<div><strong>层:</strong> ${mapping.layer} (${mapping.mode === 'toggle' ? '切换' : '按住'})</div>`;
     }
     
     return `
@@ -123,7 +138,9 @@ function getTypeLabel(type) {
         'keyboard': '键盘',
         'keyboard_combo': '组合键',
         'dpad_horizontal': 'D-Pad 横向',
-        'dpad_vertical': 'D-Pad 纵向'
+        'dpad_vertical': 'D-Pad 纵向',
+        'layer': '层切换',
+        'macro': '宏'
     };
     return labels[type] || type;
 }
@@ -284,11 +301,17 @@ function editMapping(eventName) {
     // Fill in type-specific fields
     if (mapping.type === 'keyboard') {
         document.getElementById('editKey').value = mapping.key;
+        document.getElementById('editTurbo').value = mapping.turbo || '';
     } else if (mapping.type === 'keyboard_combo') {
         document.getElementById('editCombo').value = mapping.combo.join(', ');
     } else if (mapping.type === 'dpad_horizontal' || mapping.type === 'dpad_vertical') {
         document.getElementById('editPositiveKey').value = mapping.positive_key;
         document.getElementById('editNegativeKey').value = mapping.negative_key;
+    } else if (mapping.type === 'macro') {
+        document.getElementById('editMacroSteps').value = JSON.stringify(mapping.steps || [], null, 2);
+    } else if (mapping.type === 'layer') {
+        document.getElementById('editLayer').value = mapping.layer;
+        document.getElementById('editLayerMode').value = mapping.mode || 'hold';
     }
     
     document.getElementById('editDialog').style.display = 'block';
@@ -307,6 +330,10 @@ function updateEditForm() {
                 <label>按键:</label>
                 <input type="text" id="editKey" required placeholder="例如: SPACE, A, ENTER">
             </div>
+            <div class="form-group">
+                <label>连发频率 (Hz，留空关闭):</label>
+                <input type="number" id="editTurbo" min="1" max="50" placeholder="例如: 20">
+            </div>
         `;
     } else if (type === 'keyboard_combo') {
         html = `
@@ -326,6 +353,27 @@ function updateEditForm() {
                 <input type="text" id="editNegativeKey" required placeholder="例如: LEFT, UP">
             </div>
         `;
+    } else if (type === 'macro') {
+        html = `
+            <div class="form-group">
+                <label>宏步骤 (JSON):</label>
+                <textarea id="editMacroSteps" rows="6" required placeholder='[{"text": "gg"}, {"delay": 200}, {"key": "ENTER"}]'></textarea>
+            </div>
+        `;
+    } else if (type === 'layer') {
+        html = `
+            <div class="form-group">
+                <label>层名称:</label>
+                <input type="text" id="editLayer" required placeholder="例如: fn">
+            </div>
+            <div class="form-group">
+                <label>模式:</label>
+                <select id="editLayerMode">
+                    <option value="hold">按住</option>
+                    <option value="toggle">切换</option>
+                </select>
+            </div>
+        `;
     }
     
     fieldsContainer.innerHTML = html;
@@ -352,12 +400,34 @@ async function saveMapping(event) {
     // Add type-specific fields
     if (type === 'keyboard') {
         mapping.key = document.getElementById('editKey').value.toUpperCase();
+        const turbo = parseFloat(document.getElementById('editTurbo').value);
+        if (turbo > 0) {
+            mapping.turbo = turbo;
+        }
     } else if (type === 'keyboard_combo') {
         const combo = document.getElementById('editCombo').value;
         mapping.combo = combo.split(',').map(k => k.trim().toUpperCase());
     } else if (type === 'dpad_horizontal' || type === 'dpad_vertical') {
         mapping.positive_key = document.getElementById('editPositiveKey').value.toUpperCase();
         mapping.negative_key = document.getElementById('editNegativeKey').value.toUpperCase();
+    } else if (type === 'macro') {
+        try {
+            mapping.steps = JSON.parse(document.getElementById('editMacroSteps').value);
+        } catch (error) {
+            showAlert('宏步骤JSON格式错误', 'error');
+            return;
+        }
+        if (currentEditEvent && mappingsData[currentEditEvent]) {
+            // Keep timing options that the form does not edit
+            for (const option of ['tap_ms', 'gap_ms']) {
+                if (option in mappingsData[currentEditEvent]) {
+                    mapping[option] = mappingsData[currentEditEvent][option];
+                }
+            }
+        }
+    } else if (type === 'layer') {
+        mapping.layer = document.getElementById('editLayer').value.trim();
+        mapping.mode = document.getElementById('editLayerMode').value;
     }
     
     try {
@@ -694,6 +764,47 @@ async function connectBackendDevice() {
     }
 }
 
+async function calibrateBackendDevice() {
+    const devicePath = document.getElementById('backendDeviceSelect').value;
+    if (!devicePath) {
+        showAlert('请选择一个设备', 'error');
+        return;
+    }
+    if (!confirm('校准共 7 秒：前 2 秒请不要触碰手柄，之后 5 秒请把每个摇杆沿边缘转几圈、把扳机按到底。点击确定开始。')) {
+        return;
+    }
+    
+    const button = document.getElementById('calibrateButton');
+    button.disabled = true;
+    showAlert('请不要触碰手柄...', 'info');
+    const moveTimer = setTimeout(() => showAlert('请转动摇杆、按下扳机...', 'info'), 2000);
+    try {
+        const response = await fetch(`${API_BASE}/calibration`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({device_path: devicePath, rest: 2, move: 5})
+        });
+        const data = await response.json();
+        
+        if (response.ok && data.success) {
+            const axes = Object.entries(data.axes)
+                .map(([name, axis]) => `${name}: 中心 ${axis.center}, 死区 ${axis.deadzone}, 范围 ${axis.min}~${axis.max}`)
+                .join('\n');
+            showAlert(`已保存 ${data.name} 的校准 (${Object.keys(data.axes).length} 个轴)`, 'success');
+            alert(`${data.name} (${data.key})\n${axes}` +
+                  (data.unmoved.length ? `\n未移动、未校准: ${data.unmoved.join(', ')}` : ''));
+        } else {
+            showAlert(data.error || '校准失败', 'error');
+        }
+    } catch (error) {
+        console.error('Error calibrating device:', error);
+        showAlert('校准失败', 'error');
+    } finally {
+        clearTimeout(moveTimer);
+        button.disabled = false;
+    }
+}
+
 async function disconnectBackendDevice() {
     try {
         // Stop event stream
@@ -737,18 +848,132 @@ function updateBackendStatus(connected, deviceName = '') {
 }
 
 function startBackendEventStream() {
-    // Close existing connection
-    if (backendEventSource) {
-        backendEventSource.close();
+    // Prefer the compact binary WebSocket stream, fall back to SSE when
+    // the server does not offer it
+    if (window.WebSocket && !backendWebSocketUnavailable) {
+        startBackendWebSocket();
+    } else {
+        startBackendEventSource();
     }
+}
+
+function startBackendWebSocket() {
+    stopBackendEventStream();
+    
+    const params = new URLSearchParams(BACKEND_STREAM_OPTIONS);
+    const scheme = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const ws = new WebSocket(`${scheme}//${location.host}${API_BASE}/input/ws?${params}`);
+    ws.binaryType = 'arraybuffer';
     
-    // Create new EventSource for SSE
-    backendEventSource = new EventSource(`${API_BASE}/input/events`);
+    const decoder = {names: [], values: []};
+    let opened = false;
+    
+    ws.onopen = function() {
+        opened = true;
+        reconnectAttempts = 0;
+    };
+    
+    ws.onmessage = function(message) {
+        try {
+            if (typeof message.data === 'string') {
+                // Names of event ids used by the following frames
+                const names = JSON.parse(message.data).names;
+                for (const [id, name] of Object.entries(names)) {
+                    decoder.names[id] = name;
+                    decoder.values[id] = 0;
+                }
+                return;
+            }
+            const batch = decodeBinaryEvents(decoder, message.data);
+            if (batch.dropped) {
+                console.warn(`Event stream fell behind, ${batch.dropped} events dropped`);
+            }
+            addBackendEvents(batch.events);
+        } catch (error) {
+            console.error('Error decoding event data:', error);
+        }
+    };
+    
+    ws.onclose = function() {
+        if (backendWebSocket !== ws) {
+            return; // Closed on purpose
+        }
+        backendWebSocket = null;
+        if (!opened) {
+            // Server without WebSocket support
+            backendWebSocketUnavailable = true;
+            startBackendEventSource();
+        } else if (backendInputConnected && reconnectAttempts < MAX_RECONNECT_ATTEMPTS) {
+            const delay = RECONNECT_BASE_DELAY * Math.pow(2, reconnectAttempts);
+            reconnectAttempts++;
+            setTimeout(() => {
+                if (backendInputConnected && !backendWebSocket) {
+                    startBackendWebSocket();
+                }
+            }, delay);
+        }
+    };
+    
+    backendWebSocket = ws;
+}
+
+function decodeBinaryEvents(decoder, buffer) {
+    // Frame: u8 version, u16 dropped, f64 base timestamp, then per event
+    // varint id, zigzag varint value delta, varint time delta
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    if (view.getUint8(0) !== STREAM_FRAME_VERSION) {
+        throw new Error(`Unsupported stream frame version ${view.getUint8(0)}`);
+    }
+    const dropped = view.getUint16(1, true);
+    let timestamp = view.getFloat64(3, true);
+    let offset = STREAM_HEADER_SIZE;
+    
+    function readVarint() {
+        let result = 0;
+        let scale = 1;
+        let byte;
+        do {
+            byte = bytes[offset++];
+            result += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+        return result;
+    }
+    
+    const events = [];
+    while (offset < bytes.length) {
+        const id = readVarint();
+        const zigzag = readVarint();
+        const ticks = readVarint();
+        const delta = zigzag % 2 ? -(zigzag + 1) / 2 : zigzag / 2;
+        decoder.values[id] += delta;
+        timestamp += ticks * STREAM_TIME_UNIT;
+        events.push({
+            event_name: decoder.names[id],
+            value: decoder.values[id],
+            timestamp: timestamp
+        });
+    }
+    return {events, dropped};
+}
+
+function startBackendEventSource() {
+    // Close existing connection
+    stopBackendEventStream();
+    
+    // Create new EventSource for SSE; axes are downsampled on the server
+    // to what the event list can usefully show
+    const params = new URLSearchParams(BACKEND_STREAM_OPTIONS);
+    backendEventSource = new EventSource(`${API_BASE}/input/events?${params}`);
     
     backendEventSource.onmessage = function(event) {
         try {
-            const eventData = JSON.parse(event.data);
-            addBackendEvent(eventData);
+            const batch = JSON.parse(event.data);
+            if (batch.dropped) {
+                console.warn(`Event stream fell behind, ${batch.dropped} events dropped`);
+            }
+            addBackendEvents(batch.events);
             reconnectAttempts = 0; // Reset on successful message
         } catch (error) {
             console.error('Error parsing event data:', error);
@@ -766,8 +991,8 @@ function startBackendEventStream() {
             console.log(`Attempting to reconnect (${reconnectAttempts}/${MAX_RECONNECT_ATTEMPTS}) in ${delay}ms...`);
             
             setTimeout(() => {
-                if (backendInputConnected && backendEventSource.readyState === EventSource.CLOSED) {
-                    startBackendEventStream();
+                if (backendInputConnected && backendEventSource && backendEventSource.readyState === EventSource.CLOSED) {
+                    startBackendEventSource();
                 }
             }, delay);
         } else if (reconnectAttempts >= MAX_RECONNECT_ATTEMPTS) {
@@ -783,11 +1008,18 @@ function stopBackendEventStream() {
         backendEventSource.close();
         backendEventSource = null;
     }
+    if (backendWebSocket) {
+        const ws = backendWebSocket;
+        backendWebSocket = null;
+        ws.close();
+    }
 }
 
-function addBackendEvent(eventData) {
-    // Add to event log
-    backendEventLog.unshift(eventData);
+function addBackendEvents(events) {
+    // Add to event log, newest first
+    for (const eventData of events) {
+        backendEventLog.unshift(eventData);
+    }
     
     // Keep only recent events
     if (backendEventLog.length > MAX_BACKEND_EVENTS) {